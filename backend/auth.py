@@ -8,6 +8,7 @@ import secrets
 import logging
 
 from config import settings
+from timing import timed
 from exceptions import (
     InvalidCredentialsException,
     InactiveUserException,
@@ -80,6 +81,15 @@ class AuthService:
         if token in self.refresh_tokens:
             del self.refresh_tokens[token]
 
+    def decode_access_token(self, token: str) -> Optional[Dict]:
+        """Claims of a valid access token (signature and expiry only, no user lookup)"""
+        try:
+            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        except jwt.InvalidTokenError:
+            return None
+        return payload if payload.get("type") == "access" else None
+
+    @timed("auth")
     async def verify_token(self, token: str) -> Dict:
         """Verify JWT access token"""
         try:
@@ -231,13 +241,21 @@ class AuthService:
             }
         )
 
-    async def create_user(self, username: str, password: str, restaurant_slug: str, role: str = "admin", email: Optional[str] = None) -> str:
+    async def create_user(
+        self,
+        username: str,
+        password: str,
+        restaurant_slug: str,
+        role: str = "admin",
+        email: Optional[str] = None,
+        session=None
+    ) -> str:
         """Create new user account"""
         users_collection = get_collection("users")
         restaurants_collection = get_collection("restaurants")
         
         # Check if restaurant exists
-        restaurant = await restaurants_collection.find_one({"slug": restaurant_slug})
+        restaurant = await restaurants_collection.find_one({"slug": restaurant_slug}, session=session)
         if not restaurant:
             raise RestaurantNotFoundException()
             
@@ -245,29 +263,45 @@ class AuthService:
         existing_user = await users_collection.find_one({
             "username": username,
             "restaurant_slug": restaurant_slug
-        })
+        }, session=session)
         
         if existing_user:
             raise UserAlreadyExistsException()
             
         # Create user
+        user_data = self.user_document(
+            username, self.hash_password(password), restaurant["_id"], restaurant_slug, role, email
+        )
+        
+        result = await users_collection.insert_one(user_data, session=session)
+        logger.info(f"User created: {username}@{restaurant_slug}")
+        
+        return str(result.inserted_id)
+
+    def user_document(
+        self,
+        username: str,
+        password_hash: str,
+        restaurant_id,
+        restaurant_slug: str,
+        role: str = "admin",
+        email: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Build a user document from an already hashed password"""
+        now = datetime.utcnow()
         user_data = {
             "username": username,
-            "password_hash": self.hash_password(password),
+            "password_hash": password_hash,
             "role": role,
-            "restaurant_id": restaurant["_id"],
+            "restaurant_id": restaurant_id,
             "restaurant_slug": restaurant_slug,
             "is_active": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
         if email:
             user_data["email"] = email
-        
-        result = await users_collection.insert_one(user_data)
-        logger.info(f"User created: {username}@{restaurant_slug}")
-        
-        return str(result.inserted_id)
+        return user_data
 
     async def change_password(self, user_id: str, old_password: str, new_password: str) -> bool:
         """Change user password"""
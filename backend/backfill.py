@@ -0,0 +1,304 @@
+# backfill.py
+"""Resumable, throttled per-tenant data backfills.
+
+A backfill is a coroutine ``(runner, restaurant)`` that rewrites one tenant's
+documents through ``runner.rewrite``. The runner walks restaurants in ``_id``
+order with bounded concurrency, writes in ``bulk_write`` batches, pauses while
+secondaries lag behind, and checkpoints in ``_backfills`` the ``_id`` below
+which every tenant is done, so a rerun resumes from there. Backfills must be
+idempotent: tenants in flight when a run stopped are processed again.
+
+    python backfill.py restaurant_slug --dry-run
+    python backfill.py restaurant_slug --concurrency 16 --batch-size 1000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from config import settings
+from models import category_snapshot
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS_COLLECTION = "_backfills"
+
+class BackfillRunner:
+    def __init__(
+        self,
+        db,
+        name: str,
+        backfill: Callable[["BackfillRunner", dict], Awaitable[None]],
+        concurrency: int = settings.backfill_concurrency,
+        batch_size: int = settings.backfill_batch_size,
+        max_lag_seconds: float = settings.backfill_max_lag_seconds,
+        dry_run: bool = False,
+        admin_db=None
+    ):
+        self.db = db
+        self.name = name
+        self.backfill = backfill
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_lag_seconds = max_lag_seconds
+        self.dry_run = dry_run
+        self.admin_db = admin_db
+        self.checkpoints = db[CHECKPOINTS_COLLECTION]
+        self.stats = {"tenants": 0, "matched": 0, "modified": 0, "batches": 0, "throttled_seconds": 0.0}
+        self._lag_checked_at = 0.0
+        self._lag_unavailable_logged = False
+
+    # ===== Writes =====
+
+    async def rewrite(
+        self,
+        collection_name: str,
+        query: dict,
+        update: Union[dict, Callable[[dict], Optional[dict]]],
+        projection: Optional[dict] = None
+    ):
+        """Apply ``update`` (or ``update(doc)``) to every document matching ``query``, in batches"""
+        collection = self.db[collection_name]
+        if self.dry_run:
+            self.stats["matched"] += await collection.count_documents(query)
+            return
+
+        if not callable(update):
+            projection = {"_id": 1}
+        last_id = None
+        while True:
+            batch_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+            docs = await collection.find(batch_query, projection).sort("_id", 1) \
+                .limit(self.batch_size).to_list(length=self.batch_size)
+            if not docs:
+                return
+            last_id = docs[-1]["_id"]
+
+            operations = []
+            for doc in docs:
+                doc_update = update(doc) if callable(update) else update
+                if doc_update:
+                    # Re-check the query so documents changed since the read are left alone
+                    operations.append(UpdateOne({"$and": [query, {"_id": doc["_id"]}]}, doc_update))
+            if operations:
+                await self.throttle()
+                result = await collection.bulk_write(operations, ordered=False)
+                self.stats["matched"] += result.matched_count
+                self.stats["modified"] += result.modified_count
+                self.stats["batches"] += 1
+            if len(docs) < self.batch_size:
+                return
+
+    # ===== Throttling =====
+
+    async def replication_lag(self) -> float:
+        """Seconds the slowest secondary is behind the primary (0 without a replica set)"""
+        if self.admin_db is None:
+            return 0.0
+        try:
+            status = await self.admin_db.command("replSetGetStatus")
+        except (OperationFailure, NotImplementedError) as e:
+            # Standalone server or no clusterMonitor role: the throttle is off, say so once
+            if not self._lag_unavailable_logged:
+                logger.warning(f"Backfill {self.name} not throttled: replication lag unavailable ({e})")
+                self._lag_unavailable_logged = True
+            return 0.0
+        members = status.get("members", [])
+        primary = next((m["optimeDate"] for m in members if m.get("stateStr") == "PRIMARY"), None)
+        secondaries = [m["optimeDate"] for m in members if m.get("stateStr") == "SECONDARY"]
+        if not primary or not secondaries:
+            return 0.0
+        return max(0.0, (primary - min(secondaries)).total_seconds())
+
+    async def throttle(self):
+        """Wait while replication lag is above the limit (checked at most once a second)"""
+        if time.monotonic() - self._lag_checked_at < 1:
+            return
+        while True:
+            self._lag_checked_at = time.monotonic()
+            lag = await self.replication_lag()
+            if lag <= self.max_lag_seconds:
+                return
+            logger.warning(f"Backfill {self.name} paused: replication lag {lag:.1f}s")
+            await asyncio.sleep(1)
+            self.stats["throttled_seconds"] += 1
+
+    # ===== Tenants =====
+
+    async def run(self) -> Dict:
+        checkpoint = await self.checkpoints.find_one({"_id": self.name}) or {}
+        if checkpoint.get("status") == "completed" and not self.dry_run:
+            logger.info(f"Backfill {self.name} already completed")
+            return {**self.stats, "status": "completed"}
+
+        query = {}
+        if checkpoint.get("after"):
+            query = {"_id": {"$gt": checkpoint["after"]}}
+            logger.info(f"Backfill {self.name} resuming after tenant {checkpoint['after']}")
+        total = await self.db.restaurants.count_documents(query)
+
+        started = time.monotonic()
+        in_flight: Dict = {}  # tenant _id -> done flag, in dispatch (_id) order
+        semaphore = asyncio.Semaphore(self.concurrency)
+        failures = []
+
+        async def process(restaurant: dict):
+            try:
+                await self.backfill(self, restaurant)
+                in_flight[restaurant["_id"]] = True
+                self.stats["tenants"] += 1
+                await self._advance_checkpoint(in_flight)
+            except Exception as e:
+                logger.error(f"Backfill {self.name} failed for {restaurant.get('slug')}: {e}")
+                failures.append(restaurant["_id"])
+            finally:
+                semaphore.release()
+
+            if self.stats["tenants"] % 100 == 0 or self.stats["tenants"] == total:
+                logger.info(
+                    f"Backfill {self.name}: {self.stats['tenants']}/{total} tenants, "
+                    f"{self.stats['modified']} documents, {time.monotonic() - started:.0f}s"
+                )
+
+        tasks = []
+        cursor = self.db.restaurants.find(query, {"_id": 1, "slug": 1}).sort("_id", 1)
+        async for restaurant in cursor:
+            if failures:
+                break
+            await semaphore.acquire()
+            in_flight[restaurant["_id"]] = False
+            tasks.append(asyncio.create_task(process(restaurant)))
+        await asyncio.gather(*tasks)
+
+        status = "failed" if failures else "completed"
+        if not self.dry_run:
+            await self.checkpoints.update_one(
+                {"_id": self.name},
+                {"$set": {"status": status, "updated_at": datetime.utcnow(), "stats": self.stats}},
+                upsert=True
+            )
+        return {**self.stats, "status": status, "dry_run": self.dry_run}
+
+    async def _advance_checkpoint(self, in_flight: Dict):
+        """Move the checkpoint past the longest prefix of finished tenants"""
+        after = None
+        while in_flight:
+            tenant_id = next(iter(in_flight))
+            if not in_flight[tenant_id]:
+                break
+            after = tenant_id
+            del in_flight[tenant_id]
+        if after is None or self.dry_run:
+            return
+        # Concurrent tenants finish out of order; $max keeps the checkpoint from moving back
+        await self.checkpoints.update_one(
+            {"_id": self.name},
+            {
+                "$max": {"after": after},
+                "$set": {"status": "running", "updated_at": datetime.utcnow()},
+                "$setOnInsert": {"started_at": datetime.utcnow()}
+            },
+            upsert=True
+        )
+
+# ===== Backfills =====
+
+async def backfill_restaurant_slug(runner: BackfillRunner, restaurant: dict):
+    """Add restaurant_slug to documents created before multi-tenancy"""
+    for collection_name in ("products", "orders", "categories"):
+        await runner.rewrite(
+            collection_name,
+            {"restaurant_id": restaurant["_id"], "restaurant_slug": {"$exists": False}},
+            {"$set": {"restaurant_slug": restaurant["slug"]}}
+        )
+
+async def backfill_category_snapshot(runner: BackfillRunner, restaurant: dict):
+    """Set category keys and copy each category's snapshot onto its products"""
+    categories = await runner.db.categories.find(
+        {"restaurant_slug": restaurant["slug"]}, {"name": 1, "display_order": 1}
+    ).to_list(length=None)
+    for category in categories:
+        snapshot = category_snapshot(category)
+        await runner.rewrite(
+            "categories",
+            {"_id": category["_id"], "key": {"$ne": snapshot["category_key"]}},
+            {"$set": {"key": snapshot["category_key"]}}
+        )
+        await runner.rewrite(
+            "products",
+            {
+                "category_id": category["_id"],
+                "$or": [{field: {"$ne": value}} for field, value in snapshot.items()]
+            },
+            {"$set": snapshot}
+        )
+
+async def backfill_order_rollups(runner: BackfillRunner, restaurant: dict):
+    """Rebuild the order rollups from the orders placed before they existed, a month at a time"""
+    from services import OrderRollupService, get_local_bucket
+    from models import RestaurantSettings
+
+    query = {"restaurant_slug": restaurant["slug"]}
+    if runner.dry_run:
+        runner.stats["matched"] += await runner.db.orders.count_documents(query)
+        return
+    oldest = await runner.db.orders.find(query, {"created_at": 1}).sort("created_at", 1).limit(1).to_list(length=1)
+    if not oldest:
+        return
+    doc = await runner.db.restaurants.find_one({"_id": restaurant["_id"]}, {"settings.timezone": 1}) or {}
+    timezone = doc.get("settings", {}).get("timezone") or RestaurantSettings.model_fields["timezone"].default
+
+    # One transaction per local month keeps each rebuild small; mid-month UTC
+    # moments fall in the same local month whatever the timezone
+    rollups = OrderRollupService()
+    year, month = map(int, get_local_bucket(oldest[0]["created_at"], timezone)["date"][:7].split("-"))
+    last_month = get_local_bucket(datetime.utcnow(), timezone)["date"][:7]
+    while f"{year}-{month:02d}" <= last_month:
+        moment = datetime(year, month, 15)
+        await runner.throttle()
+        runner.stats["modified"] += await rollups.rebuild(restaurant["slug"], moment, moment, timezone)
+        runner.stats["batches"] += 1
+        year, month = year + month // 12, month % 12 + 1
+
+BACKFILLS = {
+    "restaurant_slug": backfill_restaurant_slug,
+    "category_snapshot": backfill_category_snapshot,
+    "order_rollups": backfill_order_rollups,
+}
+
+async def run_backfill(db, name: str, dry_run: bool = False, **options) -> Dict:
+    from database import database
+    admin_db = database.client.admin if database.client else None
+    runner = BackfillRunner(db, name, BACKFILLS[name], dry_run=dry_run, admin_db=admin_db, **options)
+    return await runner.run()
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a per-tenant data backfill")
+    parser.add_argument("name", choices=sorted(BACKFILLS))
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=settings.backfill_concurrency)
+    parser.add_argument("--batch-size", type=int, default=settings.backfill_batch_size)
+    parser.add_argument("--max-lag", type=float, default=settings.backfill_max_lag_seconds)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from database import init_db, close_db, database
+    await init_db()
+    try:
+        report = await run_backfill(
+            database.database, args.name, dry_run=args.dry_run,
+            concurrency=args.concurrency, batch_size=args.batch_size, max_lag_seconds=args.max_lag
+        )
+        print(json.dumps(report, indent=2, default=str))
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+# benchmark.py
+"""In-process load test of the public API.
+
+Requests go straight to the ASGI app (no HTTP server, no network), and by
+default storage is the embedded in-memory backend, so the numbers isolate
+application, serialization and storage-access costs. Point it at MongoDB to
+compare backends:
+
+    python benchmark.py --products 500 --requests 2000 --concurrency 50
+    STORAGE_BACKEND=mongo MONGODB_URL=mongodb://localhost:27017 python benchmark.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+
+import httpx
+import msgpack
+
+from main import app
+from models import CategoryCreate, OrderItem, ProductCreate, RestaurantCreate
+from services import CategoryService, ProductService, RestaurantService
+
+SLUG = "bench-pizza"
+
+async def seed(products: int, categories: int = 8) -> list:
+    """Create a restaurant with its catalog; returns product ids"""
+    restaurant_service = RestaurantService()
+    if not await restaurant_service.get_by_slug(SLUG):
+        await restaurant_service.create_restaurant(RestaurantCreate(
+            name="Bench Pizza", slug=SLUG, email="bench@example.com", phone="123",
+            address="Calle 1", admin_username="bench", admin_password="bench-password"
+        ))
+
+    category_ids = []
+    for index in range(categories):
+        category = await CategoryService().create_category(
+            SLUG, CategoryCreate(name=f"Categoria {index}", display_order=index)
+        )
+        category_ids.append(category.id)
+
+    product_ids = []
+    product_service = ProductService()
+    for index in range(products):
+        product = await product_service.create_product(SLUG, ProductCreate(
+            name=f"Producto {index}",
+            description="Descripción de prueba " * 4,
+            price=1000 + index,
+            category_id=category_ids[index % categories],
+            is_popular=index % 10 == 0
+        ))
+        product_ids.append(product.id)
+    return product_ids
+
+MSGPACK_HEADERS = {"Accept": "application/msgpack"}
+
+def order_body(product_id: str) -> dict:
+    item = OrderItem(product_id=product_id, product_name="Producto", quantity=2, unit_price=1000, total_price=2000)
+    return {
+        "customer": {"name": "Cliente", "phone": "3510000000", "address": "Calle 2"},
+        "items": [item.model_dump()],
+        "payment_method": "cash"
+    }
+
+async def run_scenario(client: httpx.AsyncClient, name: str, make_request, total: int, concurrency: int):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for index in remaining:
+            started = time.perf_counter()
+            response = await make_request(client, index)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<24} {total / elapsed:>9.1f} req/s  p50 {statistics.median(latencies) * 1000:>7.2f}ms  "
+        f"p95 {p95 * 1000:>7.2f}ms  p99 {p99 * 1000:>7.2f}ms  errors {errors}"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description="In-process API benchmark")
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    async with app.router.lifespan_context(app):
+        product_ids = await seed(args.products)
+        print(f"backend={os.environ['STORAGE_BACKEND']} products={args.products} "
+              f"requests={args.requests} concurrency={args.concurrency}")
+
+        scenarios = {
+            "menu": lambda client, i: client.get(f"/api/{SLUG}/menu"),
+            "menu (msgpack)": lambda client, i: client.get(f"/api/{SLUG}/menu", headers=MSGPACK_HEADERS),
+            "categories": lambda client, i: client.get(f"/api/{SLUG}/categories"),
+            "restaurant": lambda client, i: client.get(f"/api/restaurants/{SLUG}"),
+            "product": lambda client, i: client.get(f"/api/{SLUG}/products/{product_ids[i % len(product_ids)]}"),
+            "create order": lambda client, i: client.post(
+                f"/api/{SLUG}/orders", json=order_body(product_ids[i % len(product_ids)])
+            ),
+            "create order (msgpack)": lambda client, i: client.post(
+                f"/api/{SLUG}/orders",
+                content=msgpack.packb(order_body(product_ids[i % len(product_ids)])),
+                headers={**MSGPACK_HEADERS, "Content-Type": "application/msgpack"}
+            ),
+        }
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            for name, make_request in scenarios.items():
+                await run_scenario(client, name, make_request, args.requests, args.concurrency)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,336 @@
+# cache.py
+"""Per-process caches kept coherent across workers by an invalidation bus.
+
+Each worker keeps its own ``LocalCache`` instances. ``InvalidationBus`` tails a
+MongoDB change stream on the watched collections (so writes made by any worker
+or container reach every worker) and dispatches ``InvalidationEvent`` objects
+to the handlers registered per collection. The resume token is kept in memory:
+after a dropped connection the stream resumes where it stopped, and if history
+was lost every cache is reset. A restarted worker starts with empty caches, so
+tokens are not persisted.
+
+Without change streams (standalone mongod, memory backend) the bus polls
+``updated_at`` instead (indexed on every watched collection, see
+migrations.INDEXES); that mode does not see hard deletes.
+
+``SingleFlight`` collapses concurrent identical reads into one database call
+(``coalesced`` applies it to catalog reads of the services).
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ("products", "categories", "restaurants", "users")
+
+# Server error codes meaning "change streams are not available here"
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324, 20}
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# Polling re-reads this far back to tolerate clock skew between app servers
+POLL_OVERLAP_SECONDS = 5
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    collection: str
+    operation: str  # insert, update, replace, delete, or reset (drop everything)
+    document_id: Any = None
+    restaurant_slug: Optional[str] = None
+
+class LocalCache:
+    """TTL + LRU cache with tag-based invalidation (one event loop, no locking)"""
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int = 10000):
+        self.name = name
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, tuple]]" = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        self._tag_versions: Dict[Hashable, int] = {}
+        self._clears = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether a live entry exists (not counted as a hit or miss)"""
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def version(self, tags: Iterable[Hashable] = ()) -> tuple:
+        """Token that changes whenever any of ``tags`` is invalidated (or the cache cleared)"""
+        return (self._clears, *(self._tag_versions.get(tag, 0) for tag in tags))
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), version: Optional[tuple] = None):
+        """Store ``value``; with the ``version`` taken before loading it, skip it if invalidated since"""
+        tags = tuple(tags)
+        if version is not None and version != self.version(tags):
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, key: Hashable):
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_tag(self, tag: Hashable):
+        self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+        for key in list(self._tags.get(tag, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        self._clears += 1
+        self._tag_versions.clear()
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+def tenant_invalidator(cache: LocalCache) -> Callable[[InvalidationEvent], None]:
+    """Handler dropping a tenant's entries (tagged ("restaurant", slug)), or everything if unknown"""
+    def handle(event: InvalidationEvent):
+        if event.operation == "reset" or not event.restaurant_slug:
+            cache.clear()
+        else:
+            cache.invalidate_tag(("restaurant", event.restaurant_slug))
+    return handle
+
+def _event_slug(collection: str, document: Optional[dict]) -> Optional[str]:
+    if not document:
+        return None
+    if collection == "restaurants":
+        return document.get("slug")
+    return document.get("restaurant_slug")
+
+class InvalidationBus:
+    def __init__(self, db, poll_interval: float = settings.cache_poll_interval_seconds):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, List[Callable[[InvalidationEvent], None]]] = {}
+        self.mode = "idle"
+        self.resume_token = None
+        self.events = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def subscribe(self, collection: str, handler: Callable[[InvalidationEvent], None]):
+        if collection not in WATCHED_COLLECTIONS:
+            raise ValueError(f"{collection} is not watched by the invalidation bus")
+        self.handlers.setdefault(collection, []).append(handler)
+
+    def dispatch(self, event: InvalidationEvent):
+        self.events += 1
+        for handler in self.handlers.get(event.collection, []):
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Cache invalidation handler failed for {event}: {e}")
+
+    def reset(self):
+        """Drop everything: events may have been missed"""
+        for collection in self.handlers:
+            self.dispatch(InvalidationEvent(collection, "reset"))
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while not self._stopping:
+            try:
+                await self.watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams unavailable, polling for cache invalidation")
+                    await self.poll()
+                    return
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Change stream history lost, resetting caches")
+                    self.resume_token = None
+                    self.reset()
+                else:
+                    logger.error(f"Invalidation change stream failed: {e}")
+                    await asyncio.sleep(1)
+            except PyMongoError as e:
+                logger.error(f"Invalidation change stream interrupted: {e}")
+                await asyncio.sleep(1)
+
+    async def watch(self):
+        pipeline = [
+            {"$match": {
+                "ns.coll": {"$in": list(self.handlers)},
+                "operationType": {"$in": ["insert", "update", "replace", "delete", "drop", "rename", "invalidate"]}
+            }},
+            # Only the fields needed to route the event
+            {"$project": {
+                "operationType": 1, "ns": 1, "documentKey": 1,
+                "fullDocument.slug": 1, "fullDocument.restaurant_slug": 1
+            }},
+        ]
+        async with self.db.watch(pipeline, full_document="updateLookup", resume_after=self.resume_token) as stream:
+            if self.mode != "watch":
+                if self.mode != "idle":
+                    self.reset()
+                self.mode = "watch"
+            async for change in stream:
+                self.resume_token = stream.resume_token
+                collection = change["ns"].get("coll")
+                operation = change["operationType"]
+                if operation in ("drop", "rename", "invalidate"):
+                    self.reset()
+                    continue
+                self.dispatch(InvalidationEvent(
+                    collection,
+                    operation,
+                    change.get("documentKey", {}).get("_id"),
+                    _event_slug(collection, change.get("fullDocument"))
+                ))
+
+    async def poll(self):
+        """Fallback: dispatch updates for documents whose updated_at moved"""
+        self.mode = "poll"
+        since = datetime.utcnow()
+        seen: Dict[tuple, datetime] = {}
+        while not self._stopping:
+            await asyncio.sleep(self.poll_interval)
+            round_started = datetime.utcnow()
+            window_start = since - timedelta(seconds=POLL_OVERLAP_SECONDS)
+            for collection in list(self.handlers):
+                try:
+                    cursor = self.db[collection].find(
+                        {"updated_at": {"$gt": window_start}},
+                        {"_id": 1, "updated_at": 1, "slug": 1, "restaurant_slug": 1}
+                    )
+                    async for doc in cursor:
+                        key = (collection, doc["_id"])
+                        if seen.get(key) == doc["updated_at"]:
+                            continue
+                        seen[key] = doc["updated_at"]
+                        self.dispatch(InvalidationEvent(collection, "update", doc["_id"], _event_slug(collection, doc)))
+                except PyMongoError as e:
+                    logger.error(f"Invalidation polling failed for {collection}: {e}")
+            since = round_started
+            cutoff = since - timedelta(seconds=POLL_OVERLAP_SECONDS)
+            seen = {key: updated_at for key, updated_at in seen.items() if updated_at > cutoff}
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight call and its result.
+
+    The call runs in its own task, so a caller that goes away (client
+    disconnect) does not cancel it for the others. Results are shared objects:
+    callers must not mutate them.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._done, key))
+            self.calls += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved even if every caller went away
+
+    def stats(self) -> Dict:
+        return {"name": self.name, "in_flight": len(self._calls), "calls": self.calls, "shared": self.shared}
+
+def coalesced(flight: SingleFlight):
+    """Share concurrent identical ``read_policy="catalog"`` calls of a service method.
+
+    The key is the method and its arguments (``self`` excluded). Primary reads
+    are not shared: joining a read that started before the caller's own write
+    would hide that write, while catalog reads already accept bounded staleness.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if bound.arguments.get("read_policy") != "catalog":
+                return await method(*args, **kwargs)
+            key = (method.__qualname__, *list(bound.arguments.values())[1:])
+            return await flight.do(key, lambda: method(*args, **kwargs))
+        return wrapper
+    return decorator
+
+# Process-wide caches
+tenant_cache = LocalCache("tenants", settings.tenant_cache_ttl_seconds)
+response_cache = LocalCache("responses", settings.response_cache_ttl_seconds, settings.response_cache_max_entries)
+catalog_flight = SingleFlight("catalog")
@@ -0,0 +1,135 @@
+# compression.py
+"""gzip and brotli content encoding.
+
+Cacheable responses keep their raw bytes in a ``CompressedBody`` together with
+one compressed variant per encoding, so each version of a menu or restaurant
+document is compressed once: the first request gets a fast compression, and
+a background thread replaces it with the best-ratio one for every later
+request. ``CompressionMiddleware`` compresses the other responses on the fly,
+only when they are large enough for it to pay off.
+"""
+import asyncio
+import gzip
+import logging
+from typing import Dict, Optional, Set
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from config import settings
+from timing import span
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ("br", "gzip")  # In order of preference
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "text/")
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Preferred encoding the client accepts (q > 0), if any"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[coding.lower()] = q
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compress fast (responses on the fly) or for the best ratio (cached bodies)"""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else settings.compression_brotli_quality)
+    return gzip.compress(body, compresslevel=9 if best else settings.compression_gzip_level)
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    return bool(media_type) and media_type.startswith(COMPRESSIBLE_TYPES)
+
+# Keeps background recompressions referenced until they finish
+_recompressions: Set[asyncio.Task] = set()
+
+class CompressedBody:
+    """Raw bytes of a cacheable response and their compressed variants"""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.media_type = media_type
+        self.variants: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        variant = self.variants.get(encoding)
+        if variant is None:
+            with span("compress"):
+                variant = self.variants[encoding] = compress(self.body, encoding)
+            task = asyncio.get_running_loop().create_task(self._recompress(encoding))
+            _recompressions.add(task)
+            task.add_done_callback(_recompressions.discard)
+        return variant
+
+    async def _recompress(self, encoding: str):
+        try:
+            self.variants[encoding] = await asyncio.to_thread(compress, self.body, encoding, True)
+        except Exception as e:
+            logger.error(f"Error recompressing cached body: {e}")
+
+    def response(self, accept_encoding: Optional[str]) -> Response:
+        headers = {"vary": "Accept, Accept-Encoding"}
+        encoding = None
+        if len(self.body) >= settings.compression_min_size:
+            encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return Response(self.body, headers=headers, media_type=self.media_type)
+        headers["content-encoding"] = encoding
+        return Response(self.encoded(encoding), headers=headers, media_type=self.media_type)
+
+class CompressionMiddleware:
+    """Compress single-message responses above ``minimum_size`` (streams pass through)"""
+
+    def __init__(self, app, minimum_size: int = settings.compression_min_size):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                return await send(message)
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if is_compressible(headers.get("content-type")):
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+                if (
+                    not message.get("more_body", False)
+                    and "content-encoding" not in headers
+                    and len(body) >= self.minimum_size
+                ):
+                    with span("compress"):
+                        body = compress(body, encoding)
+                    headers["content-encoding"] = encoding
+                    headers["content-length"] = str(len(body))
+                    message = {**message, "body": body}
+            await send({**start, "headers": headers.raw})
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
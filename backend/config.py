@@ -1,9 +1,39 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 
 class Settings(BaseSettings):
     # Database
     mongodb_url: str
     database_name: str = "food_delivery_multi"
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_max_idle_time_ms: Optional[int] = 300000
+    mongo_wait_queue_timeout_ms: Optional[int] = 2000
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_compressors: str = "zlib"  # "zstd,snappy,zlib" si están instalados zstandard/python-snappy
+    mongo_slow_query_ms: float = 100.0
+    catalog_max_staleness_seconds: int = 90  # Mínimo permitido por MongoDB
+    mongo_auto_migrate: bool = False  # Aplicar migraciones al iniciar (solo desarrollo)
+    backfill_concurrency: int = 8  # Restaurantes procesados en paralelo por los backfills
+    backfill_batch_size: int = 500
+    backfill_max_lag_seconds: float = 10.0  # Pausar si los secundarios se atrasan más que esto
+    provisioning_concurrency: int = 16  # Restaurantes creados en paralelo en altas masivas
+    tenant_cache_ttl_seconds: int = 300  # Invalidado por change streams; el TTL es solo una red de seguridad
+    cache_poll_interval_seconds: float = 2.0  # Sin change streams (mongod standalone)
+    response_cache_ttl_seconds: int = 300  # Menús y restaurantes ya serializados y comprimidos
+    response_cache_max_entries: int = 500
+    compression_min_size: int = 1024  # Respuestas más chicas se envían sin comprimir
+    compression_gzip_level: int = 6  # Compresión al vuelo; los cuerpos cacheados usan el máximo
+    compression_brotli_quality: int = 4
+    metrics_max_tenants: int = 50  # Restaurantes con series propias en /metrics; el resto va a "_other"
+    metrics_loop_lag_interval_seconds: float = 0.5
+    metrics_token: Optional[str] = None  # Si se define, /metrics exige "Authorization: Bearer <token>"
+    health_check_timeout_seconds: float = 2.0
+    server_timing_enabled: bool = False  # Server-Timing en todas las respuestas (si no, solo superadmin con X-Server-Timing: 1)
+    profiling_max_per_window: int = 5  # Perfiles (X-Profile: 1) permitidos por ventana, entre todos los workers
+    profiling_window_seconds: int = 60
+    platform_timezone: str = "America/Argentina/Cordoba"  # Día y mes por defecto de las analíticas de plataforma
+    storage_backend: str = "mongo"  # "mongo" o "memory" (embebido, para benchmarks y desarrollo local)
 
     # JWT
     jwt_secret_key: str
@@ -13,6 +43,21 @@ class Settings(BaseSettings):
     # CORS
     cors_origins: list[str] = ["http://localhost:3000", "https://cordoeats.com", "https://www.cordoeats.com"]
 
+    # Web Push (VAPID)
+    vapid_private_key: Optional[str] = None
+    vapid_subject: str = "mailto:info@cordoeats.com"
+    push_concurrency: int = 100
+    push_batch_size: int = 500
+    push_ttl_seconds: int = 86400
+    push_host_rate_per_second: float = 200.0
+
+    # Notification outbox
+    outbox_max_attempts: int = 8
+    outbox_base_delay_seconds: float = 2.0
+    outbox_max_delay_seconds: float = 600.0
+    outbox_lease_seconds: int = 60
+    outbox_poll_interval_seconds: float = 1.0
+
     class Config:
         env_file = ".env"
 
@@ -3,6 +3,9 @@ import os
 from motor.motor_asyncio import AsyncIOMotorClient
 from typing import Optional
 import logging
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from config import settings
+from monitoring import pool_metrics, command_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -26,12 +29,26 @@ async def init_db():
         
         database_name = os.getenv("DATABASE_NAME", "food_delivery_multi")
         
+        if settings.storage_backend == "memory":
+            # Embedded backend: no server, nothing to ping; indexes still enforce uniqueness
+            from memory_store import MemoryClient
+            from migrations import migrate
+            database.client = MemoryClient()
+            database.database = database.client[database_name]
+            await migrate(database.database)
+            logger.info(f"Using in-memory storage backend: {database_name}")
+            return
+        
         # Create client
         database.client = AsyncIOMotorClient(
             mongodb_url,
-            maxPoolSize=10,
-            minPoolSize=10,
-            serverSelectionTimeoutMS=5000,
+            maxPoolSize=settings.mongo_max_pool_size,
+            minPoolSize=settings.mongo_min_pool_size,
+            maxIdleTimeMS=settings.mongo_max_idle_time_ms,
+            waitQueueTimeoutMS=settings.mongo_wait_queue_timeout_ms,
+            serverSelectionTimeoutMS=settings.mongo_server_selection_timeout_ms,
+            compressors=settings.mongo_compressors,
+            event_listeners=[pool_metrics, command_metrics],
         )
         
         # Get database
@@ -41,61 +58,35 @@ async def init_db():
         await database.client.admin.command('ping')
         logger.info(f"Successfully connected to MongoDB: {database_name}")
         
-        # Create indexes
-        await create_indexes()
+        # Indexes and schema changes are applied by migrations.py, not on every boot
+        if settings.mongo_auto_migrate:
+            from migrations import migrate
+            await migrate(database.database)
         
     except Exception as e:
         logger.error(f"Error connecting to MongoDB: {e}")
         raise
 
-async def create_indexes():
-    """Create database indexes for better performance"""
-    db = database.database
-    
-    try:
-        # Restaurant indexes
-        await db.restaurants.create_index("slug", unique=True)
-        await db.restaurants.create_index("email", unique=True)
-        await db.restaurants.create_index([("is_active", 1), ("created_at", -1)])
-        
-        # User indexes
-        await db.users.create_index("username")
-        await db.users.create_index("restaurant_slug")
-        await db.users.create_index([("username", 1), ("restaurant_slug", 1)], unique=True)
-        
-        # Product indexes
-        await db.products.create_index("restaurant_slug")
-        await db.products.create_index("category_id")
-        await db.products.create_index([("restaurant_slug", 1), ("is_available", 1)])
-        await db.products.create_index([("restaurant_slug", 1), ("is_popular", 1)])
-        await db.products.create_index("name", background=True)  # Text search
-        
-        # Order indexes
-        await db.orders.create_index("restaurant_slug")
-        await db.orders.create_index("order_number", unique=True)
-        await db.orders.create_index([("restaurant_slug", 1), ("status", 1)])
-        await db.orders.create_index([("restaurant_slug", 1), ("created_at", -1)])
-        await db.orders.create_index("customer.phone")
-        
-        # Category indexes
-        await db.categories.create_index("restaurant_slug")
-        await db.categories.create_index([("restaurant_slug", 1), ("display_order", 1)])
-        
-        logger.info("Database indexes created successfully")
-        
-    except Exception as e:
-        logger.error(f"Error creating indexes: {e}")
-
 async def close_db():
     """Close database connection"""
     if database.client:
         database.client.close()
         logger.info("Database connection closed")
 
+# Read preference policies per kind of operation
+READ_POLICIES = {
+    # Orders, auth and anything read right after a write
+    "primary": Primary(),
+    # Public catalog (menu, categories, restaurant, delivery zones) tolerates replication lag
+    "catalog": SecondaryPreferred(max_staleness=settings.catalog_max_staleness_seconds),
+}
+
 # Collections helper
-def get_collection(collection_name: str):
-    """Get collection by name"""
-    return database.database[collection_name]
+def get_collection(collection_name: str, read_policy: str = "primary"):
+    """Get collection by name with the read preference of the given policy"""
+    if read_policy == "primary":
+        return database.database[collection_name]
+    return database.database.get_collection(collection_name, read_preference=READ_POLICIES[read_policy])
 
 # Multi-tenant helpers
 def get_restaurant_filter(restaurant_slug: str) -> dict:
@@ -118,23 +109,14 @@ def get_restaurant_pipeline(restaurant_slug: str) -> list:
     ]
 
 def get_products_with_category_pipeline(restaurant_slug: str) -> list:
-    """Get products with category information"""
+    """Get products ordered by category (uses the category snapshot on each product, no $lookup)"""
     return [
         {"$match": {"restaurant_slug": restaurant_slug, "is_available": True}},
-        {
-            "$lookup": {
-                "from": "categories",
-                "localField": "category_id",
-                "foreignField": "_id",
-                "as": "category"
-            }
-        },
-        {"$unwind": "$category"},
-        {"$sort": {"category.display_order": 1, "name": 1}}
+        {"$sort": {"category_display_order": 1, "name": 1}}
     ]
 
-def get_orders_analytics_pipeline(restaurant_slug: str, start_date, end_date) -> list:
-    """Get orders analytics pipeline"""
+def get_orders_analytics_pipeline(restaurant_slug: str, start_date, end_date, timezone: str = "UTC") -> list:
+    """Get orders analytics pipeline bucketed by the restaurant's local hour"""
     return [
         {
             "$match": {
@@ -149,8 +131,8 @@ def get_orders_analytics_pipeline(restaurant_slug: str, start_date, end_date) ->
         {
             "$group": {
                 "_id": {
-                    "hour": {"$hour": "$created_at"},
-                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+                    "hour": {"$hour": {"date": "$created_at", "timezone": timezone}},
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": timezone}}
                 },
                 "count": {"$sum": 1},
                 "revenue": {"$sum": "$total"}
@@ -159,42 +141,6 @@ def get_orders_analytics_pipeline(restaurant_slug: str, start_date, end_date) ->
         {"$sort": {"_id.date": 1, "_id.hour": 1}}
     ]
 
-# Migration helpers
-async def migrate_data():
-    """Run data migrations if needed"""
-    db = database.database
-    
-    # Example: Add restaurant_slug to existing documents
-    # This would run only once during deployment
-    
-    try:
-        # Check if migration is needed
-        restaurants = await db.restaurants.find({}).to_list(length=None)
-        
-        for restaurant in restaurants:
-            # Update products without restaurant_slug
-            await db.products.update_many(
-                {"restaurant_id": restaurant["_id"], "restaurant_slug": {"$exists": False}},
-                {"$set": {"restaurant_slug": restaurant["slug"]}}
-            )
-            
-            # Update orders without restaurant_slug
-            await db.orders.update_many(
-                {"restaurant_id": restaurant["_id"], "restaurant_slug": {"$exists": False}},
-                {"$set": {"restaurant_slug": restaurant["slug"]}}
-            )
-            
-            # Update categories without restaurant_slug
-            await db.categories.update_many(
-                {"restaurant_id": restaurant["_id"], "restaurant_slug": {"$exists": False}},
-                {"$set": {"restaurant_slug": restaurant["slug"]}}
-            )
-        
-        logger.info("Data migration completed successfully")
-        
-    except Exception as e:
-        logger.error(f"Error during data migration: {e}")
-
 # Utility functions for ObjectId handling
 from bson import ObjectId
 from typing import Union
@@ -210,15 +156,23 @@ def to_string_id(id_value: Union[str, ObjectId]) -> str:
     return str(id_value)
 
 # Transaction helpers
-from motor.motor_asyncio import AsyncIOMotorClientSession
+import asyncio
+import random
+from pymongo.errors import PyMongoError
+
+async def with_transaction(operation, max_attempts: int = 5):
+    """Execute operation within a transaction, retrying transient errors.
 
-async def with_transaction(operation):
-    """Execute operation within a transaction"""
+    The operation may run more than once, so it must not depend on state
+    left behind by an aborted attempt.
+    """
     async with await database.client.start_session() as session:
-        async with session.start_transaction():
+        for attempt in range(1, max_attempts + 1):
             try:
-                result = await operation(session)
-                return result
-            except Exception as e:
-                await session.abort_transaction()
-                raise e
\ No newline at end of file
+                async with session.start_transaction():
+                    return await operation(session)
+            except PyMongoError as e:
+                if attempt == max_attempts or not e.has_error_label("TransientTransactionError"):
+                    raise
+                logger.warning(f"Retrying transaction after transient error (attempt {attempt}): {e}")
+                await asyncio.sleep(random.uniform(0, 0.05 * 2 ** attempt))
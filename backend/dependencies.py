@@ -1,5 +1,6 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Optional
 
 security = HTTPBearer()
 
@@ -12,3 +13,13 @@ async def get_current_user(request: Request, credentials: HTTPAuthorizationCrede
             detail="Invalid token"
         )
     return user
+
+def superadmin_claims(request: Request) -> Optional[dict]:
+    """Token claims if the request carries a superadmin bearer token (no user lookup)"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    claims = request.app.state.auth_service.decode_access_token(token)
+    if not claims or claims.get("role") != "superadmin":
+        return None
+    return claims
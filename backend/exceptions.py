@@ -1,3 +1,4 @@
+from typing import Optional
 from fastapi import HTTPException, status
 
 class InvalidCredentialsException(HTTPException):
@@ -52,9 +53,31 @@ class UserAlreadyExistsException(HTTPException):
             detail="El usuario ya existe para este restaurante",
         )
 
+class RestaurantAlreadyExistsException(HTTPException):
+    def __init__(self, field: Optional[str] = None):
+        self.field = field
+        super().__init__(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Ya existe un restaurante con ese {field}" if field else "Ya existe un restaurante con ese slug o email",
+        )
+
 class PasswordMismatchException(HTTPException):
     def __init__(self):
         super().__init__(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="La contraseña actual no coincide",
         )
+
+class CategoryNotFoundException(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La categoría no existe en este restaurante",
+        )
+
+class InvalidFieldsException(HTTPException):
+    def __init__(self, fields: list):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos desconocidos: {', '.join(fields)}",
+        )
@@ -0,0 +1,283 @@
+# export_orders.py
+"""Incremental columnar export of orders for offline analysis.
+
+Writes one file per restaurant and local day under the output directory:
+
+    <output>/orders/restaurant_slug=<slug>/date=<YYYY-MM-DD>/part-<run>-<n>.parquet
+    <output>/order_items/restaurant_slug=<slug>/date=<YYYY-MM-DD>/part-<run>-<n>.parquet
+
+Only orders with ``updated_at`` past the stored watermark are read, so a nightly
+run touches a day of changes instead of the whole collection. An order updated
+after it was exported shows up again in a later part file; analysts should keep
+the row with the latest ``updated_at`` per ``order_id`` (DuckDB: ``QUALIFY``).
+
+A run only reads orders updated more than ``--safety-margin`` seconds ago. The
+watermark never goes back, so an order that became visible to the export after
+a later one was exported would be skipped for good: one committed late (its
+``updated_at`` is set before the transaction commits) or not yet replicated to
+the secondary being read. Secondaries lagging more than the margin are not read
+from (``maxStalenessSeconds``), so every order updated before ``until`` is
+exported as long as its write commits within the margin.
+
+Usage:
+    python export_orders.py --output /data/exports [--format parquet|arrow]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = "_watermark.json"
+MIN_SAFETY_MARGIN_SECONDS = 90  # Smallest maxStalenessSeconds MongoDB accepts
+
+ORDERS_SCHEMA = pa.schema([
+    ("order_id", pa.string()),
+    ("order_number", pa.string()),
+    ("restaurant_slug", pa.string()),
+    ("local_date", pa.string()),
+    ("local_hour", pa.int8()),
+    ("status", pa.string()),
+    ("payment_method", pa.string()),
+    ("is_delivery", pa.bool_()),
+    ("delivery_zone", pa.string()),
+    ("item_count", pa.int32()),
+    ("subtotal", pa.float64()),
+    ("delivery_fee", pa.float64()),
+    ("total", pa.float64()),
+    ("created_at", pa.timestamp("ms", tz="UTC")),
+    ("updated_at", pa.timestamp("ms", tz="UTC")),
+])
+
+ORDER_ITEMS_SCHEMA = pa.schema([
+    ("order_id", pa.string()),
+    ("restaurant_slug", pa.string()),
+    ("local_date", pa.string()),
+    ("line", pa.int32()),
+    ("product_id", pa.string()),
+    ("product_name", pa.string()),
+    ("quantity", pa.int32()),
+    ("unit_price", pa.float64()),
+    ("total_price", pa.float64()),
+    ("size", pa.string()),
+    ("toppings", pa.list_(pa.string())),
+    ("special_instructions", pa.string()),
+    ("updated_at", pa.timestamp("ms", tz="UTC")),
+])
+
+def load_watermark(output_dir: str) -> dict:
+    """Load the last exported (updated_at, _id) position"""
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    return {
+        "updated_at": datetime.fromisoformat(state["updated_at"]),
+        "_id": ObjectId(state["_id"])
+    }
+
+def save_watermark(output_dir: str, updated_at: datetime, last_id: ObjectId):
+    """Persist the watermark atomically"""
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"updated_at": updated_at.isoformat(), "_id": str(last_id)}, f)
+    os.replace(tmp_path, path)
+
+def build_query(watermark: dict, until: datetime) -> dict:
+    """Orders changed after the watermark and up to the start of this run"""
+    if not watermark:
+        return {"updated_at": {"$type": "date", "$lte": until}}
+    return {
+        "$or": [
+            {"updated_at": {"$gt": watermark["updated_at"], "$lte": until}},
+            {"updated_at": watermark["updated_at"], "_id": {"$gt": watermark["_id"]}}
+        ]
+    }
+
+def local_date_of(order: dict) -> str:
+    """Partition date for an order (local date when available)"""
+    return order.get("local_date") or order["created_at"].strftime("%Y-%m-%d")
+
+def flatten_order(order: dict):
+    """Split an order document into one orders row and its item rows"""
+    order_id = str(order["_id"])
+    local_date = local_date_of(order)
+    items = order.get("items", [])
+
+    order_row = {
+        "order_id": order_id,
+        "order_number": order.get("order_number"),
+        "restaurant_slug": order["restaurant_slug"],
+        "local_date": local_date,
+        "local_hour": order.get("local_hour", order["created_at"].hour),
+        "status": order.get("status"),
+        "payment_method": order.get("payment_method"),
+        "is_delivery": order.get("is_delivery"),
+        "delivery_zone": order.get("delivery_zone"),
+        "item_count": len(items),
+        "subtotal": order.get("subtotal"),
+        "delivery_fee": order.get("delivery_fee"),
+        "total": order.get("total"),
+        "created_at": order["created_at"],
+        "updated_at": order["updated_at"],
+    }
+
+    item_rows = []
+    for line, item in enumerate(items):
+        customization = item.get("customization") or {}
+        item_rows.append({
+            "order_id": order_id,
+            "restaurant_slug": order["restaurant_slug"],
+            "local_date": local_date,
+            "line": line,
+            "product_id": item.get("product_id"),
+            "product_name": item.get("product_name"),
+            "quantity": item.get("quantity"),
+            "unit_price": item.get("unit_price"),
+            "total_price": item.get("total_price"),
+            "size": customization.get("size"),
+            "toppings": customization.get("toppings", []),
+            "special_instructions": customization.get("special_instructions"),
+            "updated_at": order["updated_at"],
+        })
+
+    return order_row, item_rows
+
+def write_table(table: pa.Table, directory: str, file_stem: str, file_format: str):
+    """Write a table to a partition directory (tmp file + rename)"""
+    os.makedirs(directory, exist_ok=True)
+    extension = "parquet" if file_format == "parquet" else "arrow"
+    path = os.path.join(directory, f"{file_stem}.{extension}")
+    tmp_path = f"{path}.tmp"
+    if file_format == "parquet":
+        pq.write_table(table, tmp_path, compression="zstd")
+    else:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    os.replace(tmp_path, path)
+
+class OrdersExporter:
+    def __init__(
+        self,
+        db,
+        output_dir: str,
+        file_format: str = "parquet",
+        flush_rows: int = 50000,
+        safety_margin: timedelta = timedelta(seconds=300)
+    ):
+        self.collection = db.orders
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.flush_rows = flush_rows
+        self.safety_margin = safety_margin
+        self.run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")  # Unique per run: parts are never overwritten
+        self.part = 0
+
+    def flush(self, orders: dict, items: dict):
+        """Write the buffered rows, one file per restaurant and day"""
+        for (slug, local_date), rows in orders.items():
+            partition = os.path.join(f"restaurant_slug={slug}", f"date={local_date}")
+            file_stem = f"part-{self.run_id}-{self.part:05d}"
+            write_table(
+                pa.Table.from_pylist(rows, schema=ORDERS_SCHEMA),
+                os.path.join(self.output_dir, "orders", partition), file_stem, self.file_format
+            )
+            if items.get((slug, local_date)):
+                write_table(
+                    pa.Table.from_pylist(items[(slug, local_date)], schema=ORDER_ITEMS_SCHEMA),
+                    os.path.join(self.output_dir, "order_items", partition), file_stem, self.file_format
+                )
+        self.part += 1
+
+    async def run(self) -> int:
+        """Export every order changed since the last run"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        watermark = load_watermark(self.output_dir)
+        # Orders still committing or replicating stay for the next run
+        until = datetime.utcnow() - self.safety_margin
+
+        projection = {"customer": 0}  # Customer PII stays in production
+        cursor = self.collection.find(build_query(watermark, until), projection) \
+            .sort([("updated_at", 1), ("_id", 1)]) \
+            .batch_size(1000)
+
+        orders = defaultdict(list)
+        items = defaultdict(list)
+        buffered = 0
+        exported = 0
+        last = None
+
+        async for order in cursor:
+            order_row, item_rows = flatten_order(order)
+            key = (order_row["restaurant_slug"], order_row["local_date"])
+            orders[key].append(order_row)
+            items[key].extend(item_rows)
+            buffered += 1 + len(item_rows)
+            exported += 1
+            last = order
+
+            if buffered >= self.flush_rows:
+                self.flush(orders, items)
+                save_watermark(self.output_dir, last["updated_at"], last["_id"])
+                orders.clear()
+                items.clear()
+                buffered = 0
+
+        if orders:
+            self.flush(orders, items)
+        if last:
+            save_watermark(self.output_dir, last["updated_at"], last["_id"])
+
+        logger.info(f"Exported {exported} orders to {self.output_dir}")
+        return exported
+
+async def main():
+    parser = argparse.ArgumentParser(description="Export orders to Parquet/Arrow files")
+    parser.add_argument("--output", default=os.getenv("EXPORT_DIR", "exports"))
+    parser.add_argument("--format", choices=["parquet", "arrow"], default="parquet")
+    parser.add_argument("--flush-rows", type=int, default=50000)
+    parser.add_argument(
+        "--safety-margin", type=int, default=int(os.getenv("EXPORT_SAFETY_MARGIN_SECONDS", "300")),
+        help=f"Skip orders updated in the last N seconds (at least {MIN_SAFETY_MARGIN_SECONDS})"
+    )
+    args = parser.parse_args()
+    if args.safety_margin < MIN_SAFETY_MARGIN_SECONDS:
+        parser.error(f"--safety-margin must be at least {MIN_SAFETY_MARGIN_SECONDS} seconds")
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Read from a secondary when available so the export doesn't load the primary,
+    # but never from one further behind than the safety margin
+    client = AsyncIOMotorClient(
+        os.getenv("MONGODB_URL", "mongodb://localhost:27017"),
+        readPreference="secondaryPreferred",
+        maxStalenessSeconds=args.safety_margin,
+        tz_aware=True,
+    )
+    db = client[os.getenv("DATABASE_NAME", "food_delivery_multi")]
+
+    try:
+        await OrdersExporter(
+            db, args.output, args.format, args.flush_rows, timedelta(seconds=args.safety_margin)
+        ).run()
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+# fieldsets.py
+"""Sparse fieldsets: ``?fields=id,name,price`` on list endpoints.
+
+``parse_fields`` checks the requested names against the full response model,
+``projection`` turns them into a MongoDB projection so the rest of each
+document never leaves the database, and ``sparse_model`` builds (once per
+field set) a response model with just those fields, validated the same way.
+``id`` is always included.
+"""
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel, create_model
+
+from exceptions import InvalidFieldsException
+
+def parse_fields(model: Type[BaseModel], fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Requested field names in model order, or None for the full model"""
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(model.model_fields)
+    if unknown:
+        raise InvalidFieldsException(sorted(unknown))
+    requested.add("id")
+    return tuple(name for name in model.model_fields if name in requested)
+
+def projection(fields: Tuple[str, ...]) -> Dict[str, int]:
+    return {("_id" if name == "id" else name): 1 for name in fields}
+
+@lru_cache(maxsize=256)
+def sparse_model(model: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields}
+    )
@@ -6,22 +6,34 @@ from contextlib import asynccontextmanager
 import uvicorn
 from typing import Optional, List
 import os
+import asyncio
+import logging
 from dotenv import load_dotenv
 from config import settings
-from exceptions import InvalidCredentialsException, TokenExpiredException, InvalidTokenException, UserNotFoundException, RestaurantNotFoundException, UserAlreadyExistsException, PasswordMismatchException, InactiveUserException
+from exceptions import InvalidCredentialsException, TokenExpiredException, InvalidTokenException, UserNotFoundException, RestaurantNotFoundException, UserAlreadyExistsException, PasswordMismatchException, InactiveUserException, RestaurantAlreadyExistsException, CategoryNotFoundException, InvalidFieldsException
 
 # Import modules
 from database import database, init_db, close_db
 from models import *
 from auth import AuthService
-from services import RestaurantService, ProductService, OrderService, CategoryService, PushNotificationService
+from services import RestaurantService, ProductService, OrderService, CategoryService, PushNotificationService, OrderRollupService
 from dependencies import get_current_user
+from webpush import WebPushSender
+from cache import InvalidationBus, tenant_cache, response_cache, tenant_invalidator
+from outbox import OutboxWorker
+from responses import CodecMiddleware
+from compression import CompressionMiddleware
+from monitoring import MetricsMiddleware, known_tenants, loop_lag
+from timing import ServerTimingMiddleware
+from profiling import ProfilingMiddleware
 
 # Import routers
-from routers import auth, restaurants, categories, products, orders, analytics, push_notifications, initialization, public_routes
+from routers import auth, restaurants, categories, products, orders, analytics, push_notifications, initialization, public_routes, monitoring
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Security
 security = HTTPBearer()
 
@@ -34,9 +46,36 @@ async def lifespan(app: FastAPI):
     app.state.product_service = ProductService()
     app.state.order_service = OrderService()
     app.state.category_service = CategoryService()
-    app.state.push_notification_service = PushNotificationService()
+    app.state.web_push_sender = None
+    if settings.vapid_private_key:
+        app.state.web_push_sender = WebPushSender(
+            settings.vapid_private_key,
+            settings.vapid_subject,
+            concurrency=settings.push_concurrency,
+            ttl=settings.push_ttl_seconds
+        )
+    app.state.push_notification_service = PushNotificationService(app.state.web_push_sender)
+    app.state.outbox_worker = None
+    if app.state.web_push_sender:
+        app.state.outbox_worker = OutboxWorker(app.state.push_notification_service.outbox)
+        app.state.outbox_worker.start()
+    app.state.rollup_service = OrderRollupService()
+    app.state.invalidation_bus = InvalidationBus(database.database)
+    app.state.invalidation_bus.subscribe("restaurants", tenant_invalidator(tenant_cache))
+    app.state.invalidation_bus.subscribe("restaurants", known_tenants.handle)
+    for collection in ("restaurants", "products", "categories"):
+        app.state.invalidation_bus.subscribe(collection, tenant_invalidator(response_cache))
+    app.state.invalidation_bus.start()
+    await known_tenants.load(database.database)
+    loop_lag.start()
     yield
     # Shutdown
+    await loop_lag.stop()
+    await app.state.invalidation_bus.stop()
+    if app.state.outbox_worker:
+        await app.state.outbox_worker.stop()
+    if app.state.web_push_sender:
+        await app.state.web_push_sender.close()
     await close_db()
 
 app = FastAPI(
@@ -105,6 +144,27 @@ async def password_mismatch_exception_handler(request: Request, exc: PasswordMis
         content={"detail": exc.detail}
     )
 
+@app.exception_handler(RestaurantAlreadyExistsException)
+async def restaurant_already_exists_exception_handler(request: Request, exc: RestaurantAlreadyExistsException):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail}
+    )
+
+@app.exception_handler(CategoryNotFoundException)
+async def category_not_found_exception_handler(request: Request, exc: CategoryNotFoundException):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail}
+    )
+
+@app.exception_handler(InvalidFieldsException)
+async def invalid_fields_exception_handler(request: Request, exc: InvalidFieldsException):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail}
+    )
+
 # CORS middleware
 
 # CORS middleware
@@ -116,6 +176,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negociación de formato (JSON o MessagePack)
+app.add_middleware(CodecMiddleware)
+
+# Compresión gzip/brotli de respuestas grandes
+app.add_middleware(CompressionMiddleware)
+
+# Desglose de tiempos por respuesta (Server-Timing)
+app.add_middleware(ServerTimingMiddleware)
+
+# Métricas por ruta y restaurante (/metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Perfilado de requests puntuales para superadmin (X-Profile: 1)
+app.add_middleware(ProfilingMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(restaurants.router)
@@ -126,6 +201,7 @@ app.include_router(analytics.router)
 app.include_router(push_notifications.router)
 app.include_router(initialization.router)
 app.include_router(public_routes.router)
+app.include_router(monitoring.router)
 
 # Root endpoint
 @app.get("/")
@@ -134,8 +210,22 @@ async def root():
 
 # Health check
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "database": "connected"}
+async def health_check(request: Request):
+    checks = {"database": "connected"}
+    try:
+        await asyncio.wait_for(database.database.command("ping"), timeout=settings.health_check_timeout_seconds)
+    except Exception as e:
+        logger.error(f"Health check: database ping failed: {e}")
+        checks["database"] = "unreachable"
+    bus = request.app.state.invalidation_bus
+    checks["cache_invalidation"] = bus.mode if bus.running else "stopped"
+    checks["event_loop_lag_ms"] = round(loop_lag.last * 1000, 1)
+    
+    healthy = checks["database"] == "connected"
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "healthy" if healthy else "unhealthy", **checks}
+    )
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -0,0 +1,611 @@
+# memory_store.py
+"""Embedded in-memory storage backend.
+
+Implements the subset of the Motor client/database/collection/cursor API that
+the services use, so the whole API (and benchmark.py) can run without a
+MongoDB server. Select it with ``STORAGE_BACKEND=memory``.
+
+Not supported: aggregation beyond $match/$sort/$skip/$limit, transactions
+(sessions are accepted but writes are not rolled back), read preferences and
+server commands other than ping.
+"""
+import copy
+import re
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, IndexModel, InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+
+_MISSING = object()
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+def _to_stored(value):
+    """Deep copy a value the way BSON round-trips it"""
+    if isinstance(value, dict):
+        return {key: _to_stored(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_stored(item) for item in value]
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def get_path(doc: Any, path: str) -> Any:
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+def set_path(doc: dict, path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+# ===== Matching =====
+
+def _sort_key(value):
+    """Order values across types like MongoDB does (roughly)"""
+    if value is _MISSING or value is None:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, str(value))
+    if isinstance(value, list):
+        return (5, str(value))
+    if isinstance(value, bytes):
+        return (6, value)
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, value)
+    return (10, str(value))
+
+def _compare(value, op: str, arg) -> bool:
+    left, right = _sort_key(value), _sort_key(arg)
+    if left[0] != right[0]:
+        return False  # Comparisons don't cross types
+    if op == "$gt":
+        return left > right
+    if op == "$gte":
+        return left >= right
+    if op == "$lt":
+        return left < right
+    return left <= right
+
+def _candidates(value) -> list:
+    """A field matches if the value or any array element matches"""
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+def _match_operator(value, op: str, arg, condition: dict) -> bool:
+    if op == "$eq":
+        return _match_value(value, arg)
+    if op == "$ne":
+        return not _match_value(value, arg)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return value is not _MISSING and any(_compare(item, op, arg) for item in _candidates(value))
+    if op == "$in":
+        return any(_match_value(value, item) for item in arg)
+    if op == "$nin":
+        return not any(_match_value(value, item) for item in arg)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$regex":
+        flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+        pattern = arg if hasattr(arg, "search") else re.compile(arg, flags)
+        return any(isinstance(item, str) and pattern.search(item) for item in _candidates(value))
+    if op == "$options":
+        return True
+    if op == "$type":
+        types = {"date": datetime, "string": str, "objectId": ObjectId, "bool": bool, "object": dict, "array": list}
+        return any(isinstance(item, types[arg]) for item in _candidates(value) if item is not _MISSING)
+    if op == "$size":
+        return isinstance(value, list) and len(value) == arg
+    if op == "$all":
+        return isinstance(value, list) and all(item in value for item in arg)
+    raise NotImplementedError(f"Query operator {op} is not supported by the memory backend")
+
+def _match_value(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return all(_match_operator(value, op, arg, condition) for op, arg in condition.items())
+    if hasattr(condition, "search") and not isinstance(condition, str):
+        return any(isinstance(item, str) and condition.search(item) for item in _candidates(value))
+    if value is _MISSING:
+        return condition is None
+    return any(item == condition for item in _candidates(value))
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, branch) for branch in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, branch) for branch in condition):
+                return False
+        elif not _match_value(get_path(doc, key), condition):
+            return False
+    return True
+
+# ===== Updates and projections =====
+
+def apply_update(doc: dict, update: dict, is_insert: bool = False):
+    if not any(key.startswith("$") for key in update):
+        _id = doc.get("_id")
+        doc.clear()
+        doc.update(_to_stored(update))
+        if _id is not None:
+            doc["_id"] = _id
+        return
+
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set":
+                set_path(doc, path, _to_stored(value))
+            elif op == "$setOnInsert":
+                if is_insert:
+                    set_path(doc, path, _to_stored(value))
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                current = get_path(doc, path)
+                set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op in ("$addToSet", "$push"):
+                current = get_path(doc, path)
+                items = current if isinstance(current, list) else []
+                values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in _to_stored(values):
+                    if op == "$push" or item not in items:
+                        items.append(item)
+                set_path(doc, path, items)
+            elif op == "$pull":
+                current = get_path(doc, path)
+                if isinstance(current, list):
+                    set_path(doc, path, [item for item in current if not _match_value(item, value)])
+            elif op in ("$min", "$max"):
+                current = get_path(doc, path)
+                if current is _MISSING or _compare(value, "$lt" if op == "$min" else "$gt", current):
+                    set_path(doc, path, _to_stored(value))
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported by the memory backend")
+
+def upsert_seed(query: dict) -> dict:
+    """Document fields implied by the equality parts of an upsert filter"""
+    doc = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and any(op.startswith("$") for op in condition):
+            if "$eq" in condition:
+                set_path(doc, key, _to_stored(condition["$eq"]))
+            continue
+        set_path(doc, key, _to_stored(condition))
+    return doc
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    include_id = bool(projection.get("_id", 1))
+    if fields and all(value for value in fields.values()):
+        result = {}
+        if include_id and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for path in fields:
+            value = get_path(doc, path)
+            if value is not _MISSING:
+                set_path(result, path, copy.deepcopy(value))
+        return result
+
+    result = copy.deepcopy(doc)
+    for path, value in projection.items():
+        if not value:
+            unset_path(result, path)
+    return result
+
+def _normalize_sort(key_or_list, direction=None) -> list:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+def sort_documents(docs: list, spec: list) -> list:
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda doc: _sort_key(get_path(doc, key)), reverse=direction == -1)
+    return docs
+
+# ===== Cursors =====
+
+class MemoryCursor:
+    def __init__(self, collection: "MemoryCollection", query: Optional[dict], projection=None):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort: list = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None) -> "MemoryCursor":
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "MemoryCursor":
+        return self
+
+    def _results(self) -> list:
+        docs = self._collection._find_raw(self._query)
+        if self._sort:
+            docs = sort_documents(docs, self._sort)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._results():
+            yield doc
+
+class MemoryAggregationCursor:
+    def __init__(self, docs: list):
+        self._docs = docs
+
+    async def to_list(self, length: Optional[int] = None) -> list:
+        return self._docs[:length] if length else list(self._docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+# ===== Collections =====
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: Dict[Any, dict] = {}
+        self._indexes: Dict[str, dict] = {"_id_": {"key": {"_id": 1}, "name": "_id_", "v": 2}}
+        self._unique: Dict[str, Dict[tuple, Any]] = {}
+
+    # --- internals ---
+
+    def _find_raw(self, query: dict) -> list:
+        _id = query.get("_id", _MISSING)
+        if _id is not _MISSING and not isinstance(_id, dict):
+            doc = self._docs.get(_id)
+            return [doc] if doc is not None and matches(doc, query) else []
+        return [doc for doc in self._docs.values() if matches(doc, query)]
+
+    def _unique_key(self, doc: dict, spec: dict) -> Optional[tuple]:
+        values = tuple(repr(_sort_key(get_path(doc, field))) for field in spec["key"])
+        if spec.get("sparse") and all(get_path(doc, field) is _MISSING for field in spec["key"]):
+            return None
+        return values
+
+    def _check_unique(self, doc: dict, exclude_id=_MISSING):
+        for name, spec in self._indexes.items():
+            if name == "_id_" or not spec.get("unique"):
+                continue
+            key = self._unique_key(doc, spec)
+            owner = self._unique[name].get(key, _MISSING) if key is not None else _MISSING
+            if owner is not _MISSING and owner != exclude_id:
+                key_value = {field: get_path(doc, field) for field in spec["key"]}
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {name}", 11000,
+                    {"keyPattern": dict(spec["key"]), "keyValue": {
+                        field: None if value is _MISSING else value for field, value in key_value.items()
+                    }}
+                )
+
+    def _index_doc(self, doc: dict):
+        for name, spec in self._indexes.items():
+            if name != "_id_" and spec.get("unique"):
+                key = self._unique_key(doc, spec)
+                if key is not None:
+                    self._unique[name][key] = doc["_id"]
+
+    def _unindex_doc(self, doc: dict):
+        for name, spec in self._indexes.items():
+            if name != "_id_" and spec.get("unique"):
+                key = self._unique_key(doc, spec)
+                if key is not None and self._unique[name].get(key) == doc["_id"]:
+                    del self._unique[name][key]
+
+    def _insert(self, document: dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        if document["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        stored = _to_stored(document)
+        self._check_unique(stored)
+        self._docs[stored["_id"]] = stored
+        self._index_doc(stored)
+        return stored["_id"]
+
+    def _update(self, query: dict, update: dict, upsert: bool, many: bool) -> _Result:
+        docs = self._find_raw(query)
+        if not many:
+            docs = docs[:1]
+        modified = 0
+        for doc in docs:
+            updated = copy.deepcopy(doc)
+            apply_update(updated, update)
+            if updated != doc:
+                self._check_unique(updated, exclude_id=doc["_id"])
+                self._unindex_doc(doc)
+                self._docs[doc["_id"]] = updated
+                self._index_doc(updated)
+                modified += 1
+        if docs or not upsert:
+            return _Result(matched_count=len(docs), modified_count=modified, upserted_id=None)
+
+        new_doc = upsert_seed(query)
+        apply_update(new_doc, update, is_insert=True)
+        upserted_id = self._insert(new_doc)
+        return _Result(matched_count=0, modified_count=0, upserted_id=upserted_id)
+
+    # --- Motor API ---
+
+    def find(self, filter: Optional[dict] = None, projection=None, **kwargs) -> MemoryCursor:
+        cursor = MemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection=None, **kwargs) -> Optional[dict]:
+        results = await self.find(filter, projection, **kwargs).limit(1).to_list(length=1)
+        return results[0] if results else None
+
+    async def insert_one(self, document: dict, session=None, **kwargs) -> _Result:
+        return _Result(inserted_id=self._insert(document), acknowledged=True)
+
+    async def insert_many(self, documents: list, ordered: bool = True, session=None, **kwargs) -> _Result:
+        inserted_ids, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted_ids)})
+        return _Result(inserted_ids=inserted_ids, acknowledged=True)
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, session=None, **kwargs) -> _Result:
+        return self._update(filter, update, upsert, many=False)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, session=None, **kwargs) -> _Result:
+        return self._update(filter, update, upsert, many=True)
+
+    async def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict,
+        projection=None,
+        sort=None,
+        upsert: bool = False,
+        return_document=ReturnDocument.BEFORE,
+        session=None,
+        **kwargs
+    ) -> Optional[dict]:
+        docs = self._find_raw(filter)
+        if sort:
+            docs = sort_documents(docs, _normalize_sort(sort))
+        before = copy.deepcopy(docs[0]) if docs else None
+        query = {"_id": before["_id"]} if before else filter
+        result = self._update(query, update, upsert, many=False)
+
+        if return_document == ReturnDocument.BEFORE:
+            return project(before, projection) if before else None
+        _id = before["_id"] if before else result.upserted_id
+        if _id is None:
+            return None
+        return project(self._docs[_id], projection)
+
+    async def count_documents(self, filter: dict, session=None, **kwargs) -> int:
+        return len(self._find_raw(filter))
+
+    async def delete_one(self, filter: dict, session=None, **kwargs) -> _Result:
+        docs = self._find_raw(filter)[:1]
+        for doc in docs:
+            self._unindex_doc(doc)
+            del self._docs[doc["_id"]]
+        return _Result(deleted_count=len(docs))
+
+    async def delete_many(self, filter: dict, session=None, **kwargs) -> _Result:
+        docs = self._find_raw(filter)
+        for doc in docs:
+            self._unindex_doc(doc)
+            del self._docs[doc["_id"]]
+        return _Result(deleted_count=len(docs))
+
+    async def bulk_write(self, requests: list, ordered: bool = True, session=None, **kwargs) -> _Result:
+        upserted_ids, matched, modified, inserted, deleted = {}, 0, 0, 0, 0
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                self._insert(request._doc)
+                inserted += 1
+            elif isinstance(request, (UpdateOne, UpdateMany)):
+                result = self._update(request._filter, request._doc, request._upsert, isinstance(request, UpdateMany))
+                matched += result.matched_count
+                modified += result.modified_count
+                if result.upserted_id is not None:
+                    upserted_ids[index] = result.upserted_id
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                result = await (self.delete_many if isinstance(request, DeleteMany) else self.delete_one)(request._filter)
+                deleted += result.deleted_count
+            else:
+                raise NotImplementedError(f"{type(request).__name__} is not supported by the memory backend")
+        return _Result(
+            upserted_ids=upserted_ids, matched_count=matched, modified_count=modified,
+            inserted_count=inserted, deleted_count=deleted, upserted_count=len(upserted_ids)
+        )
+
+    def aggregate(self, pipeline: list, **kwargs) -> MemoryAggregationCursor:
+        docs = [copy.deepcopy(doc) for doc in self._docs.values()]
+        for stage in pipeline:
+            (name, arg), = stage.items()
+            if name == "$match":
+                docs = [doc for doc in docs if matches(doc, arg)]
+            elif name == "$sort":
+                docs = sort_documents(docs, _normalize_sort(arg))
+            elif name == "$skip":
+                docs = docs[arg:]
+            elif name == "$limit":
+                docs = docs[:arg]
+            elif name == "$project":
+                docs = [project(doc, arg) for doc in docs]
+            else:
+                raise NotImplementedError(f"Aggregation stage {name} is not supported by the memory backend")
+        return MemoryAggregationCursor(docs)
+
+    def list_indexes(self, **kwargs) -> MemoryAggregationCursor:
+        return MemoryAggregationCursor([copy.deepcopy(spec) for spec in self._indexes.values()])
+
+    async def create_indexes(self, indexes: List[IndexModel], **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            spec = dict(model.document)
+            spec["key"] = dict(spec["key"])
+            self._indexes[spec["name"]] = spec
+            if spec.get("unique"):
+                self._unique[spec["name"]] = {}
+                for doc in self._docs.values():
+                    self._check_unique(doc, exclude_id=doc["_id"])
+                    self._index_doc(doc)
+            names.append(spec["name"])
+        return names
+
+    async def create_index(self, keys, **kwargs) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else keys
+        return (await self.create_indexes([IndexModel(keys, **kwargs)]))[0]
+
+    async def drop_index(self, name: str, **kwargs):
+        self._indexes.pop(name, None)
+        self._unique.pop(name, None)
+
+    def with_options(self, **kwargs) -> "MemoryCollection":
+        return self
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        return self.get_collection(name)
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    async def list_collection_names(self, **kwargs) -> List[str]:
+        return list(self._collections)
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+
+    async def command(self, command, **kwargs) -> dict:
+        name = command if isinstance(command, str) else next(iter(command))
+        if name in ("ping", "hello", "isMaster"):
+            return {"ok": 1.0}
+        raise OperationFailure(f"Command {name} is not supported by the memory backend")
+
+class MemorySession:
+    """Accepted where Motor sessions are; operations are not isolated or rolled back"""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def start_transaction(self, **kwargs) -> "MemorySession":
+        return self
+
+    async def abort_transaction(self):
+        pass
+
+    async def commit_transaction(self):
+        pass
+
+    async def end_session(self):
+        pass
+
+class MemoryClient:
+    def __init__(self):
+        self._databases: Dict[str, MemoryDatabase] = {}
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        return self.get_database(name)
+
+    @property
+    def admin(self) -> MemoryDatabase:
+        return self.get_database("admin")
+
+    async def start_session(self, **kwargs) -> MemorySession:
+        return MemorySession()
+
+    def close(self):
+        pass
@@ -0,0 +1,262 @@
+# migrations.py
+"""Versioned schema migrations and declarative index management.
+
+Applied state lives in the ``_migrations`` collection: one document per schema
+migration version plus an ``indexes`` document holding the fingerprint of the
+index declaration below. When nothing changed, a run costs a single read.
+
+Run from a deploy step or by hand (not on every boot):
+
+    python migrations.py            # apply pending migrations and index changes
+    python migrations.py --dry-run  # show what would change
+    python migrations.py --prune    # also drop indexes not declared below
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "_migrations"
+
+# Declared indexes per collection. Indexes in the database that are not listed
+# here (other than _id_) are reported and only dropped with --prune, since an
+# operator may have added them by hand (e.g. single-field indexes on
+# restaurant_slug that are a prefix of a compound index).
+INDEXES: Dict[str, List[IndexModel]] = {
+    "restaurants": [
+        IndexModel([("slug", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("is_active", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("updated_at", ASCENDING)]),  # Cache invalidation polling
+    ],
+    "users": [
+        IndexModel([("restaurant_slug", ASCENDING)]),
+        IndexModel([("username", ASCENDING), ("restaurant_slug", ASCENDING)], unique=True),
+    ],
+    "products": [
+        IndexModel([("category_id", ASCENDING)]),
+        IndexModel([("restaurant_slug", ASCENDING), ("is_available", ASCENDING)]),
+        # Category menu pages; name last so results come back sorted
+        IndexModel([
+            ("restaurant_slug", ASCENDING), ("category_key", ASCENDING),
+            ("is_available", ASCENDING), ("name", ASCENDING)
+        ]),
+        IndexModel([("restaurant_slug", ASCENDING), ("is_popular", ASCENDING)]),
+        IndexModel([("name", ASCENDING)]),
+        IndexModel([("updated_at", ASCENDING)]),  # Cache invalidation polling
+    ],
+    "orders": [
+        IndexModel([("order_number", ASCENDING)], unique=True),
+        IndexModel([("restaurant_slug", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("restaurant_slug", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("restaurant_slug", ASCENDING), ("local_date", ASCENDING)]),
+        IndexModel([("customer.phone", ASCENDING)]),
+        IndexModel([("updated_at", ASCENDING), ("_id", ASCENDING)]),  # Incremental exports
+    ],
+    "categories": [
+        IndexModel([("restaurant_slug", ASCENDING), ("display_order", ASCENDING)]),
+        IndexModel([("restaurant_slug", ASCENDING), ("key", ASCENDING)]),
+        IndexModel([("updated_at", ASCENDING)]),  # Cache invalidation polling
+    ],
+    # Analytics rollups
+    "order_rollups": [
+        IndexModel([("restaurant_slug", ASCENDING), ("date", ASCENDING), ("hour", ASCENDING)], unique=True),
+    ],
+    "tenant_rollups": [
+        IndexModel([("period", ASCENDING), ("key", ASCENDING), ("restaurant_slug", ASCENDING)], unique=True),
+        IndexModel([("period", ASCENDING), ("key", ASCENDING), ("orders", DESCENDING)]),
+        IndexModel([("period", ASCENDING), ("key", ASCENDING), ("revenue", DESCENDING)]),
+    ],
+    "platform_rollups": [
+        IndexModel([("period", ASCENDING), ("key", ASCENDING)], unique=True),
+    ],
+    # Push notifications
+    "push_subscriptions": [
+        IndexModel([("endpoint", ASCENDING)], unique=True),
+        IndexModel([("restaurant_slug", ASCENDING), ("topics", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "push_notifications": [
+        IndexModel([("restaurant_slug", ASCENDING), ("sent_at", DESCENDING)]),
+    ],
+    "push_jobs": [
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)]),
+    ],
+    # Request profiles, kept 24 hours
+    "profiles": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=86400),
+    ],
+    # Global profiling limit, one counter per window
+    "profiling_slots": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "push_deliveries": [
+        IndexModel([("job_id", ASCENDING), ("subscription_id", ASCENDING)], unique=True),
+        IndexModel([("job_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        IndexModel([("lock", ASCENDING)], sparse=True),
+    ],
+}
+
+# Index options that make two indexes with the same key different
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+# Temporary index that serves a changed index's queries while it is rebuilt
+BRIDGE_SUFFIX = "_bridge"
+BRIDGE_FIELD = "_index_bridge"
+
+def backfill_migration(name: str) -> Callable[..., Awaitable[None]]:
+    """Migration that runs a per-tenant backfill from backfill.py"""
+    async def migration(db):
+        from backfill import run_backfill
+        report = await run_backfill(db, name)
+        if report["status"] != "completed":
+            raise RuntimeError(f"{name} backfill did not complete; rerun to resume")
+    return migration
+
+# (version, description, migration); append only, never renumber
+MIGRATIONS: List[Tuple[int, str, Callable[..., Awaitable[None]]]] = [
+    (1, "Backfill restaurant_slug on products, orders and categories", backfill_migration("restaurant_slug")),
+    (2, "Denormalize category name, key and order onto products", backfill_migration("category_snapshot")),
+    (3, "Rebuild order rollups from existing orders", backfill_migration("order_rollups")),
+]
+
+def _index_signature(spec: dict) -> dict:
+    signature = {"key": list(spec["key"].items())}
+    for option in COMPARED_OPTIONS:
+        if option in spec:
+            signature[option] = spec[option]
+    return signature
+
+def indexes_fingerprint() -> str:
+    """Hash of the declared indexes"""
+    declared = {
+        collection: sorted(
+            (model.document["name"], _index_signature(model.document)) for model in models
+        )
+        for collection, models in INDEXES.items()
+    }
+    encoded = json.dumps(declared, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def _bridge(model: IndexModel) -> IndexModel:
+    """Same keys plus a trailing field: a different key pattern that serves the same queries"""
+    return IndexModel(
+        list(model.document["key"].items()) + [(BRIDGE_FIELD, ASCENDING)],
+        name=model.document["name"] + BRIDGE_SUFFIX
+    )
+
+async def sync_indexes(db, dry_run: bool = False, prune: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """Build missing and changed indexes; drop undeclared ones only with ``prune``.
+
+    No index is dropped before its replacement can serve queries: new indexes
+    are built first, and an index changed under the same name (MongoDB can't
+    hold both) is covered by a bridge index while it is rebuilt.
+    """
+    changes = {}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = {}
+        async for index in collection.list_indexes():
+            if index["name"] != "_id_":
+                existing[index["name"]] = _index_signature(index)
+
+        declared = {model.document["name"]: model for model in models}
+        to_create = [model for name, model in declared.items() if name not in existing]
+        to_rebuild = [
+            model for name, model in declared.items()
+            if name in existing and existing[name] != _index_signature(model.document)
+        ]
+        # Bridges left behind by an interrupted run are ours to drop
+        bridges = [name for name in existing if name.endswith(BRIDGE_SUFFIX)]
+        undeclared = [name for name in existing if name not in declared and name not in bridges]
+        if not (to_create or to_rebuild or bridges or undeclared):
+            continue
+
+        changes[collection_name] = {
+            "create": [model.document["name"] for model in to_create],
+            "rebuild": [model.document["name"] for model in to_rebuild],
+            "drop": bridges + (undeclared if prune else []),
+            "undeclared": [] if prune else undeclared
+        }
+        if not prune and undeclared:
+            logger.warning(f"Undeclared indexes on {collection_name} kept (--prune drops them): {undeclared}")
+        if dry_run:
+            continue
+
+        if to_create:
+            logger.info(f"Building indexes on {collection_name}: {changes[collection_name]['create']}")
+            await collection.create_indexes(to_create)
+        for model in to_rebuild:
+            name = model.document["name"]
+            bridge = _bridge(model)
+            logger.info(f"Rebuilding index {collection_name}.{name}")
+            if bridge.document["name"] not in existing:
+                await collection.create_indexes([bridge])
+            await collection.drop_index(name)
+            await collection.create_indexes([model])
+            await collection.drop_index(bridge.document["name"])
+            if bridge.document["name"] in bridges:
+                bridges.remove(bridge.document["name"])
+        for name in bridges + (undeclared if prune else []):
+            logger.info(f"Dropping index {collection_name}.{name}")
+            await collection.drop_index(name)
+
+    return changes
+
+async def migrate(db, dry_run: bool = False, prune: bool = False) -> Dict:
+    """Apply pending schema migrations and index changes (``prune``: drop undeclared indexes)"""
+    migrations_collection = db[MIGRATIONS_COLLECTION]
+    applied = {doc["_id"]: doc async for doc in migrations_collection.find({})}
+    report = {"migrations": [], "indexes": {}}
+
+    for version, description, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        report["migrations"].append(version)
+        if dry_run:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        await migration(db)
+        await migrations_collection.insert_one({
+            "_id": version,
+            "description": description,
+            "applied_at": datetime.utcnow()
+        })
+
+    fingerprint = indexes_fingerprint()
+    if prune or applied.get("indexes", {}).get("fingerprint") != fingerprint:
+        report["indexes"] = await sync_indexes(db, dry_run, prune)
+        if not dry_run:
+            await migrations_collection.update_one(
+                {"_id": "indexes"},
+                {"$set": {"fingerprint": fingerprint, "applied_at": datetime.utcnow()}},
+                upsert=True
+            )
+
+    return report
+
+async def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--prune", action="store_true", help="Drop indexes that are not declared")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    from database import init_db, close_db, database
+    await init_db()
+    try:
+        report = await migrate(database.database, dry_run=args.dry_run, prune=args.prune)
+        print(json.dumps(report, indent=2, default=str))
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,25 +1,52 @@
-from pydantic import BaseModel, Field, EmailStr, validator, ConfigDict, field_validator
-from typing import Optional, List, Dict, Any
+from pydantic import AliasChoices, BaseModel, Field, EmailStr, validator, ConfigDict, field_validator
+from pydantic_core import core_schema
+from typing import Annotated, Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
 from bson import ObjectId
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import re
+import unicodedata
 
 # Utility class for ObjectId
+OBJECT_ID_PATTERN = r"^[0-9a-fA-F]{24}$"
+
 class PyObjectId(ObjectId):
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    """ObjectId field: accepts an ObjectId or its 24-hex string, dumps to str in JSON mode"""
 
     @classmethod
-    def validate(cls, v):
-        if not ObjectId.is_valid(v):
-            raise ValueError("Invalid ObjectId")
-        return ObjectId(v)
+    def __get_pydantic_core_schema__(cls, source_type, handler) -> core_schema.CoreSchema:
+        from_str = core_schema.chain_schema([
+            core_schema.str_schema(pattern=OBJECT_ID_PATTERN),
+            core_schema.no_info_plain_validator_function(ObjectId),
+        ])
+        return core_schema.json_or_python_schema(
+            json_schema=from_str,
+            python_schema=core_schema.union_schema([core_schema.is_instance_schema(ObjectId), from_str]),
+            serialization=core_schema.to_string_ser_schema(when_used="json-unless-none"),
+        )
 
     @classmethod
     def __get_pydantic_json_schema__(cls, core_schema, handler):
         return {'type': 'string'}
 
+class _ObjectIdString:
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type, handler) -> core_schema.CoreSchema:
+        return core_schema.union_schema([
+            core_schema.str_schema(),
+            core_schema.chain_schema([
+                core_schema.is_instance_schema(ObjectId),
+                core_schema.no_info_plain_validator_function(str),
+            ]),
+        ])
+
+# Response id: a str that can be validated straight from a document's ObjectId
+ObjectIdStr = Annotated[str, _ObjectIdString]
+
+# Response model id, read from either "id" or a raw document's "_id"
+DocumentId = Annotated[ObjectIdStr, Field(validation_alias=AliasChoices("id", "_id"))]
+
 # Enums
 class OrderStatus(str, Enum):
     PENDING = "pending"
@@ -35,6 +62,10 @@ class UserRole(str, Enum):
     SUPERADMIN = "superadmin"
     CUSTOMER = "customer"
 
+class PushTopic(str, Enum):
+    ORDER_UPDATES = "order_updates"
+    PROMOS = "promos"
+
 class PaymentMethod(str, Enum):
     CASH = "cash"
     CARD = "card"
@@ -70,6 +101,16 @@ class RestaurantSettings(BaseModel):
     opening_hours: Dict[str, Dict[str, str]] = {}
     accept_cash: bool = True
     accept_cards: bool = False
+    timezone: str = "America/Argentina/Cordoba"  # Zona horaria IANA para analíticas
+
+    @field_validator('timezone')
+    @classmethod
+    def timezone_is_valid(cls, v):
+        try:
+            ZoneInfo(v)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f'Unknown timezone: {v}')
+        return v
 
 class Restaurant(BaseDocument):
     name: str
@@ -106,7 +147,7 @@ class RestaurantUpdate(BaseModel):
     settings: Optional[RestaurantSettings] = None
 
 class RestaurantResponse(BaseModel):
-    id: str
+    id: DocumentId
     name: str
     slug: str
     description: Optional[str]
@@ -138,8 +179,22 @@ class UserCreate(BaseModel):
     restaurant_slug: str
 
 # ===== CATEGORY MODELS =====
+def category_key(name: str) -> str:
+    """URL-friendly category identifier: 'Hamburguesas Clásicas' -> 'hamburguesas-clasicas'"""
+    normalized = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", normalized.lower()).strip("-")
+
+def category_snapshot(category: dict) -> dict:
+    """Category fields denormalized onto its products"""
+    return {
+        "category_name": category["name"],
+        "category_key": category_key(category["name"]),
+        "category_display_order": category.get("display_order", 0)
+    }
+
 class Category(BaseDocument):
     name: str
+    key: str = ""
     icon: str = "️"
     description: Optional[str] = None
     restaurant_id: PyObjectId
@@ -161,7 +216,7 @@ class CategoryUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 class CategoryResponse(BaseModel):
-    id: str
+    id: DocumentId
     name: str
     icon: str
     description: Optional[str]
@@ -186,6 +241,10 @@ class Product(BaseDocument):
     price: float  # Precio base
     image: str = "️"
     category_id: PyObjectId
+    # Snapshot of the category, kept in sync by CategoryService.update_category
+    category_name: Optional[str] = None
+    category_key: Optional[str] = None
+    category_display_order: int = 0
     restaurant_id: PyObjectId
     restaurant_slug: str
     sizes: List[ProductSize] = []
@@ -229,12 +288,14 @@ class ProductUpdate(BaseModel):
     preparation_time: Optional[int] = None
 
 class ProductResponse(BaseModel):
-    id: str
+    id: DocumentId
     name: str
     description: str
     price: float
     image: str
-    category_id: str
+    category_id: ObjectIdStr
+    category_name: Optional[str] = None
+    category_key: Optional[str] = None
     sizes: List[ProductSize]
     toppings: List[ProductTopping]
     is_available: bool
@@ -303,7 +364,7 @@ class OrderStatusUpdate(BaseModel):
     status: OrderStatus
 
 class OrderResponse(BaseModel):
-    id: str
+    id: DocumentId
     order_number: str
     customer: CustomerInfo
     items: List[OrderItem]
@@ -345,6 +406,22 @@ class DashboardAnalytics(BaseModel):
     recent_orders: List[OrderResponse]
     hourly_orders: List[Dict[str, Any]]
 
+class TenantVolume(BaseModel):
+    restaurant_slug: str
+    name: Optional[str] = None
+    orders: int
+    revenue: float
+
+class PlatformAnalytics(BaseModel):
+    period: str
+    key: str
+    total_orders: int
+    gmv: float
+    active_tenants: int
+    top_tenants: List[TenantVolume]
+    page: int
+    page_size: int
+
 # ===== WEBHOOK MODELS =====
 class WebhookEvent(BaseModel):
     event_type: str
@@ -357,6 +434,8 @@ class PushSubscription(BaseModel):
     endpoint: str
     keys: Dict[str, str]
     user_agent: Optional[str] = ""
+    restaurant_slug: Optional[str] = None
+    topics: List[PushTopic] = [PushTopic.ORDER_UPDATES, PushTopic.PROMOS]
 
 class PushNotification(BaseModel):
     title: str
@@ -369,4 +448,18 @@ class PushNotificationCreate(BaseModel):
     title: str
     body: str
     icon: Optional[str] = ""
-    url: Optional[str] = ""
\ No newline at end of file
+    url: Optional[str] = ""
+    topic: PushTopic = PushTopic.PROMOS
+
+class PushJobStatus(BaseModel):
+    id: str
+    title: str
+    status: str
+    total: int
+    sent: int
+    failed: int
+    gone: int
+    pending: int
+    created_at: datetime
+    updated_at: datetime
+    completed_at: Optional[datetime] = None
@@ -0,0 +1,519 @@
+# monitoring.py
+"""In-process metrics (per worker process): MongoDB driver, HTTP requests,
+event-loop lag and caches, exposed in Prometheus text format by ``render_metrics``."""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from pymongo import monitoring
+
+from cache import InvalidationEvent
+from config import settings
+from timing import record
+
+logger = logging.getLogger(__name__)
+
+# Seconds; tuned for connection checkout waits (sub-millisecond when the pool is healthy)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    """Fixed-bucket histogram, safe to update from driver threads"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Dict:
+        """Cumulative bucket counts keyed by upper bound"""
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative: List = []
+        running = 0
+        for bound, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage and checkout waits"""
+
+    def __init__(self):
+        self.checkout_wait = Histogram()
+        self.open = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_errors = 0
+        self.pool_clears = 0
+        self._lock = threading.Lock()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            else:
+                self.checkout_errors += 1
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            self.checkout_wait.observe(duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            self.checkout_wait.observe(duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = {
+                "pid": os.getpid(),
+                "open": self.open,
+                "in_use": self.in_use,
+                "idle": max(0, self.open - self.in_use),
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_errors": self.checkout_errors,
+                "pool_clears": self.pool_clears,
+            }
+        stats["checkout_wait_seconds"] = self.checkout_wait.snapshot()
+        return stats
+
+pool_metrics = PoolMetricsListener()
+
+# Commands that say nothing about query performance
+IGNORED_COMMANDS = {
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "saslStart", "saslContinue",
+    "endSessions", "killCursors", "abortTransaction", "commitTransaction"
+}
+
+# Fields copied from a sampled command to re-run it under explain
+EXPLAIN_FIELDS = {
+    "find": ("filter", "sort", "projection", "limit", "skip", "hint"),
+    "aggregate": ("pipeline", "hint"),
+    "count": ("query", "hint"),
+    "distinct": ("key", "query"),
+}
+
+MAX_SHAPES = 500
+
+def query_shape(value):
+    """Replace literal values with '?' keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and value and all(isinstance(item, dict) for item in value):
+        return [query_shape(item) for item in value]  # $and/$or branches, pipeline stages
+    return "?"
+
+def command_shape(command_name: str, command: dict) -> str:
+    """Normalized, literal-free description of a command"""
+    if command_name == "find":
+        shape = {"filter": query_shape(command.get("filter", {}))}
+        if command.get("sort"):
+            shape["sort"] = list(command["sort"].keys())
+    elif command_name == "aggregate":
+        shape = {"pipeline": query_shape(command.get("pipeline", []))}
+    elif command_name in ("count", "distinct"):
+        shape = {"query": query_shape(command.get("query", {}))}
+    elif command_name == "update":
+        shape = {"q": query_shape(command["updates"][0].get("q", {}))} if command.get("updates") else {}
+    elif command_name == "delete":
+        shape = {"q": query_shape(command["deletes"][0].get("q", {}))} if command.get("deletes") else {}
+    elif command_name == "findAndModify":
+        shape = {"query": query_shape(command.get("query", {}))}
+    else:
+        return ""
+    return json.dumps(shape, default=str)
+
+def _command_collection(command_name: str, command: dict) -> str:
+    target = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+class CommandStats:
+    def __init__(self, collection: str, command_name: str, shape: str):
+        self.collection = collection
+        self.command_name = command_name
+        self.shape = shape
+        self.latency = Histogram()
+        self.failures = 0
+        self.max_seconds = 0.0
+        self.sample = None  # Slowest explainable command seen
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Latency per collection and command shape, with a slow-query log"""
+
+    def __init__(self, slow_threshold_ms: float = 100.0):
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.stats: Dict[tuple, CommandStats] = {}
+        self._inflight: Dict[tuple, tuple] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        collection = _command_collection(event.command_name, command)
+        shape = command_shape(event.command_name, command)
+
+        sample = None
+        if event.command_name in EXPLAIN_FIELDS:
+            sample = {event.command_name: collection}
+            for field in EXPLAIN_FIELDS[event.command_name]:
+                if field in command:
+                    sample[field] = command[field]
+            if event.command_name == "aggregate":
+                sample["cursor"] = {}
+
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = (
+                collection, event.command_name, shape, event.database_name, sample
+            )
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            inflight = self._inflight.pop((event.connection_id, event.request_id), None)
+        if not inflight:
+            return
+        collection, command_name, shape, database_name, sample = inflight
+        seconds = event.duration_micros / 1_000_000
+        record("db", seconds)
+
+        key = (collection, command_name, shape)
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                if len(self.stats) >= MAX_SHAPES:
+                    key = (collection, command_name, "other")
+                    stats = self.stats.get(key)
+                if stats is None:
+                    stats = self.stats[key] = CommandStats(*key)
+            if failed:
+                stats.failures += 1
+            if seconds > stats.max_seconds:
+                stats.max_seconds = seconds
+                if sample:
+                    stats.sample = (database_name, sample)
+        stats.latency.observe(seconds)
+
+        if seconds >= self.slow_threshold:
+            logger.warning(
+                f"Slow query {seconds * 1000:.1f}ms {database_name}.{collection} {command_name} {shape}"
+            )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def worst(self, limit: int = 20, order_by: str = "total") -> List[CommandStats]:
+        """Shapes with the most total (or maximum) time"""
+        with self._lock:
+            stats = list(self.stats.values())
+        if order_by == "max":
+            stats.sort(key=lambda item: item.max_seconds, reverse=True)
+        else:
+            stats.sort(key=lambda item: item.latency.sum, reverse=True)
+        return stats[:limit]
+
+def find_stages(plan, stages=None, in_winning_plan: bool = False) -> List[str]:
+    """Stage names of the winning plans in an explain result (rejected plans are skipped)"""
+    if stages is None:
+        stages = []
+    if isinstance(plan, dict):
+        if in_winning_plan and "stage" in plan:
+            stages.append(plan["stage"])
+        for key, value in plan.items():
+            if key == "rejectedPlans":
+                continue
+            find_stages(value, stages, in_winning_plan or key == "winningPlan")
+    elif isinstance(plan, list):
+        for item in plan:
+            find_stages(item, stages, in_winning_plan)
+    return stages
+
+async def explain_sample(client, stats: CommandStats) -> Dict:
+    """Run explain (queryPlanner) on the slowest sampled command of a shape"""
+    if not stats.sample:
+        return {}
+    database_name, command = stats.sample
+    result = await client[database_name].command({"explain": command, "verbosity": "queryPlanner"})
+    stages = find_stages(result)
+    return {"stages": stages, "collscan": "COLLSCAN" in stages}
+
+command_metrics = CommandMetricsListener(settings.mongo_slow_query_ms)
+
+# ===== HTTP requests =====
+
+# Seconds; request latency and event-loop lag
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+NO_TENANT = "-"
+OTHER_TENANTS = "_other"  # Tenants beyond the cap, or slugs not resolved to a restaurant
+
+class RequestStats:
+    def __init__(self):
+        self.latency = Histogram(REQUEST_BUCKETS)
+        self.statuses = [0] * len(STATUS_CLASSES)
+
+class KnownTenants:
+    """Slugs of every restaurant, loaded at startup and kept current by the invalidation bus.
+
+    Restaurants are soft-deleted, so slugs are only ever added; a reset of the
+    bus (events may have been missed) reloads the set in the background.
+    """
+
+    def __init__(self):
+        self.slugs: Set[str] = set()
+        self._db = None
+        self._reload: Optional[asyncio.Task] = None
+
+    async def load(self, db):
+        self._db = db
+        self.slugs = {restaurant["slug"] async for restaurant in db.restaurants.find({}, {"slug": 1})}
+        logger.info(f"Loaded {len(self.slugs)} tenant slugs")
+
+    async def _reload_in_background(self):
+        try:
+            await self.load(self._db)
+        except Exception as e:
+            logger.error(f"Could not reload tenant slugs: {e}")
+
+    def handle(self, event: InvalidationEvent):
+        """Invalidation bus handler for the restaurants collection"""
+        if event.operation == "reset":
+            if self._db is not None:
+                self._reload = asyncio.create_task(self._reload_in_background())
+        elif event.restaurant_slug:
+            self.add(event.restaurant_slug)
+
+    def add(self, slug: str):
+        """Known right away in the worker that created it; others learn it from the bus"""
+        self.slugs.add(slug)
+
+    def __contains__(self, slug: str) -> bool:
+        return slug in self.slugs
+
+known_tenants = KnownTenants()
+
+class RequestMetrics:
+    """Request count, latency and status classes per method, route template and tenant.
+
+    Tenant labels are capped at ``max_tenants`` distinct slugs. A slug only
+    takes a slot once ``is_tenant`` confirms it is a restaurant (by default:
+    it is in ``known_tenants``, the same set in every worker), so made-up
+    slugs cannot use up the cap whatever status they get. Updated from the
+    event loop only.
+    """
+
+    def __init__(self, max_tenants: int, is_tenant: Optional[Callable[[str], bool]] = None):
+        self.max_tenants = max_tenants
+        self.is_tenant = is_tenant or known_tenants.__contains__
+        self.tenants: Set[str] = set()
+        self.stats: Dict[tuple, RequestStats] = {}
+
+    def tenant_label(self, slug: Optional[str]) -> str:
+        if slug is None:
+            return NO_TENANT
+        if slug in self.tenants:
+            return slug
+        if len(self.tenants) < self.max_tenants and self.is_tenant(slug):
+            self.tenants.add(slug)
+            return slug
+        return OTHER_TENANTS
+
+    def observe(self, method: str, route: str, slug: Optional[str], status_code: int, seconds: float):
+        key = (method, route, self.tenant_label(slug))
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = RequestStats()
+        stats.statuses[min(max(status_code // 100, 1), 5) - 1] += 1
+        stats.latency.observe(seconds)
+
+class MetricsMiddleware:
+    """Records every HTTP request in ``request_metrics`` (route template, tenant slug, status)"""
+
+    def __init__(self, app, metrics: Optional[RequestMetrics] = None):
+        self.app = app
+        self.metrics = metrics or request_metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            self.metrics.observe(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                scope.get("path_params", {}).get("slug"),
+                status_code,
+                time.perf_counter() - started
+            )
+
+request_metrics = RequestMetrics(settings.metrics_max_tenants)
+
+# ===== Event loop =====
+
+class LoopLagMonitor:
+    """How late a periodic timer fires: time the loop spent blocked by other work"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = Histogram(LOOP_LAG_BUCKETS)
+        self.last = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.perf_counter() - expected)
+            self.lag.observe(self.last)
+
+loop_lag = LoopLagMonitor(settings.metrics_loop_lag_interval_seconds)
+
+# ===== Exposition =====
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + "}"
+
+class _Exposition:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_text: str):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value, **labels):
+        self.lines.append(f"{name}{_labels(**labels)} {value}")
+
+    def histogram(self, name: str, snapshot: Dict, **labels):
+        for bound, count in snapshot["buckets"]:
+            self.sample(f"{name}_bucket", count, **labels, le=bound)
+        self.sample(f"{name}_sum", snapshot["sum"], **labels)
+        self.sample(f"{name}_count", snapshot["count"], **labels)
+
+def render_metrics(caches: Sequence = (), flights: Sequence = ()) -> str:
+    """This worker's metrics in Prometheus text exposition format"""
+    out = _Exposition()
+
+    requests = list(request_metrics.stats.items())
+    out.family("http_requests_total", "counter", "HTTP requests by route template, tenant and status class")
+    for (method, route, tenant), stats in requests:
+        for status_class, count in zip(STATUS_CLASSES, stats.statuses):
+            if count:
+                out.sample("http_requests_total", count, method=method, route=route, tenant=tenant, status=status_class)
+    out.family("http_request_duration_seconds", "histogram", "HTTP request latency")
+    for (method, route, tenant), stats in requests:
+        out.histogram("http_request_duration_seconds", stats.latency.snapshot(), method=method, route=route, tenant=tenant)
+
+    out.family("event_loop_lag_seconds", "histogram", "Delay of a periodic event-loop timer")
+    out.histogram("event_loop_lag_seconds", loop_lag.lag.snapshot())
+    out.family("event_loop_lag_last_seconds", "gauge", "Last measured event-loop lag")
+    out.sample("event_loop_lag_last_seconds", loop_lag.last)
+
+    pool = pool_metrics.snapshot()
+    out.family("mongodb_pool_connections", "gauge", "MongoDB pool connections by state")
+    for state in ("open", "in_use", "idle"):
+        out.sample("mongodb_pool_connections", pool[state], state=state)
+    for field in ("checkouts", "checkout_timeouts", "checkout_errors", "clears"):
+        value = pool["pool_clears" if field == "clears" else field]
+        out.family(f"mongodb_pool_{field}_total", "counter", f"MongoDB pool {field.replace('_', ' ')}")
+        out.sample(f"mongodb_pool_{field}_total", value)
+    out.family("mongodb_pool_checkout_wait_seconds", "histogram", "Wait for a pooled connection")
+    out.histogram("mongodb_pool_checkout_wait_seconds", pool["checkout_wait_seconds"])
+
+    cache_stats = [cache.stats() for cache in caches]
+    for field, kind in (("hits", "counter"), ("misses", "counter"), ("invalidations", "counter"),
+                        ("entries", "gauge"), ("hit_ratio", "gauge")):
+        name = f"cache_{field}_total" if kind == "counter" else f"cache_{field}"
+        out.family(name, kind, f"Local cache {field.replace('_', ' ')}")
+        for stats in cache_stats:
+            out.sample(name, stats[field], cache=stats["name"])
+
+    flight_stats = [flight.stats() for flight in flights]
+    for field, help_text in (("calls", "Reads that went to the database"), ("shared", "Reads that joined one in flight")):
+        out.family(f"singleflight_{field}_total", "counter", help_text)
+        for stats in flight_stats:
+            out.sample(f"singleflight_{field}_total", stats[field], group=stats["name"])
+
+    return "\n".join(out.lines) + "\n"
@@ -0,0 +1,306 @@
+# outbox.py
+"""Durable notification outbox.
+
+Admin sends create a job in ``push_jobs``. A worker expands the job into one
+``push_deliveries`` document per subscriber (checkpointed, so expansion resumes
+after a restart) and then delivers them in leased batches. Failed deliveries
+are retried with exponential backoff and full jitter; deliveries whose lease
+expires (worker crashed) are picked up again by any worker.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from config import settings
+from database import get_collection, to_object_id
+from webpush import UNDELIVERABLE, WebPushSender
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+class HostRateLimiter:
+    """Token bucket per push service host (per worker process)"""
+
+    def __init__(self, rate_per_second: float):
+        self.rate = rate_per_second
+        self.buckets: Dict[str, tuple] = {}
+
+    async def acquire(self, host: str):
+        while True:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(host, (self.rate, now))
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets[host] = (tokens - 1, now)
+                return
+            self.buckets[host] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter"""
+    ceiling = min(settings.outbox_max_delay_seconds, settings.outbox_base_delay_seconds * 2 ** attempts)
+    return random.uniform(0, ceiling)
+
+class NotificationOutbox:
+    def __init__(self, sender: Optional[WebPushSender] = None):
+        self.jobs_collection = get_collection("push_jobs")
+        self.deliveries_collection = get_collection("push_deliveries")
+        self.subscriptions_collection = get_collection("push_subscriptions")
+        self.sender = sender
+        self.rate_limiter = HostRateLimiter(settings.push_host_rate_per_second)
+        self._payloads: Dict[ObjectId, Tuple[bytes, str]] = {}
+
+    async def enqueue(
+        self,
+        payload: bytes,
+        title: str,
+        audience: Optional[dict] = None,
+        urgency: str = "normal",
+        restaurant_slug: Optional[str] = None
+    ) -> str:
+        """Create a push job (owned by a restaurant, None for platform broadcasts) and return its id"""
+        now = datetime.utcnow()
+        job_doc = {
+            "title": title,
+            "restaurant_slug": restaurant_slug,
+            "payload": payload,
+            "urgency": urgency,
+            "audience": audience or {},
+            "status": "queued",
+            "expanded_after": None,
+            "total": 0,
+            "sent": 0,
+            "failed": 0,
+            "gone": 0,
+            "locked_until": EPOCH,
+            "created_at": now,
+            "updated_at": now,
+            "completed_at": None
+        }
+        result = await self.jobs_collection.insert_one(job_doc)
+        return str(result.inserted_id)
+
+    async def get_job(self, job_id: str, restaurant_slug: Optional[str] = None) -> Optional[dict]:
+        """Get a job with its delivery counters (only the restaurant's own jobs if a slug is given)"""
+        query = {"_id": to_object_id(job_id)}
+        if restaurant_slug:
+            query["restaurant_slug"] = restaurant_slug
+        job = await self.jobs_collection.find_one(query, {"payload": 0})
+        if not job:
+            return None
+        job["id"] = str(job["_id"])
+        job["pending"] = max(0, job["total"] - job["sent"] - job["failed"] - job["gone"])
+        return job
+
+    async def expand_next_job(self) -> bool:
+        """Materialize deliveries for one queued job, resuming from its checkpoint"""
+        now = datetime.utcnow()
+        job = await self.jobs_collection.find_one_and_update(
+            {"status": {"$in": ["queued", "expanding"]}, "locked_until": {"$lte": now}},
+            {"$set": {
+                "status": "expanding",
+                "locked_until": now + timedelta(seconds=settings.outbox_lease_seconds)
+            }}
+        )
+        if not job:
+            return False
+
+        query = job["audience"]
+        if job["expanded_after"]:
+            query = {"$and": [query, {"_id": {"$gt": job["expanded_after"]}}]}
+
+        cursor = self.subscriptions_collection.find(query, {"endpoint": 1, "keys": 1}) \
+            .sort("_id", 1).batch_size(settings.push_batch_size)
+
+        batch = []
+        async for subscription in cursor:
+            batch.append(subscription)
+            if len(batch) >= settings.push_batch_size:
+                await self._insert_deliveries(job["_id"], batch)
+                batch = []
+        if batch:
+            await self._insert_deliveries(job["_id"], batch)
+
+        await self.jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "sending", "locked_until": EPOCH, "updated_at": datetime.utcnow()}}
+        )
+        await self._complete_if_done(job["_id"])
+        return True
+
+    async def _insert_deliveries(self, job_id: ObjectId, subscriptions: list):
+        deliveries = [
+            {
+                "job_id": job_id,
+                "subscription_id": subscription["_id"],
+                "endpoint": subscription["endpoint"],
+                "host": urlparse(subscription["endpoint"]).netloc,
+                "keys": subscription["keys"],
+                "status": "pending",
+                "attempts": 0,
+                "last_status": None,
+                "next_attempt_at": EPOCH,
+                "locked_until": EPOCH
+            }
+            for subscription in subscriptions
+        ]
+        inserted = len(deliveries)
+        try:
+            await self.deliveries_collection.insert_many(deliveries, ordered=False)
+        except BulkWriteError as e:
+            # Deliveries already created before a restart
+            inserted = e.details["nInserted"]
+
+        now = datetime.utcnow()
+        await self.jobs_collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "expanded_after": subscriptions[-1]["_id"],
+                    "locked_until": now + timedelta(seconds=settings.outbox_lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"total": inserted}
+            }
+        )
+
+    async def _claim_due(self) -> list:
+        """Lease a batch of due deliveries to this worker"""
+        now = datetime.utcnow()
+        due = {"status": "pending", "next_attempt_at": {"$lte": now}, "locked_until": {"$lte": now}}
+        candidates = await self.deliveries_collection.find(due, {"_id": 1}) \
+            .limit(settings.push_batch_size).to_list(length=settings.push_batch_size)
+        if not candidates:
+            return []
+
+        lock = ObjectId()
+        await self.deliveries_collection.update_many(
+            {**due, "_id": {"$in": [candidate["_id"] for candidate in candidates]}},
+            {"$set": {"lock": lock, "locked_until": now + timedelta(seconds=settings.outbox_lease_seconds)}}
+        )
+        return await self.deliveries_collection.find({"lock": lock}).to_list(length=None)
+
+    async def _payload(self, job_id: ObjectId) -> Tuple[bytes, str]:
+        if job_id not in self._payloads:
+            job = await self.jobs_collection.find_one({"_id": job_id}, {"payload": 1, "urgency": 1})
+            self._payloads[job_id] = (job["payload"], job.get("urgency", "normal")) if job else (b"", "normal")
+        return self._payloads[job_id]
+
+    async def process_due(self) -> int:
+        """Deliver one leased batch; returns the number of deliveries attempted"""
+        deliveries = await self._claim_due()
+        if not deliveries:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.sender.concurrency)
+        results = {}
+
+        async def deliver(delivery: dict):
+            async with semaphore:
+                await self.rate_limiter.acquire(delivery["host"])
+                payload, urgency = await self._payload(delivery["job_id"])
+                results[delivery["_id"]] = await self.sender.send(delivery, payload, urgency)
+
+        await asyncio.gather(*[deliver(delivery) for delivery in deliveries])
+
+        now = datetime.utcnow()
+        job_counters: Dict[ObjectId, Dict[str, int]] = {}
+
+        async def finish(delivery: dict):
+            status_code = results[delivery["_id"]]
+            attempts = delivery["attempts"] + 1
+            update = {"attempts": attempts, "last_status": status_code, "locked_until": EPOCH}
+
+            if 200 <= status_code < 300:
+                update["status"] = "sent"
+            elif status_code in (404, 410):
+                update["status"] = "gone"
+            elif status_code == UNDELIVERABLE or (400 <= status_code < 500 and status_code != 429):
+                update["status"] = "failed"  # Retrying won't help (bad request, payload too large)
+            elif attempts >= settings.outbox_max_attempts:
+                update["status"] = "failed"
+            else:
+                update["next_attempt_at"] = now + timedelta(seconds=retry_delay(attempts))
+
+            async with semaphore:
+                result = await self.deliveries_collection.update_one(
+                    {"_id": delivery["_id"], "lock": delivery["lock"]},
+                    {"$set": update, "$unset": {"lock": ""}}
+                )
+            # The lease expired and another worker re-claimed it: that worker counts it
+            if result.matched_count and "status" in update:
+                counters = job_counters.setdefault(delivery["job_id"], {})
+                counters[update["status"]] = counters.get(update["status"], 0) + 1
+
+        await asyncio.gather(*[finish(delivery) for delivery in deliveries])
+
+        # 404/410 mean the browser dropped the subscription, stop sending to it
+        gone = [
+            delivery["subscription_id"] for delivery in deliveries
+            if results[delivery["_id"]] in (404, 410)
+        ]
+        if gone:
+            await self.subscriptions_collection.delete_many({"_id": {"$in": gone}})
+            logger.info(f"Pruned {len(gone)} expired push subscriptions")
+        for job_id, counters in job_counters.items():
+            await self.jobs_collection.update_one(
+                {"_id": job_id},
+                {"$inc": counters, "$set": {"updated_at": now}}
+            )
+            await self._complete_if_done(job_id)
+
+        return len(deliveries)
+
+    async def _complete_if_done(self, job_id: ObjectId):
+        pending = await self.deliveries_collection.find_one(
+            {"job_id": job_id, "status": "pending"}, {"_id": 1}
+        )
+        if pending:
+            return
+        now = datetime.utcnow()
+        result = await self.jobs_collection.update_one(
+            {"_id": job_id, "status": "sending"},
+            {"$set": {"status": "completed", "completed_at": now, "updated_at": now}}
+        )
+        if result.modified_count:
+            self._payloads.pop(job_id, None)
+            logger.info(f"Push job {job_id} completed")
+
+class OutboxWorker:
+    """Background loop expanding and delivering push jobs"""
+
+    def __init__(self, outbox: NotificationOutbox):
+        self.outbox = outbox
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while not self._stopping:
+            processed = 0
+            try:
+                await self.outbox.expand_next_job()
+                processed = await self.outbox.process_due()
+            except Exception as e:
+                logger.error(f"Error processing push outbox: {e}")
+            if not processed:
+                await asyncio.sleep(settings.outbox_poll_interval_seconds)
@@ -0,0 +1,133 @@
+# profiling.py
+"""On-demand profiling of single requests against real data.
+
+A superadmin sends ``X-Profile: 1`` with its bearer token; the request runs
+under cProfile and its statistics are stored in the ``profiles`` collection
+(kept 24 hours), downloadable from ``/superadmin/profiles/{id}`` as a
+``.prof`` file (``pstats``, snakeviz) or as a text summary. The response
+carries the id in ``X-Profile-Id``.
+
+cProfile sees the whole event loop while it is enabled, so requests served
+concurrently are profiled (and slowed down) too. Hence one profile at a time
+per worker and a global limit of ``PROFILING_MAX_PER_WINDOW`` profiles per
+window of ``PROFILING_WINDOW_SECONDS`` across all workers, counted in one
+``profiling_slots`` document per window and reserved before the request runs;
+requests over the limit get a 429 and are not run.
+"""
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from config import settings
+from database import get_collection
+from dependencies import superadmin_claims
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+SUMMARY_LINES = 60
+MAX_STATS_BYTES = 8 * 1024 * 1024  # Larger dumps keep only the text summary
+
+def summarize(stats: pstats.Stats) -> str:
+    """Top functions by cumulative time"""
+    out = io.StringIO()
+    stats.stream = out
+    stats.sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    return out.getvalue()
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._busy = False  # One profile at a time in this worker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(key == b"x-profile" for key, _ in scope["headers"]):
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        claims = superadmin_claims(request) if request.headers.get(PROFILE_HEADER) == "1" else None
+        if claims is None:
+            return await self.app(scope, receive, send)
+
+        # Test and take the slot with no await in between, then reserve a global one holding it
+        if self._busy:
+            return await self.reject(scope, receive, send)
+        self._busy = True
+        try:
+            if not await self.reserve():
+                return await self.reject(scope, receive, send)
+
+            profile_id = ObjectId()
+            status_code = 500
+
+            async def send_with_id(message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    MutableHeaders(scope=message)["x-profile-id"] = str(profile_id)
+                await send(message)
+
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                profiler.disable()
+                duration = time.perf_counter() - started
+                await self.save(profile_id, request, claims, status_code, duration, profiler)
+        finally:
+            self._busy = False
+
+    async def reject(self, scope, receive, send):
+        response = JSONResponse(
+            {"detail": "Límite de perfilado alcanzado, reintentar más tarde"},
+            status_code=429,
+            headers={"Retry-After": str(settings.profiling_window_seconds)}
+        )
+        await response(scope, receive, send)
+
+    async def reserve(self) -> bool:
+        """Take one of the current window's profiles, across workers, in a single update"""
+        window = settings.profiling_window_seconds
+        started = int(time.time()) // window * window
+        try:
+            await get_collection("profiling_slots").update_one(
+                {"_id": started, "taken": {"$lt": settings.profiling_max_per_window}},
+                {
+                    "$inc": {"taken": 1},
+                    "$setOnInsert": {"expires_at": datetime.utcfromtimestamp(started + window)}
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False  # The window is full: the upsert ran into its document
+        return True
+
+    async def save(self, profile_id, request: Request, claims: dict, status_code: int, duration: float, profiler):
+        try:
+            stats = pstats.Stats(profiler)
+            dump = marshal.dumps(stats.stats)
+            await get_collection("profiles").insert_one({
+                "_id": profile_id,
+                "method": request.method,
+                "path": request.url.path,
+                "query": request.url.query,
+                "status_code": status_code,
+                "duration_ms": duration * 1000,
+                "username": claims.get("username"),
+                "summary": summarize(stats),
+                "stats": dump if len(dump) <= MAX_STATS_BYTES else None,
+                "created_at": datetime.utcnow()
+            })
+        except Exception as e:
+            logger.error(f"Error saving profile {profile_id}: {e}")
@@ -0,0 +1,56 @@
+# provision_tenants.py
+"""Bulk tenant provisioning from a file.
+
+Each restaurant (with its admin user and default categories) is created in
+its own transaction; tenants run in parallel, and slugs that already exist
+are reported and skipped, so a partially failed file can simply be rerun.
+
+    python provision_tenants.py franquicia.jsonl      # one RestaurantCreate JSON per line
+    python provision_tenants.py franquicia.csv --concurrency 32
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import time
+from collections import Counter
+from typing import List
+
+from config import settings
+from models import RestaurantCreate
+
+def load_restaurants(path: str) -> List[RestaurantCreate]:
+    """Read RestaurantCreate rows from a .csv (header row) or JSON lines file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            rows = [{key: value for key, value in row.items() if value != ""} for row in csv.DictReader(f)]
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [RestaurantCreate(**row) for row in rows]
+
+async def main():
+    parser = argparse.ArgumentParser(description="Provision restaurants in bulk")
+    parser.add_argument("path")
+    parser.add_argument("--concurrency", type=int, default=settings.provisioning_concurrency)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    restaurants = load_restaurants(args.path)
+
+    from database import init_db, close_db
+    from services import RestaurantService
+    await init_db()
+    try:
+        started = time.monotonic()
+        results = await RestaurantService().provision_many(restaurants, concurrency=args.concurrency)
+        for result in results:
+            if result["status"] == "failed":
+                print(json.dumps(result))
+        counts = Counter(result["status"] for result in results)
+        print(f"{len(results)} restaurants in {time.monotonic() - started:.1f}s: {dict(counts)}")
+    finally:
+        await close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
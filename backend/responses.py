@@ -0,0 +1,199 @@
+# responses.py
+"""Fast response path and content negotiation for API payloads.
+
+Services build their response models once, from the database document, and
+routes return them wrapped in ``ModelResponse``: FastAPI then skips the second
+``response_model`` validation and ``jsonable_encoder``, and the models are
+rendered straight to bytes by pydantic-core. ``response_model`` stays on the
+route for the OpenAPI docs.
+
+``CODECS`` maps media types to codecs. ``CodecMiddleware`` picks the response
+codec from the ``Accept`` header (JSON unless the client asks otherwise) for
+every ``ModelResponse`` of the request, and turns request bodies sent in a
+registered non-JSON media type into JSON before FastAPI parses them, so the
+same models validate both.
+
+``cached_response`` keeps whole response bodies (per codec, with their
+compressed variants) in ``response_cache`` until the invalidation bus drops
+them. Loads behind it read the primary, so a body cached after an invalidation
+never holds the document from before the write.
+"""
+import contextvars
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Type
+
+import msgpack
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json, to_jsonable_python
+from starlette.requests import Request
+from starlette.responses import Response
+
+from cache import catalog_flight, response_cache
+from compression import CompressedBody
+from timing import span
+
+def _fallback(value: Any) -> str:
+    """ObjectId and other BSON scalars left in plain dict content"""
+    return str(value)
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def render_json(content: Any) -> bytes:
+    """Serialize a model, a list of models or plain data in pydantic-core"""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content, fallback=_fallback)
+    if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+        return _list_adapter(type(content[0])).dump_json(content, fallback=_fallback)
+    return to_json(content, fallback=_fallback)
+
+def to_builtins(content: Any) -> Any:
+    """The JSON-compatible Python form of a model, a list of models or plain data"""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_python(content, mode="json", fallback=_fallback)
+    if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+        return _list_adapter(type(content[0])).dump_python(content, mode="json", fallback=_fallback)
+    return to_jsonable_python(content, fallback=_fallback)
+
+# ===== Codecs =====
+
+@dataclass(frozen=True)
+class Codec:
+    media_type: str
+    encode: Callable[[Any], bytes]
+    decode: Optional[Callable[[bytes], Any]] = None  # None: FastAPI parses the body itself
+
+def _decode_msgpack(body: bytes) -> Any:
+    return msgpack.unpackb(body, raw=False)
+
+JSON = Codec("application/json", render_json)
+MSGPACK = Codec("application/msgpack", lambda content: msgpack.packb(to_builtins(content)), _decode_msgpack)
+
+CODECS: Dict[str, Codec] = {
+    "application/json": JSON,
+    "application/msgpack": MSGPACK,
+    "application/x-msgpack": MSGPACK,
+}
+
+def register_codec(codec: Codec, *aliases: str):
+    for media_type in (codec.media_type, *aliases):
+        CODECS[media_type] = codec
+
+def negotiate(accept: Optional[str]) -> Codec:
+    """Best registered codec for an Accept header (highest q, then header order)"""
+    best, best_q = JSON, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = [item.strip() for item in part.split(";")]
+        codec = CODECS.get(media_type.lower())
+        if codec is None:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = codec, q
+    return best
+
+_response_codec: contextvars.ContextVar[Codec] = contextvars.ContextVar("response_codec", default=JSON)
+
+class ModelResponse(Response):
+    """Response in the negotiated codec that bypasses response_model re-validation"""
+
+    def __init__(self, content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+        self.codec = _response_codec.get()
+        self.media_type = self.codec.media_type
+        super().__init__(content, status_code, headers)
+        self.headers["vary"] = "Accept"
+
+    def render(self, content: Any) -> bytes:
+        with span("render"):
+            return self.codec.encode(content)
+
+async def cached_response(
+    request: Request,
+    key: Hashable,
+    load: Callable[[], Awaitable[Any]],
+    tags: Iterable[Hashable] = ()
+) -> Response:
+    """Serve a cached body for ``key``, rendering ``load()`` on a miss"""
+    codec = _response_codec.get()
+    key = (key, codec.media_type)
+    tags = tuple(tags)
+    body = response_cache.get(key)
+    if body is None:
+        async def render():
+            # A body loaded across an invalidation is served but not kept
+            version = response_cache.version(tags)
+            content = await load()
+            with span("render"):
+                body = CompressedBody(codec.encode(content), codec.media_type)
+            response_cache.set(key, body, tags, version=version)
+            return body
+        body = await catalog_flight.do(("response", key), render)  # One render per concurrent miss
+    return body.response(request.headers.get("accept-encoding"))
+
+# ===== Middleware =====
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+class CodecMiddleware:
+    """Negotiate the response codec and transcode non-JSON request bodies to JSON"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = _response_codec.set(negotiate(_header(scope, b"accept")))
+        try:
+            content_type = (_header(scope, b"content-type") or "").split(";")[0].strip().lower()
+            codec = CODECS.get(content_type)
+            if codec is not None and codec.decode is not None:
+                transcoded = await self._transcode(scope, receive, codec)
+                if transcoded is None:
+                    response = Response(b'{"detail":"Invalid request body"}', 400, media_type="application/json")
+                    return await response(scope, receive, send)
+                scope, receive = transcoded
+            await self.app(scope, receive, send)
+        finally:
+            _response_codec.reset(token)
+
+    async def _transcode(self, scope, receive, codec: Codec):
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return None
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        try:
+            body = to_json(codec.decode(b"".join(chunks)), fallback=_fallback)
+        except Exception:
+            return None
+
+        headers = [(k, v) for k, v in scope["headers"] if k not in (b"content-type", b"content-length")]
+        headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        scope["headers"] = headers  # In place: outer middleware reads the matched route from this scope
+        return scope, replay
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from models import DashboardAnalytics
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from models import DashboardAnalytics, PlatformAnalytics
+from typing import Optional
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from config import settings
 from dependencies import get_current_user
+from responses import ModelResponse
 
 router = APIRouter()
 
@@ -15,4 +20,27 @@ async def get_dashboard_analytics(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
     analytics = await request.app.state.order_service.get_dashboard_analytics(slug)
+    return ModelResponse(analytics)
+
+@router.get("/superadmin/analytics", response_model=PlatformAnalytics)
+async def get_platform_analytics(
+    request: Request,
+    period: str = Query("day", pattern="^(day|month)$"),
+    key: Optional[str] = Query(None, description="YYYY-MM-DD para day, YYYY-MM para month"),
+    sort_by: str = Query("orders", pattern="^(orders|revenue)$"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """Obtener analíticas de toda la plataforma (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    if key is None:
+        # Las rollups usan la fecha local de cada restaurante, no la UTC
+        key = datetime.now(ZoneInfo(settings.platform_timezone)).strftime("%Y-%m-%d" if period == "day" else "%Y-%m")
+    
+    analytics = await request.app.state.rollup_service.get_platform_analytics(
+        period, key, sort_by, page, page_size
+    )
     return analytics
@@ -1,15 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from models import CategoryResponse, CategoryCreate, CategoryUpdate
-from typing import List
+from typing import List, Optional
 from dependencies import get_current_user
+from responses import ModelResponse, cached_response
+from fieldsets import parse_fields
 
 router = APIRouter()
 
 @router.get("/api/{slug}/categories", response_model=List[CategoryResponse])
-async def get_categories(request: Request, slug: str):
-    """Obtener categorías del restaurante"""
-    categories = await request.app.state.category_service.get_categories_by_restaurant(slug)
-    return categories
+async def get_categories(request: Request, slug: str, fields: Optional[str] = None):
+    """Obtener categorías del restaurante (?fields= para devolver solo esos campos)"""
+    fields = parse_fields(CategoryResponse, fields)
+    async def load():
+        if not await request.app.state.restaurant_service.get_by_slug(slug, read_policy="catalog"):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurante no encontrado")
+        # Cached until invalidated: read the primary so the fill is never older than the last write
+        return await request.app.state.category_service.get_categories_by_restaurant(slug, fields=fields)
+    return await cached_response(request, ("categories", slug, fields), load, tags=[("restaurant", slug)])
 
 @router.post("/api/{slug}/categories", response_model=CategoryResponse)
 async def create_category(
@@ -40,7 +47,7 @@ async def update_category(
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    updated = await request.app.state.category_service.update_category(category_id, category_data)
+    updated = await request.app.state.category_service.update_category(category_id, slug, category_data)
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     return {"message": "Categoría actualizada"}
@@ -56,7 +63,7 @@ async def delete_category(
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    deleted = await request.app.state.category_service.delete_category(category_id)
+    deleted = await request.app.state.category_service.delete_category(category_id, slug)
     if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     return {"message": "Categoría eliminada"}
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi.responses import PlainTextResponse, Response
+from dependencies import get_current_user
+from database import database, get_collection, to_object_id
+from monitoring import pool_metrics, command_metrics, explain_sample, render_metrics
+from cache import tenant_cache, response_cache, catalog_flight
+from config import settings
+import hmac
+from bson import ObjectId
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """Métricas de este worker en formato de exposición de Prometheus"""
+    if settings.metrics_token:
+        expected = f"Bearer {settings.metrics_token}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    
+    return PlainTextResponse(
+        render_metrics(caches=(tenant_cache, response_cache), flights=(catalog_flight,)),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@router.get("/superadmin/db/pool")
+async def get_pool_metrics(request: Request, current_user: dict = Depends(get_current_user)):
+    """Métricas del pool de conexiones de MongoDB de este worker (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    return pool_metrics.snapshot()
+
+@router.get("/superadmin/db/queries")
+async def get_query_metrics(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    order_by: str = Query("total", pattern="^(total|max)$"),
+    explain: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Consultas más costosas de este worker, opcionalmente con explain (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    queries = []
+    for stats in command_metrics.worst(limit, order_by):
+        latency = stats.latency.snapshot()
+        entry = {
+            "collection": stats.collection,
+            "command": stats.command_name,
+            "shape": stats.shape,
+            "count": latency["count"],
+            "failures": stats.failures,
+            "total_ms": latency["sum"] * 1000,
+            "mean_ms": latency["sum"] * 1000 / latency["count"] if latency["count"] else 0.0,
+            "max_ms": stats.max_seconds * 1000,
+            "latency_seconds": latency["buckets"]
+        }
+        if explain:
+            try:
+                entry["explain"] = await explain_sample(database.client, stats)
+            except Exception as e:
+                logger.warning(f"Explain failed for {stats.collection} {stats.shape}: {e}")
+                entry["explain"] = {"error": str(e)}
+        queries.append(entry)
+    
+    return queries
+
+@router.get("/superadmin/profiles")
+async def list_profiles(request: Request, current_user: dict = Depends(get_current_user)):
+    """Perfiles de requests tomados con X-Profile: 1 (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    cursor = get_collection("profiles").find({}, {"stats": 0, "summary": 0}).sort("created_at", -1).limit(50)
+    profiles = []
+    async for profile in cursor:
+        profile["id"] = str(profile.pop("_id"))
+        profiles.append(profile)
+    return profiles
+
+@router.get("/superadmin/profiles/{profile_id}")
+async def download_profile(
+    request: Request,
+    profile_id: str,
+    format: str = Query("prof", pattern="^(prof|text)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Descargar un perfil: .prof para pstats/snakeviz, o resumen en texto (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    profile = None
+    if ObjectId.is_valid(profile_id):
+        profile = await get_collection("profiles").find_one({"_id": to_object_id(profile_id)})
+    if not profile:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if format == "text" or profile.get("stats") is None:
+        return PlainTextResponse(profile["summary"])
+    return Response(
+        bytes(profile["stats"]),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'}
+    )
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from models import OrderResponse, OrderCreate, OrderStatusUpdate
 from typing import List, Optional
 from dependencies import get_current_user
+from responses import ModelResponse
+from fieldsets import parse_fields
 
 router = APIRouter()
 
@@ -9,7 +11,7 @@ router = APIRouter()
 async def create_order(request: Request, slug: str, order_data: OrderCreate):
     """Crear nuevo pedido"""
     order = await request.app.state.order_service.create_order(slug, order_data)
-    return order
+    return ModelResponse(order)
 
 @router.get("/api/{slug}/orders", response_model=List[OrderResponse])
 async def get_orders(
@@ -17,14 +19,17 @@ async def get_orders(
     slug: str,
     status_filter: Optional[str] = None,
     limit: int = 50,
+    fields: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Obtener pedidos del restaurante"""
+    """Obtener pedidos del restaurante (?fields= para devolver solo esos campos)"""
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    orders = await request.app.state.order_service.get_orders_by_restaurant(slug, status_filter, limit)
-    return orders
+    orders = await request.app.state.order_service.get_orders_by_restaurant(
+        slug, status_filter, limit, fields=parse_fields(OrderResponse, fields)
+    )
+    return ModelResponse(orders)
 
 @router.get("/api/{slug}/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
@@ -40,7 +45,7 @@ async def get_order(
     order = await request.app.state.order_service.get_order_by_id(order_id, slug)
     if not order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    return order
+    return ModelResponse(order)
 
 @router.put("/api/{slug}/orders/{order_id}/status")
 async def update_order_status(
@@ -54,7 +59,7 @@ async def update_order_status(
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    updated = await request.app.state.order_service.update_order_status(order_id, status_data.status)
+    updated = await request.app.state.order_service.update_order_status(order_id, status_data.status, slug)
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     return {"message": "Estado del pedido actualizado"}
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from models import ProductResponse, ProductCreate, ProductUpdate
 from typing import List, Optional
 from dependencies import get_current_user
+from responses import ModelResponse
+from fieldsets import parse_fields
 
 router = APIRouter()
 
@@ -11,24 +13,27 @@ async def get_products(
     slug: str,
     category_id: Optional[str] = None,
     search: Optional[str] = None,
-    popular_only: bool = False
+    popular_only: bool = False,
+    fields: Optional[str] = None
 ):
-    """Obtener productos del restaurante"""
+    """Obtener productos del restaurante (?fields=id,name,price para devolver solo esos campos)"""
+    if not await request.app.state.restaurant_service.get_by_slug(slug, read_policy="catalog"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurante no encontrado")
     products = await request.app.state.product_service.get_products_by_restaurant(
-        slug, category_id, search, popular_only
+        slug, category_id, search, popular_only, fields=parse_fields(ProductResponse, fields)
     )
-    return products
+    return ModelResponse(products)
 
 @router.get("/api/{slug}/products/{product_id}", response_model=ProductResponse)
 async def get_product(request: Request, slug: str, product_id: str):
     """Obtener producto específico"""
-    product = await request.app.state.product_service.get_product_by_id(product_id, slug)
+    product = await request.app.state.product_service.get_product_by_id(product_id, slug, read_policy="catalog")
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
-    return product
+    return ModelResponse(product)
 
 @router.post("/api/{slug}/products", response_model=ProductResponse)
 async def create_product(
@@ -45,7 +50,7 @@ async def create_product(
         )
     
     product = await request.app.state.product_service.create_product(slug, product_data)
-    return product
+    return ModelResponse(product)
 
 @router.put("/api/{slug}/products/{product_id}")
 async def update_product(
@@ -59,7 +64,7 @@ async def update_product(
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    updated = await request.app.state.product_service.update_product(product_id, product_data)
+    updated = await request.app.state.product_service.update_product(product_id, slug, product_data)
     if not updated:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -78,7 +83,7 @@ async def delete_product(
     if current_user["restaurant_slug"] != slug:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
     
-    deleted = await request.app.state.product_service.delete_product(product_id)
+    deleted = await request.app.state.product_service.delete_product(product_id, slug)
     if not deleted:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     return {"message": "Producto eliminado"}
@@ -1,6 +1,8 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from typing import List, Optional
-from models import ProductResponse, CategoryResponse, DeliveryZone, OrderResponse, OrderCreate
+from models import ProductResponse, CategoryResponse, DeliveryZone, OrderResponse, OrderCreate, PushSubscription
+from responses import ModelResponse, cached_response
 
 router = APIRouter()
 
@@ -8,27 +10,33 @@ router = APIRouter()
 @router.get("/api/{slug}/menu", response_model=List[ProductResponse])
 async def get_menu(request: Request, slug: str):
     """Get all available menu items for a restaurant"""
-    products = await request.app.state.product_service.get_products_by_restaurant(slug)
-    return products
+    async def load():
+        if not await request.app.state.restaurant_service.get_by_slug(slug, read_policy="catalog"):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+        # Cached until invalidated: read the primary so the fill is never older than the last write
+        return await request.app.state.product_service.get_products_by_restaurant(slug)
+    return await cached_response(request, ("menu", slug), load, tags=[("restaurant", slug)])
 
 @router.get("/api/{slug}/menu/category/{category_name}", response_model=List[ProductResponse])
 async def get_menu_by_category(request: Request, slug: str, category_name: str):
     """Get menu items by category for a restaurant"""
-    # First, find the category ID by name
-    categories = await request.app.state.category_service.get_categories_by_restaurant(slug)
-    category = next((cat for cat in categories if cat.name.lower() == category_name.lower()), None)
-    
-    if not category:
+    # Products carry the category key, so this is a single indexed query; a soft-deleted
+    # category keeps its products' snapshot, so it is checked alongside
+    products, exists = await asyncio.gather(
+        request.app.state.product_service.get_products_by_restaurant(
+            slug, category_name=category_name, read_policy="catalog"
+        ),
+        request.app.state.category_service.category_exists(slug, category_name, read_policy="catalog")
+    )
+    if not exists:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
-
-    products = await request.app.state.product_service.get_products_by_restaurant(slug, category_id=category.id)
-    return products
+    return ModelResponse(products)
 
 # Public Delivery Zones endpoints
 @router.get("/api/{slug}/delivery-zones", response_model=List[DeliveryZone])
 async def get_delivery_zones(request: Request, slug: str):
     """Get all active delivery zones for a restaurant"""
-    restaurant = await request.app.state.restaurant_service.get_by_slug(slug)
+    restaurant = await request.app.state.restaurant_service.get_by_slug(slug, read_policy="catalog")
     if not restaurant:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
     
@@ -39,7 +47,7 @@ async def get_delivery_zones(request: Request, slug: str):
 async def create_order(request: Request, slug: str, order_data: OrderCreate):
     """Create a new order for a restaurant"""
     order = await request.app.state.order_service.create_order(slug, order_data)
-    return order
+    return ModelResponse(order)
 
 @router.get("/api/{slug}/orders/{order_id}", response_model=OrderResponse)
 async def get_order(request: Request, slug: str, order_id: str):
@@ -47,4 +55,12 @@ async def get_order(request: Request, slug: str, order_id: str):
     order = await request.app.state.order_service.get_order_by_id(order_id, slug)
     if not order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-    return order
+    return ModelResponse(order)
+
+@router.post("/api/{slug}/orders/{order_id}/push")
+async def subscribe_to_order_updates(request: Request, slug: str, order_id: str, subscription_data: PushSubscription):
+    """Receive push notifications when the order status changes"""
+    attached = await request.app.state.order_service.attach_push_subscription(order_id, slug, subscription_data)
+    if not attached:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    return {"message": "Subscribed to order updates"}
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from models import PushSubscription, PushNotificationCreate, PushNotification
+from models import PushSubscription, PushNotificationCreate, PushNotification, PushJobStatus
 from typing import List
 from dependencies import get_current_user
 
@@ -19,16 +19,27 @@ async def send_push_notification(
     notification: PushNotificationCreate,
     current_user: dict = Depends(get_current_user)
 ):
-    """Send push notification to all subscribers (admin only)"""
-    # In a multi-tenant app, you might want to filter subscribers by restaurant_slug
-    # For simplicity, this example sends to all.
-    success = await request.app.state.push_notification_service.send_notification(notification)
-    if not success:
+    """Queue push notification to the restaurant's subscribers of a topic (admin only)"""
+    # Superadmins broadcast to every restaurant's subscribers
+    restaurant_slug = None if current_user["role"] == "superadmin" else current_user["restaurant_slug"]
+    job_id = await request.app.state.push_notification_service.send_notification(notification, restaurant_slug)
+    if not job_id:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to send notification")
-    return {"message": "Notification sent successfully"}
+    return {"message": "Notification queued", "job_id": job_id}
+
+@router.get("/admin/push/jobs/{job_id}", response_model=PushJobStatus)
+async def get_push_job_status(request: Request, job_id: str, current_user: dict = Depends(get_current_user)):
+    """Get delivery progress of a push notification (admin only)"""
+    # Admins only see their restaurant's jobs; another tenant's job is "not found"
+    restaurant_slug = None if current_user["role"] == "superadmin" else current_user["restaurant_slug"]
+    job = await request.app.state.push_notification_service.get_job_status(job_id, restaurant_slug)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
 
 @router.get("/admin/push/notifications", response_model=List[PushNotification])
 async def get_push_notifications_admin(request: Request, current_user: dict = Depends(get_current_user)):
     """Get sent push notifications (admin only)"""
-    notifications = await request.app.state.push_notification_service.get_sent_notifications()
+    restaurant_slug = None if current_user["role"] == "superadmin" else current_user["restaurant_slug"]
+    notifications = await request.app.state.push_notification_service.get_sent_notifications(restaurant_slug)
     return notifications
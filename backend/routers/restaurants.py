@@ -2,19 +2,22 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from models import RestaurantResponse, RestaurantUpdate, RestaurantCreate
 from typing import List
 from dependencies import get_current_user
+from responses import cached_response
 
 router = APIRouter()
 
 @router.get("/api/restaurants/{slug}", response_model=RestaurantResponse)
 async def get_restaurant_by_slug(request: Request, slug: str):
     """Obtener información del restaurante por slug"""
-    restaurant = await request.app.state.restaurant_service.get_by_slug(slug)
-    if not restaurant:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Restaurante no encontrado"
-        )
-    return restaurant
+    async def load():
+        restaurant = await request.app.state.restaurant_service.get_by_slug(slug, read_policy="catalog")
+        if not restaurant:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Restaurante no encontrado"
+            )
+        return restaurant
+    return await cached_response(request, ("restaurant", slug), load, tags=[("restaurant", slug)])
 
 @router.put("/api/restaurants/{slug}")
 async def update_restaurant(
@@ -51,6 +54,19 @@ async def create_restaurant(
     restaurant = await request.app.state.restaurant_service.create_restaurant(restaurant_data)
     return restaurant
 
+@router.post("/superadmin/restaurants/bulk")
+async def create_restaurants_bulk(
+    request: Request,
+    restaurants: List[RestaurantCreate],
+    current_user: dict = Depends(get_current_user)
+):
+    """Crear varios restaurantes, cada uno en su propia transacción (solo superadmin)"""
+    if current_user["role"] != "superadmin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    
+    results = await request.app.state.restaurant_service.provision_many(restaurants)
+    return {"results": results}
+
 @router.get("/superadmin/restaurants", response_model=List[RestaurantResponse])
 async def get_all_restaurants(request: Request, current_user: dict = Depends(get_current_user)):
     """Obtener todos los restaurantes (solo superadmin)"""
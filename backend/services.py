@@ -1,94 +1,156 @@
 # services.py
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from database import get_collection, to_object_id, to_string_id, with_transaction
 from models import *
 from auth import AuthService
+from exceptions import RestaurantAlreadyExistsException, CategoryNotFoundException
+from config import settings
+from webpush import WebPushSender
+from outbox import NotificationOutbox
+from cache import tenant_cache, response_cache, catalog_flight, coalesced
+from fieldsets import projection, sparse_model
+from timing import timed
+from monitoring import known_tenants
+import asyncio
+import json
 import logging
 import uuid
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CATEGORIES = [
+    {"name": " Pizzas", "icon": "", "display_order": 1},
+    {"name": " Ensaladas", "icon": "", "display_order": 2},
+    {"name": " Bebidas", "icon": "", "display_order": 3},
+    {"name": " Postres", "icon": "", "display_order": 4},
+]
+
 class RestaurantService:
     def __init__(self):
         self.collection = get_collection("restaurants")
         self.auth_service = AuthService()
 
     async def create_restaurant(self, restaurant_data: RestaurantCreate) -> RestaurantResponse:
-        """Create new restaurant with admin user"""
+        """Create new restaurant with admin user and default categories"""
         try:
-            async def operation(session):
-                # Check if slug is unique
-                existing = await self.collection.find_one({"slug": restaurant_data.slug})
-                if existing:
-                    raise ValueError("Restaurant slug already exists")
-                
-                # Create restaurant
-                restaurant_doc = {
-                    "name": restaurant_data.name,
-                    "slug": restaurant_data.slug,
-                    "description": restaurant_data.description,
-                    "logo": restaurant_data.logo,
-                    "email": restaurant_data.email,
-                    "phone": restaurant_data.phone,
-                    "address": restaurant_data.address,
-                    "city": restaurant_data.city,
-                    "country": restaurant_data.country,
-                    "settings": RestaurantSettings().dict(),
-                    "is_active": True,
-                    "created_at": datetime.utcnow(),
-                    "updated_at": datetime.utcnow()
-                }
-                
-                result = await self.collection.insert_one(restaurant_doc, session=session)
-                restaurant_id = result.inserted_id
-                
-                # Create admin user
-                await self.auth_service.create_user(
-                    username=restaurant_data.admin_username,
-                    password=restaurant_data.admin_password,
-                    restaurant_slug=restaurant_data.slug,
-                    role="admin"
-                )
-                
-                # Create default categories
-                categories_service = CategoryService()
-                default_categories = [
-                    {"name": " Pizzas", "icon": "", "display_order": 1},
-                    {"name": " Ensaladas", "icon": "", "display_order": 2},
-                    {"name": " Bebidas", "icon": "", "display_order": 3},
-                    {"name": " Postres", "icon": "", "display_order": 4},
-                ]
-                
-                for cat_data in default_categories:
-                    await categories_service.create_category(
-                        restaurant_data.slug,
-                        CategoryCreate(**cat_data)
-                    )
-                
-                # Return created restaurant
-                restaurant_doc["id"] = str(restaurant_id)
-                restaurant_doc["settings"] = RestaurantSettings(**restaurant_doc["settings"])
-                
-                return RestaurantResponse(**restaurant_doc)
-            
-            return await with_transaction(operation)
-            
+            password_hash = await asyncio.to_thread(self.auth_service.hash_password, restaurant_data.admin_password)
+            return await self._provision(restaurant_data, password_hash)
         except Exception as e:
             logger.error(f"Error creating restaurant: {e}")
             raise
 
-    async def get_by_slug(self, slug: str) -> Optional[RestaurantResponse]:
-        """Get restaurant by slug"""
+    async def _provision(self, restaurant_data: RestaurantCreate, password_hash: str) -> RestaurantResponse:
+        """Insert restaurant, admin user and default categories in one transaction"""
+        now = datetime.utcnow()
+        restaurant_doc = {
+            "_id": ObjectId(),
+            "name": restaurant_data.name,
+            "slug": restaurant_data.slug,
+            "description": restaurant_data.description,
+            "logo": restaurant_data.logo,
+            "email": restaurant_data.email,
+            "phone": restaurant_data.phone,
+            "address": restaurant_data.address,
+            "city": restaurant_data.city,
+            "country": restaurant_data.country,
+            "settings": RestaurantSettings().model_dump(),
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now
+        }
+        user_doc = self.auth_service.user_document(
+            restaurant_data.admin_username, password_hash, restaurant_doc["_id"], restaurant_data.slug, "admin"
+        )
+        category_docs = [
+            {
+                **CategoryCreate(**category).model_dump(),
+                "key": category_key(category["name"]),
+                "restaurant_id": restaurant_doc["_id"],
+                "restaurant_slug": restaurant_data.slug,
+                "is_active": True,
+                "created_at": now,
+                "updated_at": now
+            }
+            for category in DEFAULT_CATEGORIES
+        ]
+
+        async def operation(session):
+            # Fresh copies: the driver adds _id to inserted documents and a retry must start clean
+            try:
+                await self.collection.insert_one(dict(restaurant_doc), session=session)
+            except DuplicateKeyError as e:
+                # slug or email, from the unique index that rejected the insert
+                key_pattern = (e.details or {}).get("keyPattern") or {}
+                raise RestaurantAlreadyExistsException(next(iter(key_pattern), None))
+            await get_collection("users").insert_one(dict(user_doc), session=session)
+            await get_collection("categories").insert_many(
+                [dict(category) for category in category_docs], session=session
+            )
+
+        await with_transaction(operation)
+        known_tenants.add(restaurant_data.slug)
+        logger.info(f"Restaurant provisioned: {restaurant_data.slug}")
+
+        restaurant_doc["settings"] = RestaurantSettings(**restaurant_doc["settings"])
+        return RestaurantResponse(**restaurant_doc)
+
+    async def provision_many(
+        self,
+        restaurants: List[RestaurantCreate],
+        concurrency: int = settings.provisioning_concurrency
+    ) -> List[Dict[str, Any]]:
+        """Provision tenants in parallel, one transaction each; returns a result per tenant"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def provision(restaurant_data: RestaurantCreate) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    # bcrypt is CPU bound, hash outside the event loop
+                    password_hash = await asyncio.to_thread(
+                        self.auth_service.hash_password, restaurant_data.admin_password
+                    )
+                    restaurant = await self._provision(restaurant_data, password_hash)
+                    return {"slug": restaurant_data.slug, "status": "created", "id": restaurant.id}
+                except RestaurantAlreadyExistsException as e:
+                    # Same slug is an earlier run's tenant; any other field belongs to a different one
+                    status = "exists" if e.field in ("slug", None) else "conflict"
+                    return {"slug": restaurant_data.slug, "status": status, "field": e.field}
+                except Exception as e:
+                    logger.error(f"Error provisioning restaurant {restaurant_data.slug}: {e}")
+                    return {"slug": restaurant_data.slug, "status": "failed", "error": str(e)}
+
+        return await asyncio.gather(*[provision(restaurant) for restaurant in restaurants])
+
+    @timed("tenant")
+    async def get_by_slug(self, slug: str, read_policy: str = "primary") -> Optional[RestaurantResponse]:
+        """Get restaurant by slug (catalog reads are served from the tenant cache)"""
+        if read_policy == "catalog":
+            cached = tenant_cache.get(slug)
+            if cached is not None:
+                return cached
+        return await self._load_by_slug(slug, read_policy)
+
+    @coalesced(catalog_flight)
+    async def _load_by_slug(self, slug: str, read_policy: str) -> Optional[RestaurantResponse]:
         try:
+            # Catalog reads fill the tenant cache, so they read the primary too: a lagging
+            # secondary would put back the document a local write just invalidated
+            version = tenant_cache.version([("restaurant", slug)])
             restaurant = await self.collection.find_one({"slug": slug, "is_active": True})
             if not restaurant:
                 return None
                 
-            restaurant["id"] = str(restaurant["_id"])
             restaurant["settings"] = RestaurantSettings(**restaurant["settings"])
             
-            return RestaurantResponse(**restaurant)
+            response = RestaurantResponse(**restaurant)
+            if read_policy == "catalog":
+                tenant_cache.set(slug, response, tags=[("restaurant", slug)], version=version)
+            return response
             
         except Exception as e:
             logger.error(f"Error getting restaurant by slug: {e}")
@@ -107,6 +169,9 @@ class RestaurantService:
                 {"slug": slug},
                 {"$set": update_dict}
             )
+            # Other workers are invalidated by the change stream
+            tenant_cache.invalidate_tag(("restaurant", slug))
+            response_cache.invalidate_tag(("restaurant", slug))
             
             return result.modified_count > 0
             
@@ -121,7 +186,6 @@ class RestaurantService:
             restaurants = []
             
             async for restaurant in cursor:
-                restaurant["id"] = str(restaurant["_id"])
                 restaurant["settings"] = RestaurantSettings(**restaurant["settings"])
                 restaurants.append(RestaurantResponse(**restaurant))
                 
@@ -134,6 +198,7 @@ class RestaurantService:
 class CategoryService:
     def __init__(self):
         self.collection = get_collection("categories")
+        self.catalog_collection = get_collection("categories", read_policy="catalog")
 
     async def create_category(self, restaurant_slug: str, category_data: CategoryCreate) -> CategoryResponse:
         """Create new category"""
@@ -146,6 +211,7 @@ class CategoryService:
             
             category_doc = {
                 "name": category_data.name,
+                "key": category_key(category_data.name),
                 "icon": category_data.icon,
                 "description": category_data.description,
                 "restaurant_id": to_object_id(restaurant.id),
@@ -156,27 +222,35 @@ class CategoryService:
                 "updated_at": datetime.utcnow()
             }
             
-            result = await self.collection.insert_one(category_doc)
+            await self.collection.insert_one(category_doc)
+            response_cache.invalidate_tag(("restaurant", restaurant_slug))
             
-            category_doc["id"] = str(result.inserted_id)
             return CategoryResponse(**category_doc)
             
         except Exception as e:
             logger.error(f"Error creating category: {e}")
             raise
 
-    async def get_categories_by_restaurant(self, restaurant_slug: str) -> List[CategoryResponse]:
-        """Get categories by restaurant"""
+    @timed("categories")
+    @coalesced(catalog_flight)
+    async def get_categories_by_restaurant(
+        self,
+        restaurant_slug: str,
+        read_policy: str = "primary",
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> List[CategoryResponse]:
+        """Get categories by restaurant (only ``fields`` if given)"""
         try:
-            cursor = self.collection.find({
+            collection = self.catalog_collection if read_policy == "catalog" else self.collection
+            model = sparse_model(CategoryResponse, fields) if fields else CategoryResponse
+            cursor = collection.find({
                 "restaurant_slug": restaurant_slug,
                 "is_active": True
-            }).sort("display_order", 1)
+            }, projection(fields) if fields else None).sort("display_order", 1)
             
             categories = []
             async for category in cursor:
-                category["id"] = str(category["_id"])
-                categories.append(CategoryResponse(**category))
+                categories.append(model(**category))
                 
             return categories
             
@@ -184,33 +258,63 @@ class CategoryService:
             logger.error(f"Error getting categories: {e}")
             return []
 
-    async def update_category(self, category_id: str, update_data: CategoryUpdate) -> bool:
-        """Update category"""
+    @coalesced(catalog_flight)
+    async def category_exists(self, restaurant_slug: str, category_name: str, read_policy: str = "primary") -> bool:
+        """Whether an active category with this name (compared by key) exists"""
+        collection = self.catalog_collection if read_policy == "catalog" else self.collection
+        category = await collection.find_one(
+            {"restaurant_slug": restaurant_slug, "key": category_key(category_name), "is_active": True},
+            {"_id": 1}
+        )
+        return category is not None
+
+    async def update_category(self, category_id: str, restaurant_slug: str, update_data: CategoryUpdate) -> bool:
+        """Update one of the restaurant's categories"""
         try:
             update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
             if not update_dict:
                 return True
                 
+            if "name" in update_dict:
+                update_dict["key"] = category_key(update_dict["name"])
             update_dict["updated_at"] = datetime.utcnow()
             
-            result = await self.collection.update_one(
-                {"_id": to_object_id(category_id)},
-                {"$set": update_dict}
-            )
+            async def operation(session):
+                category = await self.collection.find_one_and_update(
+                    {"_id": to_object_id(category_id), "restaurant_slug": restaurant_slug},
+                    {"$set": update_dict},
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+                if not category:
+                    return False
+                # Fan out the denormalized snapshot to the category's products
+                if "name" in update_dict or "display_order" in update_dict:
+                    await get_collection("products").update_many(
+                        {"category_id": category["_id"], "restaurant_slug": restaurant_slug},
+                        {"$set": category_snapshot(category)},
+                        session=session
+                    )
+                return True
             
-            return result.modified_count > 0
+            updated = await with_transaction(operation)
+            if updated:
+                # Don't wait for the invalidation bus (up to a poll interval) on this worker
+                response_cache.invalidate_tag(("restaurant", restaurant_slug))
+            return updated
             
         except Exception as e:
             logger.error(f"Error updating category: {e}")
             return False
 
-    async def delete_category(self, category_id: str) -> bool:
-        """Soft delete category"""
+    async def delete_category(self, category_id: str, restaurant_slug: str) -> bool:
+        """Soft delete one of the restaurant's categories"""
         try:
             result = await self.collection.update_one(
-                {"_id": to_object_id(category_id)},
+                {"_id": to_object_id(category_id), "restaurant_slug": restaurant_slug},
                 {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
             )
+            response_cache.invalidate_tag(("restaurant", restaurant_slug))
             
             return result.modified_count > 0
             
@@ -221,6 +325,27 @@ class CategoryService:
 class ProductService:
     def __init__(self):
         self.collection = get_collection("products")
+        self.catalog_collection = get_collection("products", read_policy="catalog")
+
+    def _to_response(self, product: dict, model=ProductResponse) -> ProductResponse:
+        """Build a ProductResponse (or a sparse model of it) from a product document"""
+        # Older product documents have no sizes/toppings
+        for field in ("sizes", "toppings"):
+            if field in model.model_fields:
+                product.setdefault(field, [])
+        return model(**product)
+
+    async def _category_snapshot(self, restaurant_slug: str, category_id: str) -> Dict[str, Any]:
+        """Snapshot of one of the restaurant's categories (other restaurants' are rejected)"""
+        if not ObjectId.is_valid(category_id):
+            raise CategoryNotFoundException()
+        category = await get_collection("categories").find_one(
+            {"_id": ObjectId(category_id), "restaurant_slug": restaurant_slug},
+            {"name": 1, "display_order": 1}
+        )
+        if not category:
+            raise CategoryNotFoundException()
+        return category_snapshot(category)
 
     async def create_product(self, restaurant_slug: str, product_data: ProductCreate) -> ProductResponse:
         """Create new product"""
@@ -231,12 +356,15 @@ class ProductService:
             if not restaurant:
                 raise ValueError("Restaurant not found")
             
+            snapshot = await self._category_snapshot(restaurant_slug, product_data.category_id)
+            
             product_doc = {
                 "name": product_data.name,
                 "description": product_data.description,
                 "price": product_data.price,
                 "image": product_data.image,
                 "category_id": to_object_id(product_data.category_id),
+                **snapshot,
                 "restaurant_id": to_object_id(restaurant.id),
                 "restaurant_slug": restaurant_slug,
                 "sizes": [size.dict() for size in product_data.sizes],
@@ -253,12 +381,8 @@ class ProductService:
                 "updated_at": datetime.utcnow()
             }
             
-            result = await self.collection.insert_one(product_doc)
-            
-            product_doc["id"] = str(result.inserted_id)
-            product_doc["category_id"] = str(product_doc["category_id"])
-            product_doc["sizes"] = [ProductSize(**size) for size in product_doc["sizes"]]
-            product_doc["toppings"] = [ProductTopping(**topping) for topping in product_doc["toppings"]]
+            await self.collection.insert_one(product_doc)
+            response_cache.invalidate_tag(("restaurant", restaurant_slug))
             
             return ProductResponse(**product_doc)
             
@@ -266,14 +390,19 @@ class ProductService:
             logger.error(f"Error creating product: {e}")
             raise
 
+    @timed("products")
+    @coalesced(catalog_flight)
     async def get_products_by_restaurant(
         self,
         restaurant_slug: str,
         category_id: Optional[str] = None,
         search: Optional[str] = None,
-        popular_only: bool = False
+        popular_only: bool = False,
+        read_policy: str = "primary",
+        category_name: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None
     ) -> List[ProductResponse]:
-        """Get products by restaurant with filters"""
+        """Get products by restaurant with filters (only ``fields`` if given)"""
         try:
             query = {
                 "restaurant_slug": restaurant_slug,
@@ -283,21 +412,22 @@ class ProductService:
             if category_id:
                 query["category_id"] = to_object_id(category_id)
                 
+            if category_name:
+                query["category_key"] = category_key(category_name)
+                
             if search:
                 query["name"] = {"$regex": search, "$options": "i"}
                 
             if popular_only:
                 query["is_popular"] = True
             
-            cursor = self.collection.find(query).sort("name", 1)
+            collection = self.catalog_collection if read_policy == "catalog" else self.collection
+            model = sparse_model(ProductResponse, fields) if fields else ProductResponse
+            cursor = collection.find(query, projection(fields) if fields else None).sort("name", 1)
             
             products = []
             async for product in cursor:
-                product["id"] = str(product["_id"])
-                product["category_id"] = str(product["category_id"])
-                product["sizes"] = [ProductSize(**size) for size in product.get("sizes", [])]
-                product["toppings"] = [ProductTopping(**topping) for topping in product.get("toppings", [])]
-                products.append(ProductResponse(**product))
+                products.append(self._to_response(product, model))
                 
             return products
             
@@ -305,10 +435,13 @@ class ProductService:
             logger.error(f"Error getting products: {e}")
             return []
 
-    async def get_product_by_id(self, product_id: str, restaurant_slug: str) -> Optional[ProductResponse]:
+    @timed("products")
+    @coalesced(catalog_flight)
+    async def get_product_by_id(self, product_id: str, restaurant_slug: str, read_policy: str = "primary") -> Optional[ProductResponse]:
         """Get product by ID"""
         try:
-            product = await self.collection.find_one({
+            collection = self.catalog_collection if read_policy == "catalog" else self.collection
+            product = await collection.find_one({
                 "_id": to_object_id(product_id),
                 "restaurant_slug": restaurant_slug,
                 "is_available": True
@@ -317,25 +450,21 @@ class ProductService:
             if not product:
                 return None
                 
-            product["id"] = str(product["_id"])
-            product["category_id"] = str(product["category_id"])
-            product["sizes"] = [ProductSize(**size) for size in product.get("sizes", [])]
-            product["toppings"] = [ProductTopping(**topping) for topping in product.get("toppings", [])]
-            
-            return ProductResponse(**product)
+            return self._to_response(product)
             
         except Exception as e:
             logger.error(f"Error getting product: {e}")
             return None
 
-    async def update_product(self, product_id: str, update_data: ProductUpdate) -> bool:
-        """Update product"""
+    async def update_product(self, product_id: str, restaurant_slug: str, update_data: ProductUpdate) -> bool:
+        """Update one of the restaurant's products"""
         try:
             update_dict = {}
             
             for field, value in update_data.dict().items():
                 if value is not None:
                     if field == "category_id":
+                        update_dict.update(await self._category_snapshot(restaurant_slug, value))
                         update_dict[field] = to_object_id(value)
                     elif field in ["sizes", "toppings"]:
                         update_dict[field] = [item.dict() for item in value] if value else []
@@ -348,23 +477,27 @@ class ProductService:
             update_dict["updated_at"] = datetime.utcnow()
             
             result = await self.collection.update_one(
-                {"_id": to_object_id(product_id)},
+                {"_id": to_object_id(product_id), "restaurant_slug": restaurant_slug},
                 {"$set": update_dict}
             )
+            response_cache.invalidate_tag(("restaurant", restaurant_slug))
             
             return result.modified_count > 0
             
+        except CategoryNotFoundException:
+            raise
         except Exception as e:
             logger.error(f"Error updating product: {e}")
             return False
 
-    async def delete_product(self, product_id: str) -> bool:
-        """Soft delete product"""
+    async def delete_product(self, product_id: str, restaurant_slug: str) -> bool:
+        """Soft delete one of the restaurant's products"""
         try:
             result = await self.collection.update_one(
-                {"_id": to_object_id(product_id)},
+                {"_id": to_object_id(product_id), "restaurant_slug": restaurant_slug},
                 {"$set": {"is_available": False, "updated_at": datetime.utcnow()}}
             )
+            response_cache.invalidate_tag(("restaurant", restaurant_slug))
             
             return result.modified_count > 0
             
@@ -372,9 +505,357 @@ class ProductService:
             logger.error(f"Error deleting product: {e}")
             return False
 
+def get_local_bucket(moment: datetime, timezone: str) -> Dict[str, Any]:
+    """Get the local date and hour for a naive UTC datetime"""
+    local = moment.replace(tzinfo=dt_timezone.utc).astimezone(ZoneInfo(timezone))
+    return {"date": local.strftime("%Y-%m-%d"), "hour": local.hour}
+
+class OrderRollupService:
+    """Order rollups maintained at write time.
+
+    Hourly buckets are keyed by the restaurant's local date and hour so dashboard
+    reads are index range scans on (restaurant_slug, date, hour). Each order also
+    feeds per-tenant and platform-wide totals per local day and month, which back
+    the superadmin view without touching per-tenant buckets.
+    """
+
+    def __init__(self):
+        self.collection = get_collection("order_rollups")
+        self.tenant_collection = get_collection("tenant_rollups")
+        self.platform_collection = get_collection("platform_rollups")
+
+    async def record_order(self, order_doc: dict, sign: int = 1, session=None):
+        """Add an order to its rollups (sign=-1 removes it)"""
+        revenue = sign * order_doc["total"]
+        increments = {
+            "orders": sign,
+            "revenue": revenue
+        }
+        for item in order_doc["items"]:
+            # product_id comes from the client, only trust it as a field name if it is an ObjectId
+            if ObjectId.is_valid(item["product_id"]):
+                increments[f"products.{item['product_id']}.quantity"] = sign * item["quantity"]
+
+        await self.collection.update_one(
+            {
+                "restaurant_slug": order_doc["restaurant_slug"],
+                "date": order_doc["local_date"],
+                "hour": order_doc["local_hour"]
+            },
+            {
+                "$inc": increments,
+                "$setOnInsert": {"timezone": order_doc["timezone"]}
+            },
+            upsert=True,
+            session=session
+        )
+
+        periods = [("day", order_doc["local_date"]), ("month", order_doc["local_date"][:7])]
+        await self.tenant_collection.bulk_write([
+            UpdateOne(
+                {"period": period, "key": key, "restaurant_slug": order_doc["restaurant_slug"]},
+                {"$inc": {"orders": sign, "revenue": revenue}},
+                upsert=True
+            )
+            for period, key in periods
+        ], ordered=False, session=session)
+        await self.platform_collection.bulk_write([
+            UpdateOne(
+                {"period": period, "key": key},
+                {"$inc": {"orders": sign, "revenue": revenue}},
+                upsert=True
+            )
+            for period, key in periods
+        ], ordered=False, session=session)
+
+    async def get_platform_analytics(
+        self,
+        period: str,
+        key: str,
+        sort_by: str = "orders",
+        page: int = 1,
+        page_size: int = 20
+    ) -> PlatformAnalytics:
+        """Get platform totals and a page of tenants ranked by volume"""
+        totals = await self.platform_collection.find_one({"period": period, "key": key}) or {}
+        # Counted, not kept as a counter: a tenant whose orders were all cancelled drops out
+        active_tenants = await self.tenant_collection.count_documents(
+            {"period": period, "key": key, "orders": {"$gt": 0}}
+        )
+
+        cursor = self.tenant_collection.find(
+            {"period": period, "key": key, "orders": {"$gt": 0}}
+        ).sort(sort_by, -1).skip((page - 1) * page_size).limit(page_size)
+        tenants = await cursor.to_list(length=page_size)
+
+        names = {}
+        if tenants:
+            restaurants = get_collection("restaurants").find(
+                {"slug": {"$in": [tenant["restaurant_slug"] for tenant in tenants]}},
+                {"slug": 1, "name": 1}
+            )
+            async for restaurant in restaurants:
+                names[restaurant["slug"]] = restaurant["name"]
+
+        return PlatformAnalytics(
+            period=period,
+            key=key,
+            total_orders=totals.get("orders", 0),
+            gmv=totals.get("revenue", 0.0),
+            active_tenants=active_tenants,
+            top_tenants=[
+                TenantVolume(
+                    restaurant_slug=tenant["restaurant_slug"],
+                    name=names.get(tenant["restaurant_slug"]),
+                    orders=tenant["orders"],
+                    revenue=tenant["revenue"]
+                )
+                for tenant in tenants
+            ],
+            page=page,
+            page_size=page_size
+        )
+
+    async def get_buckets(self, restaurant_slug: str, date: str) -> List[dict]:
+        """Get the hourly buckets for a local date"""
+        cursor = self.collection.find({
+            "restaurant_slug": restaurant_slug,
+            "date": date
+        }).sort("hour", 1)
+        return await cursor.to_list(length=24)
+
+    async def rebuild(self, restaurant_slug: str, start_date: datetime, end_date: datetime, timezone: str) -> int:
+        """Recompute the rollups of the local months touching a UTC range from raw orders.
+
+        Whole months are rebuilt so monthly tenant totals come out exact. Hourly
+        buckets and tenant totals are replaced (the ones left without orders are
+        removed) and the platform totals move by the difference, all in one
+        transaction. Returns the number of hourly buckets written.
+        """
+        def month_start(key: str) -> datetime:
+            year, month = map(int, key.split("-"))
+            return datetime(year, month, 1, tzinfo=ZoneInfo(timezone))
+
+        def next_month(key: str) -> str:
+            year, month = map(int, key.split("-"))
+            return f"{year + month // 12}-{month % 12 + 1:02d}"
+
+        months = [get_local_bucket(start_date, timezone)["date"][:7]]
+        last_month = get_local_bucket(end_date, timezone)["date"][:7]
+        while months[-1] < last_month:
+            months.append(next_month(months[-1]))
+        first_day, last_day = f"{months[0]}-01", f"{last_month}-31"
+
+        # UTC window of the local months (+1 day for orders bucketed under an older timezone)
+        window_start = month_start(months[0]).astimezone(dt_timezone.utc).replace(tzinfo=None)
+        window_end = month_start(next_month(last_month)).astimezone(dt_timezone.utc).replace(tzinfo=None)
+        orders_query = {
+            "restaurant_slug": restaurant_slug,
+            "created_at": {
+                "$gte": window_start - timedelta(days=1),
+                "$lt": window_end + timedelta(days=1)
+            },
+            "status": {"$ne": OrderStatus.CANCELLED}
+        }
+        tenant_filter = {
+            "restaurant_slug": restaurant_slug,
+            "$or": [
+                {"period": "day", "key": {"$gte": first_day, "$lte": last_day}},
+                {"period": "month", "key": {"$in": months}}
+            ]
+        }
+
+        async def operation(session):
+            # Orders are read inside the transaction: an order placed meanwhile either
+            # is in this snapshot or conflicts on its bucket and the rebuild retries
+            cursor = get_collection("orders").find(
+                orders_query,
+                {"total": 1, "items": 1, "created_at": 1, "local_date": 1, "local_hour": 1},
+                session=session
+            )
+            buckets: Dict[Tuple[str, int], dict] = {}
+            tenants: Dict[Tuple[str, str], dict] = {}
+            async for order in cursor:
+                if "local_date" in order:
+                    date, hour = order["local_date"], order["local_hour"]
+                else:
+                    bucket = get_local_bucket(order["created_at"], timezone)
+                    date, hour = bucket["date"], bucket["hour"]
+                if not first_day <= date <= last_day:
+                    continue
+
+                bucket = buckets.setdefault((date, hour), {
+                    "restaurant_slug": restaurant_slug,
+                    "date": date,
+                    "hour": hour,
+                    "timezone": timezone,
+                    "orders": 0,
+                    "revenue": 0.0,
+                    "products": {}
+                })
+                bucket["orders"] += 1
+                bucket["revenue"] += order["total"]
+                for item in order["items"]:
+                    if ObjectId.is_valid(item["product_id"]):
+                        product = bucket["products"].setdefault(item["product_id"], {"quantity": 0})
+                        product["quantity"] += item["quantity"]
+
+                for period, key in [("day", date), ("month", date[:7])]:
+                    tenant = tenants.setdefault((period, key), {
+                        "period": period,
+                        "key": key,
+                        "restaurant_slug": restaurant_slug,
+                        "orders": 0,
+                        "revenue": 0.0
+                    })
+                    tenant["orders"] += 1
+                    tenant["revenue"] += order["total"]
+
+            previous = await self.tenant_collection.find(tenant_filter, session=session).to_list(length=None)
+            await self.collection.delete_many(
+                {"restaurant_slug": restaurant_slug, "date": {"$gte": first_day, "$lte": last_day}},
+                session=session
+            )
+            await self.tenant_collection.delete_many(tenant_filter, session=session)
+            if buckets:
+                await self.collection.insert_many([dict(bucket) for bucket in buckets.values()], session=session)
+            if tenants:
+                await self.tenant_collection.insert_many([dict(tenant) for tenant in tenants.values()], session=session)
+
+            # Platform totals are the sum over tenants: apply this tenant's drift
+            deltas: Dict[Tuple[str, str], List[float]] = {}
+            for tenant in previous:
+                delta = deltas.setdefault((tenant["period"], tenant["key"]), [0, 0.0])
+                delta[0] -= tenant.get("orders", 0)
+                delta[1] -= tenant.get("revenue", 0.0)
+            for (period, key), tenant in tenants.items():
+                delta = deltas.setdefault((period, key), [0, 0.0])
+                delta[0] += tenant["orders"]
+                delta[1] += tenant["revenue"]
+            platform_updates = [
+                UpdateOne(
+                    {"period": period, "key": key},
+                    {"$inc": {"orders": orders, "revenue": revenue}},
+                    upsert=True
+                )
+                for (period, key), (orders, revenue) in deltas.items() if orders or revenue
+            ]
+            if platform_updates:
+                await self.platform_collection.bulk_write(platform_updates, ordered=False, session=session)
+            return len(buckets)
+
+        return await with_transaction(operation)
+
+ORDER_STATUS_MESSAGES = {
+    OrderStatus.CONFIRMED: "¡Tu pedido fue confirmado!",
+    OrderStatus.PREPARING: "Estamos preparando tu pedido",
+    OrderStatus.READY: "Tu pedido está listo",
+    OrderStatus.OUT_FOR_DELIVERY: "Tu pedido está en camino",
+    OrderStatus.DELIVERED: "Pedido entregado. ¡Que lo disfrutes!",
+    OrderStatus.CANCELLED: "Tu pedido fue cancelado",
+}
+
 class OrderService:
     def __init__(self):
         self.collection = get_collection("orders")
+        self.rollup_service = OrderRollupService()
+        self.outbox = NotificationOutbox()
+
+    def _to_response(self, order: dict, model=OrderResponse) -> OrderResponse:
+        """Build an OrderResponse (or a sparse model of it) from an order document"""
+        if "actual_delivery_time" in model.model_fields:
+            order.setdefault("actual_delivery_time", None)
+        return model(**order)
+
+    @timed("orders")
+    async def get_order_by_id(self, order_id: str, restaurant_slug: str) -> Optional[OrderResponse]:
+        """Get order by ID"""
+        try:
+            order = await self.collection.find_one({
+                "_id": to_object_id(order_id),
+                "restaurant_slug": restaurant_slug
+            })
+            if not order:
+                return None
+            
+            return self._to_response(order)
+            
+        except Exception as e:
+            logger.error(f"Error getting order: {e}")
+            return None
+
+    @timed("orders")
+    async def get_orders_by_restaurant(
+        self,
+        restaurant_slug: str,
+        status_filter: Optional[str] = None,
+        limit: int = 50,
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> List[OrderResponse]:
+        """Latest orders of a restaurant, optionally by status (only ``fields`` if given)"""
+        try:
+            query = {"restaurant_slug": restaurant_slug}
+            if status_filter:
+                query["status"] = status_filter
+            
+            model = sparse_model(OrderResponse, fields) if fields else OrderResponse
+            cursor = self.collection.find(query, projection(fields) if fields else None) \
+                .sort("created_at", -1).limit(limit)
+            
+            orders = []
+            async for order in cursor:
+                orders.append(self._to_response(order, model))
+                
+            return orders
+            
+        except Exception as e:
+            logger.error(f"Error getting orders: {e}")
+            return []
+
+    async def attach_push_subscription(self, order_id: str, restaurant_slug: str, subscription_data: PushSubscription) -> bool:
+        """Notify this device about status changes of the order"""
+        try:
+            query = {"_id": to_object_id(order_id), "restaurant_slug": restaurant_slug}
+            # Unknown orders must not leave a subscription behind
+            if not await self.collection.find_one(query, {"_id": 1}):
+                return False
+            
+            subscription_id = await PushNotificationService().add_topic(
+                subscription_data, restaurant_slug, PushTopic.ORDER_UPDATES
+            )
+            
+            result = await self.collection.update_one(
+                query,
+                {"$addToSet": {"push_subscription_ids": subscription_id}}
+            )
+            return result.matched_count > 0
+            
+        except Exception as e:
+            logger.error(f"Error attaching push subscription: {e}")
+            return False
+
+    async def notify_status_change(self, order: dict, new_status: OrderStatus):
+        """Queue a push to the devices attached to the order"""
+        message = ORDER_STATUS_MESSAGES.get(new_status)
+        if not message or not order.get("push_subscription_ids"):
+            return
+        
+        try:
+            payload = json.dumps({
+                "title": message,
+                "body": f"Pedido {order['order_number']}",
+                "order_id": str(order["_id"]),
+                "status": new_status.value
+            }).encode()
+            await self.outbox.enqueue(
+                payload,
+                f"{order['order_number']}: {new_status.value}",
+                {"_id": {"$in": order["push_subscription_ids"]}},
+                urgency="high",
+                restaurant_slug=order["restaurant_slug"]
+            )
+        except Exception as e:
+            logger.error(f"Error queueing order status push: {e}")
 
     def generate_order_number(self) -> str:
         """Generate unique order number"""
@@ -382,6 +863,7 @@ class OrderService:
         unique_id = str(uuid.uuid4())[:8].upper()
         return f"ORD-{timestamp}-{unique_id}"
 
+    @timed("orders")
     async def create_order(self, restaurant_slug: str, order_data: OrderCreate) -> OrderResponse:
         """Create new order"""
         try:
@@ -401,6 +883,10 @@ class OrderService:
             if order_data.is_delivery:
                 estimated_delivery = datetime.utcnow() + timedelta(minutes=45)
             
+            created_at = datetime.utcnow()
+            timezone = restaurant.settings.timezone
+            bucket = get_local_bucket(created_at, timezone)
+            
             order_doc = {
                 "order_number": self.generate_order_number(),
                 "restaurant_id": to_object_id(restaurant.id),
@@ -415,70 +901,227 @@ class OrderService:
                 "is_delivery": order_data.is_delivery,
                 "estimated_delivery_time": estimated_delivery,
                 "notes": order_data.notes,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                "delivery_zone": order_data.delivery_zone,
+                "timezone": timezone,
+                "local_date": bucket["date"],
+                "local_hour": bucket["hour"],
+                "created_at": created_at,
+                "updated_at": created_at
             }
             
-            result = await self.collection.insert_one(order_doc)
+            order_doc["_id"] = ObjectId()
+            
+            # The order and its rollups commit together: no saved order ever answers an error
+            async def operation(session):
+                await self.collection.insert_one(dict(order_doc), session=session)
+                await self.rollup_service.record_order(order_doc, session=session)
             
-            order_doc["id"] = str(result.inserted_id)
-            order_doc["customer"] = CustomerInfo(**order_doc["customer"])
-            order_doc["items"] = [OrderItem(**item) for item in order_doc["items"]]
+            await with_transaction(operation)
             
-            return OrderResponse(**order_doc)
+            return self._to_response(order_doc)
             
         except Exception as e:
             logger.error(f"Error creating order: {e}")
             raise
 
+    async def update_order_status(self, order_id: str, new_status: OrderStatus, restaurant_slug: Optional[str] = None) -> bool:
+        """Update order status keeping the analytics rollups in sync"""
+        try:
+            query = {"_id": to_object_id(order_id)}
+            if restaurant_slug:
+                query["restaurant_slug"] = restaurant_slug
+            
+            now = datetime.utcnow()
+            update_dict = {"status": new_status, "updated_at": now}
+            if new_status == OrderStatus.DELIVERED:
+                update_dict["actual_delivery_time"] = now
+            
+            async def operation(session):
+                previous = await self.collection.find_one_and_update(
+                    query,
+                    {"$set": update_dict},
+                    return_document=ReturnDocument.BEFORE,
+                    session=session
+                )
+                if not previous:
+                    return None
+                
+                # Cancelled orders don't count in the rollups
+                was_cancelled = previous["status"] == OrderStatus.CANCELLED
+                is_cancelled = new_status == OrderStatus.CANCELLED
+                if was_cancelled != is_cancelled and "local_date" in previous:
+                    await self.rollup_service.record_order(previous, sign=-1 if is_cancelled else 1, session=session)
+                return previous
+            
+            previous = await with_transaction(operation)
+            if not previous:
+                return False
+            
+            if previous["status"] != new_status:
+                await self.notify_status_change(previous, new_status)
+            
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error updating order status: {e}")
+            return False
+
+    async def get_dashboard_analytics(self, restaurant_slug: str) -> DashboardAnalytics:
+        """Get today's dashboard analytics in the restaurant's local time"""
+        restaurant_service = RestaurantService()
+        restaurant = await restaurant_service.get_by_slug(restaurant_slug)
+        if not restaurant:
+            raise ValueError("Restaurant not found")
+        
+        today = get_local_bucket(datetime.utcnow(), restaurant.settings.timezone)["date"]
+        buckets = await self.rollup_service.get_buckets(restaurant_slug, today)
+        
+        products: Dict[str, int] = {}
+        for bucket in buckets:
+            for product_id, stats in bucket.get("products", {}).items():
+                products[product_id] = products.get(product_id, 0) + stats["quantity"]
+        
+        top_products = sorted(products.items(), key=lambda entry: entry[1], reverse=True)[:5]
+        names = {}
+        if top_products:
+            cursor = get_collection("products").find(
+                {"_id": {"$in": [ObjectId(product_id) for product_id, _ in top_products]}},
+                {"name": 1}
+            )
+            async for product in cursor:
+                names[str(product["_id"])] = product["name"]
+        
+        pending_orders = await self.collection.count_documents({
+            "restaurant_slug": restaurant_slug,
+            "status": OrderStatus.PENDING
+        })
+        
+        cursor = self.collection.find({"restaurant_slug": restaurant_slug}).sort("created_at", -1).limit(10)
+        recent_orders = [self._to_response(order) async for order in cursor]
+        
+        return DashboardAnalytics(
+            total_orders_today=sum(bucket["orders"] for bucket in buckets),
+            total_revenue_today=sum(bucket["revenue"] for bucket in buckets),
+            pending_orders=pending_orders,
+            popular_products=[
+                {"product_id": product_id, "name": names.get(product_id, ""), "quantity": quantity}
+                for product_id, quantity in top_products
+            ],
+            recent_orders=recent_orders,
+            hourly_orders=[
+                {"hour": bucket["hour"], "count": bucket["orders"], "revenue": bucket["revenue"]}
+                for bucket in buckets
+            ]
+        )
+
 class PushNotificationService:
-    def __init__(self):
+    def __init__(self, sender: Optional[WebPushSender] = None):
         self.subscriptions_collection = get_collection("push_subscriptions")
         self.notifications_collection = get_collection("push_notifications")
+        self.sender = sender
+        self.outbox = NotificationOutbox(sender)
+
+    async def upsert_subscription(self, subscription_data: PushSubscription) -> ObjectId:
+        """Create or refresh a subscription by endpoint and return its id"""
+        now = datetime.utcnow()
+        subscription = await self.subscriptions_collection.find_one_and_update(
+            {"endpoint": subscription_data.endpoint},
+            {
+                "$set": {
+                    "keys": subscription_data.keys,
+                    "user_agent": subscription_data.user_agent,
+                    "restaurant_slug": subscription_data.restaurant_slug,
+                    "topics": [topic.value for topic in subscription_data.topics],
+                    "updated_at": now
+                },
+                "$setOnInsert": {"created_at": now}
+            },
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return subscription["_id"]
+
+    async def add_topic(self, subscription_data: PushSubscription, restaurant_slug: str, topic: PushTopic) -> ObjectId:
+        """Add a topic to a device, creating it with only that topic if new; returns its id.
+
+        An existing device keeps its restaurant and the topics it chose.
+        """
+        now = datetime.utcnow()
+        subscription = await self.subscriptions_collection.find_one_and_update(
+            {"endpoint": subscription_data.endpoint},
+            {
+                "$set": {
+                    "keys": subscription_data.keys,
+                    "user_agent": subscription_data.user_agent,
+                    "updated_at": now
+                },
+                "$addToSet": {"topics": topic.value},
+                "$setOnInsert": {"restaurant_slug": restaurant_slug, "created_at": now}
+            },
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return subscription["_id"]
 
     async def subscribe(self, subscription_data: PushSubscription) -> bool:
-        """Subscribe a new device for push notifications"""
+        """Subscribe a device for push notifications (idempotent on endpoint)"""
         try:
-            # Check if already subscribed
-            existing = await self.subscriptions_collection.find_one({"endpoint": subscription_data.endpoint})
-            if existing:
-                logger.info(f"Already subscribed: {subscription_data.endpoint}")
-                return True
-            
-            subscription_doc = subscription_data.dict()
-            subscription_doc["created_at"] = datetime.utcnow()
-            
-            await self.subscriptions_collection.insert_one(subscription_doc)
-            logger.info(f"New subscription: {subscription_data.endpoint}")
+            await self.upsert_subscription(subscription_data)
+            logger.info(f"Subscribed: {subscription_data.endpoint}")
             return True
         except Exception as e:
             logger.error(f"Error subscribing: {e}")
             return False
 
-    async def send_notification(self, notification_data: PushNotificationCreate) -> bool:
-        """Send a push notification to all subscribers"""
+    async def send_notification(
+        self,
+        notification_data: PushNotificationCreate,
+        restaurant_slug: Optional[str] = None
+    ) -> Optional[str]:
+        """Queue a push notification for the topic subscribers and return the job id"""
         try:
             notification_doc = notification_data.dict()
+            notification_doc["restaurant_slug"] = restaurant_slug
             notification_doc["sent_at"] = datetime.utcnow()
             
-            await self.notifications_collection.insert_one(notification_doc)
+            audience = {"topics": notification_data.topic.value}
+            if restaurant_slug:
+                audience["restaurant_slug"] = restaurant_slug
             
-            # In a real app, you would use a web-push library here
-            # to send the notification to each subscriber.
-            # For now, we just log it.
+            payload = json.dumps(notification_data.dict()).encode()
+            job_id = await self.outbox.enqueue(
+                payload, notification_data.title, audience, restaurant_slug=restaurant_slug
+            )
             
-            subscribers = await self.subscriptions_collection.find().to_list(length=None)
-            logger.info(f"Sending notification '{notification_data.title}' to {len(subscribers)} subscribers.")
+            notification_doc["job_id"] = job_id
+            await self.notifications_collection.insert_one(notification_doc)
             
-            return True
+            if not self.sender:
+                logger.warning(f"Web Push not configured, notification '{notification_data.title}' queued but not delivered")
+            
+            return job_id
         except Exception as e:
             logger.error(f"Error sending notification: {e}")
-            return False
+            return None
+
+    async def get_job_status(self, job_id: str, restaurant_slug: Optional[str] = None) -> Optional[PushJobStatus]:
+        """Get delivery progress of a push job (restaurant_slug=None: any job, superadmin only)"""
+        try:
+            job = await self.outbox.get_job(job_id, restaurant_slug)
+            if not job:
+                return None
+            return PushJobStatus(**job)
+        except Exception as e:
+            logger.error(f"Error getting push job: {e}")
+            return None
 
-    async def get_sent_notifications(self) -> List[PushNotification]:
+    async def get_sent_notifications(self, restaurant_slug: Optional[str] = None) -> List[PushNotification]:
         """Get a list of previously sent notifications"""
         try:
-            cursor = self.notifications_collection.find().sort("sent_at", -1).limit(50)
+            query = {"restaurant_slug": restaurant_slug} if restaurant_slug else {}
+            cursor = self.notifications_collection.find(query).sort("sent_at", -1).limit(50)
             notifications = []
             async for doc in cursor:
                 notifications.append(PushNotification(**doc))
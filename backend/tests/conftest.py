@@ -7,11 +7,13 @@ from datetime import datetime
 
 from main import app
 from database import init_db, close_db, database
+from migrations import migrate
 from auth import AuthService
 
 @pytest_asyncio.fixture(scope="session", autouse=True)
 async def setup_database():
     await init_db()
+    await migrate(database.database)
     yield
     await close_db()
 
@@ -68,3 +70,37 @@ async def superadmin_token(async_client):
     response = await async_client.post("/auth/login", json=login_data)
     assert response.status_code == 200
     return response.json()["access_token"]
+
+@pytest_asyncio.fixture
+async def tenant(async_client, superadmin_token):
+    """A fresh restaurant with one category and product, and its admin's auth headers"""
+    from faker import Faker
+    fake = Faker()
+
+    slug = fake.unique.slug()
+    restaurant_data = {
+        "name": fake.company(),
+        "slug": slug,
+        "email": fake.unique.email(),
+        "phone": fake.phone_number(),
+        "address": fake.address(),
+        "admin_username": "admin",
+        "admin_password": "password123"
+    }
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.post("/superadmin/restaurants", json=restaurant_data, headers=headers)
+    assert response.status_code == 200
+
+    login_data = {"username": "admin", "password": "password123", "restaurant_slug": slug}
+    response = await async_client.post("/auth/login", json=login_data)
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = await async_client.post(f"/api/{slug}/categories", json={"name": "Lomitos"}, headers=headers)
+    assert response.status_code == 200
+    category_id = response.json()["id"]
+    product_data = {"name": "Lomito Completo", "description": "Con jamón, queso y huevo", "price": 9500.0, "category_id": category_id}
+    response = await async_client.post(f"/api/{slug}/products", json=product_data, headers=headers)
+    assert response.status_code == 200
+
+    return {"slug": slug, "headers": headers, "category_id": category_id, "product_id": response.json()["id"]}
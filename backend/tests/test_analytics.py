@@ -0,0 +1,69 @@
+import pytest
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from faker import Faker
+
+fake = Faker()
+
+@pytest.mark.asyncio
+async def test_dashboard_buckets_orders_in_local_time(async_client, superadmin_token):
+    # 1. Create a restaurant (default timezone is Córdoba, UTC-3)
+    restaurant_slug = fake.slug()
+    admin_username = fake.user_name()
+    restaurant_data = {
+        "name": fake.company(),
+        "slug": restaurant_slug,
+        "email": fake.email(),
+        "phone": fake.phone_number(),
+        "address": fake.address(),
+        "admin_username": admin_username,
+        "admin_password": "password123"
+    }
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.post("/superadmin/restaurants", json=restaurant_data, headers=headers)
+    assert response.status_code == 200
+
+    # 2. Place an order
+    order_data = {
+        "customer": {"name": fake.name(), "phone": fake.phone_number()},
+        "items": [
+            {
+                "product_id": "64b7f0a2c2a4e1a1b2c3d4e5",
+                "product_name": "Lomito",
+                "quantity": 2,
+                "unit_price": 1000.0,
+                "total_price": 2000.0
+            }
+        ],
+        "is_delivery": False
+    }
+    response = await async_client.post(f"/api/{restaurant_slug}/orders", json=order_data)
+    assert response.status_code == 200
+
+    # 3. The dashboard reports it in the restaurant's local hour
+    login_data = {"username": admin_username, "password": "password123", "restaurant_slug": restaurant_slug}
+    response = await async_client.post("/auth/login", json=login_data)
+    token = response.json()["access_token"]
+    response = await async_client.get(
+        f"/api/{restaurant_slug}/analytics/dashboard",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    analytics = response.json()
+    assert analytics["total_orders_today"] == 1
+    assert analytics["total_revenue_today"] == 2000.0
+
+    local_hour = datetime.now(timezone.utc).astimezone(ZoneInfo("America/Argentina/Cordoba")).hour
+    assert analytics["hourly_orders"][0]["hour"] == local_hour
+    assert analytics["popular_products"][0]["quantity"] == 2
+
+@pytest.mark.asyncio
+async def test_platform_analytics_sorted_by_revenue(async_client, superadmin_token):
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.get("/superadmin/analytics?period=month&sort_by=revenue", headers=headers)
+    assert response.status_code == 200
+    analytics = response.json()
+    assert analytics["period"] == "month"
+    assert analytics["total_orders"] >= len(analytics["top_tenants"])
+    revenues = [tenant["revenue"] for tenant in analytics["top_tenants"]]
+    assert revenues == sorted(revenues, reverse=True)
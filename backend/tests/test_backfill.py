@@ -0,0 +1,99 @@
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from backfill import BackfillRunner, backfill_order_rollups, backfill_restaurant_slug
+from database import database
+from memory_store import MemoryClient
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_after_a_failed_tenant():
+    db = MemoryClient()["test"]
+    restaurants = [{"_id": ObjectId(), "slug": f"r{index}"} for index in range(6)]
+    await db.restaurants.insert_many(restaurants)
+    await db.products.insert_many([
+        {"restaurant_id": restaurant["_id"], "name": f"p{index}"}
+        for restaurant in restaurants for index in range(7)
+    ])
+
+    dry_run = await BackfillRunner(db, "slug", backfill_restaurant_slug, dry_run=True).run()
+    assert dry_run["matched"] == 42
+    assert await db.products.count_documents({"restaurant_slug": {"$exists": True}}) == 0
+
+    async def flaky(runner, restaurant):
+        if restaurant["slug"] == "r3":
+            raise RuntimeError("boom")
+        await backfill_restaurant_slug(runner, restaurant)
+
+    first = await BackfillRunner(db, "slug", flaky, concurrency=1, batch_size=3).run()
+    assert first["status"] == "failed"
+    checkpoint = await db["_backfills"].find_one({"_id": "slug"})
+    assert checkpoint["after"] == restaurants[2]["_id"]
+
+    second = await BackfillRunner(db, "slug", backfill_restaurant_slug, concurrency=4, batch_size=3).run()
+    assert second["status"] == "completed"
+    assert second["tenants"] == 3
+    assert await db.products.count_documents({"restaurant_slug": {"$exists": False}}) == 0
+    assert await db.products.count_documents({"restaurant_slug": "r5"}) == 7
+
+@pytest.mark.asyncio
+async def test_checkpoint_never_moves_back_and_missing_lag_is_logged_once(caplog):
+    class Forbidden:
+        async def command(self, name):
+            raise OperationFailure("not authorized on admin to execute command", code=13)
+
+    db = MemoryClient()["test"]
+    runner = BackfillRunner(db, "slug", backfill_restaurant_slug, admin_db=Forbidden())
+    assert await runner.replication_lag() == 0.0
+    assert await runner.replication_lag() == 0.0
+    assert len([record for record in caplog.records if "not throttled" in record.message]) == 1
+
+    first, second = ObjectId(), ObjectId()
+    await runner._advance_checkpoint({second: True})
+    await runner._advance_checkpoint({first: True})  # A slower write landing late
+    checkpoint = await db["_backfills"].find_one({"_id": "slug"})
+    assert checkpoint["after"] == second
+
+@pytest.mark.asyncio
+async def test_order_rollups_are_rebuilt_from_existing_orders(monkeypatch):
+    client = MemoryClient()
+    db = client["test"]
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "database", db)
+
+    product_id = str(ObjectId())
+    await db.restaurants.insert_one({"_id": ObjectId(), "slug": "la-esquina", "settings": {"timezone": "UTC"}})
+    # Placed before rollups existed: no local_date, one of them cancelled
+    await db.orders.insert_many([
+        {
+            "restaurant_slug": "la-esquina",
+            "items": [{"product_id": product_id, "quantity": 2}, {"product_id": "promo", "quantity": 1}],
+            "total": total,
+            "status": status,
+            "created_at": created_at
+        }
+        for total, status, created_at in [
+            (1000.0, "delivered", datetime(2024, 3, 31, 21, 10)),
+            (500.0, "delivered", datetime(2024, 3, 31, 21, 50)),
+            (800.0, "cancelled", datetime(2024, 3, 31, 21, 55)),
+            (300.0, "pending", datetime(2024, 5, 2, 12, 0)),
+        ]
+    ])
+    await db.platform_rollups.insert_one({"period": "month", "key": "2024-03", "orders": 4, "revenue": 100.0})
+
+    report = await BackfillRunner(db, "order_rollups", backfill_order_rollups).run()
+    assert report["status"] == "completed"
+
+    bucket = await db.order_rollups.find_one({"restaurant_slug": "la-esquina", "date": "2024-03-31", "hour": 21})
+    assert (bucket["orders"], bucket["revenue"]) == (2, 1500.0)
+    assert bucket["products"] == {product_id: {"quantity": 4}}
+    assert await db.order_rollups.count_documents({"restaurant_slug": "la-esquina"}) == 2
+
+    months = await db.tenant_rollups.find({"period": "month"}).sort("key", 1).to_list(length=None)
+    assert [(month["key"], month["orders"], month["revenue"]) for month in months] == [
+        ("2024-03", 2, 1500.0), ("2024-05", 1, 300.0)
+    ]
+    # Another tenant's share of the platform totals is kept
+    platform = await db.platform_rollups.find_one({"period": "month", "key": "2024-03"})
+    assert (platform["orders"], platform["revenue"]) == (6, 1600.0)
@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from datetime import datetime
+
+from cache import InvalidationBus, LocalCache, SingleFlight, coalesced, tenant_invalidator
+from memory_store import MemoryClient
+
+def test_local_cache_tags_and_lru():
+    cache = LocalCache("test", ttl_seconds=60, max_entries=2)
+    cache.set("a", 1, tags=[("restaurant", "x")])
+    cache.set("b", 2, tags=[("restaurant", "y")])
+    assert cache.get("a") == 1
+    cache.set("c", 3, tags=[("restaurant", "x")])  # Evicts "b", the least recently used
+    assert cache.get("b") is None
+
+    cache.invalidate_tag(("restaurant", "x"))
+    assert cache.get("a") is None and cache.get("c") is None
+    assert cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_bus_falls_back_to_polling():
+    db = MemoryClient()["test"]
+    cache = LocalCache("tenants", ttl_seconds=600)
+    cache.set("pizza", "cached", tags=[("restaurant", "pizza")])
+    cache.set("sushi", "cached", tags=[("restaurant", "sushi")])
+
+    bus = InvalidationBus(db, poll_interval=0.01)
+    bus.subscribe("restaurants", tenant_invalidator(cache))
+    bus.start()
+    await asyncio.sleep(0.05)
+    assert bus.mode == "poll"
+
+    await db.restaurants.insert_one({"slug": "pizza", "updated_at": datetime.utcnow()})
+    await asyncio.sleep(0.05)
+    await bus.stop()
+
+    assert cache.get("pizza") is None
+    assert cache.get("sushi") == "cached"
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_catalog_reads():
+    flight = SingleFlight("test")
+
+    class Service:
+        queries = 0
+
+        @coalesced(flight)
+        async def get(self, slug: str, read_policy: str = "primary"):
+            Service.queries += 1
+            await asyncio.sleep(0.01)
+            return [slug]
+
+    service = Service()
+    results = await asyncio.gather(*[service.get("pizza", read_policy="catalog") for _ in range(50)])
+    assert Service.queries == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["shared"] == 49
+
+    await asyncio.gather(service.get("pizza"), service.get("pizza"))  # Primary reads are not shared
+    assert Service.queries == 3
+
+def test_fill_across_an_invalidation_is_not_kept():
+    cache = LocalCache("test", ttl_seconds=60)
+    tags = [("restaurant", "pizza")]
+    version = cache.version(tags)
+    cache.invalidate_tag(("restaurant", "pizza"))  # A write lands while the fill is loading
+    cache.set("pizza", "before the write", tags, version=version)
+    assert "pizza" not in cache
+
+    cache.set("pizza", "after the write", tags, version=cache.version(tags))
+    assert cache.get("pizza") == "after the write"
+
+@pytest.mark.asyncio
+async def test_tenant_cache_refills_from_the_primary(monkeypatch):
+    from database import database
+    from models import RestaurantUpdate
+    from services import RestaurantService
+
+    client = MemoryClient()
+    primary, secondary = client["test"], client["lagging"]
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "database", primary)
+    # Catalog reads would go to a secondary that has not seen the update yet
+    get_collection = primary.get_collection
+    monkeypatch.setattr(
+        primary, "get_collection",
+        lambda name, **kwargs: secondary[name] if "read_preference" in kwargs else get_collection(name)
+    )
+    restaurant = {
+        "slug": "pizza", "name": "Pizza Nostra", "email": "pizza@example.com", "phone": "351555",
+        "address": "Centro", "description": "", "logo": "", "city": "", "settings": {},
+        "is_active": True, "created_at": datetime.utcnow(), "updated_at": datetime.utcnow()
+    }
+    await primary.restaurants.insert_one(dict(restaurant))
+    await secondary.restaurants.insert_one(dict(restaurant))
+
+    service = RestaurantService()
+    assert (await service.get_by_slug("pizza", read_policy="catalog")).name == "Pizza Nostra"
+    assert await service.update_restaurant("pizza", RestaurantUpdate(name="Pizza Nostra II"))
+    assert (await service.get_by_slug("pizza", read_policy="catalog")).name == "Pizza Nostra II"
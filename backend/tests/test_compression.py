@@ -0,0 +1,46 @@
+import asyncio
+
+import brotli
+import httpx
+import pytest
+from fastapi import FastAPI
+from starlette.responses import Response
+
+from compression import CompressedBody, CompressionMiddleware, negotiate_encoding
+
+def test_negotiate_encoding():
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip, br;q=0") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding(None) is None
+
+@pytest.mark.asyncio
+async def test_cached_body_is_compressed_once_then_upgraded():
+    body = CompressedBody(b'{"name":"Muzzarella"}' * 200, "application/json")
+    response = body.response("br")
+    assert response.headers["content-encoding"] == "br"
+    first = body.variants["br"]
+    assert brotli.decompress(response.body) == body.body
+
+    await asyncio.sleep(0.2)  # Best-ratio recompression runs in a thread
+    assert body.variants["br"] is not first
+    assert body.response("br").body == body.variants["br"]
+    assert "content-encoding" not in body.response("identity").headers
+
+@pytest.mark.asyncio
+async def test_middleware_threshold():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/size/{size}")
+    async def sized(size: int):
+        return Response(b"a" * size, media_type="application/json")
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        small = await client.get("/size/10", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers
+        large = await client.get("/size/5000", headers={"Accept-Encoding": "gzip"})
+        assert large.headers["content-encoding"] == "gzip"
+        assert large.headers["vary"] == "Accept-Encoding"
+        assert int(large.headers["content-length"]) < 5000
+        assert large.content == b"a" * 5000
@@ -0,0 +1,132 @@
+import pytest
+import pyarrow.parquet as pq
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+from export_orders import OrdersExporter, flatten_order, load_watermark
+from memory_store import MemoryClient
+
+def make_order(slug: str, local_date: str, updated_at: datetime, **fields) -> dict:
+    order = {
+        "_id": ObjectId(),
+        "order_number": f"ORD-{ObjectId()}",
+        "restaurant_slug": slug,
+        "customer": {"name": "Ana", "phone": "351555"},
+        "items": [
+            {"product_id": "p1", "product_name": "Lomito", "quantity": 2, "unit_price": 1000.0, "total_price": 2000.0},
+            {
+                "product_id": "p2", "product_name": "Pizza", "quantity": 1, "unit_price": 1500.0, "total_price": 1500.0,
+                "customization": {"size": "grande", "toppings": ["jamón"], "special_instructions": "sin sal"}
+            }
+        ],
+        "subtotal": 3500.0,
+        "delivery_fee": 0.0,
+        "total": 3500.0,
+        "status": "pending",
+        "payment_method": "cash",
+        "is_delivery": False,
+        "local_date": local_date,
+        "local_hour": 21,
+        "created_at": updated_at,
+        "updated_at": updated_at
+    }
+    order.update(fields)
+    return order
+
+def exported_ids(output_dir) -> list:
+    return [
+        order_id
+        for path in sorted(output_dir.glob("orders/*/*/*.parquet"))
+        for order_id in pq.read_table(path).column("order_id").to_pylist()
+    ]
+
+def test_flatten_order_splits_items_and_drops_customer():
+    order = make_order("la-esquina", "2024-05-10", datetime(2024, 5, 11, 0, 30))
+    order_row, item_rows = flatten_order(order)
+
+    assert order_row["order_id"] == str(order["_id"])
+    assert order_row["local_date"] == "2024-05-10"
+    assert order_row["local_hour"] == 21
+    assert order_row["item_count"] == 2
+    assert "customer" not in order_row
+    assert [row["line"] for row in item_rows] == [0, 1]
+    assert item_rows[0]["size"] is None and item_rows[0]["toppings"] == []
+    assert item_rows[1]["size"] == "grande"
+    assert item_rows[1]["toppings"] == ["jamón"]
+    assert item_rows[1]["special_instructions"] == "sin sal"
+
+    # Orders from before local bucketing fall back to the UTC creation date
+    legacy = make_order("la-esquina", None, datetime(2024, 5, 11, 0, 30))
+    del legacy["local_hour"]
+    order_row, _ = flatten_order(legacy)
+    assert (order_row["local_date"], order_row["local_hour"]) == ("2024-05-11", 0)
+
+@pytest.mark.asyncio
+async def test_export_resumes_from_watermark(tmp_path):
+    db = MemoryClient()["test"]
+    base = datetime.utcnow() - timedelta(hours=1)
+    # Same updated_at on both sides of a flush: only the _id tiebreak keeps them apart
+    first = [make_order("a", "2024-05-10", base + timedelta(seconds=index // 2)) for index in range(5)]
+    await db.orders.insert_many(first)
+
+    assert await OrdersExporter(db, str(tmp_path), flush_rows=6).run() == 5
+    watermark = load_watermark(str(tmp_path))
+    assert (watermark["updated_at"], watermark["_id"]) == (first[-1]["updated_at"], first[-1]["_id"])
+
+    second = [make_order("a", "2024-05-10", first[-1]["updated_at"]) for _ in range(2)]
+    await db.orders.insert_many(second)
+    await db.orders.update_one(
+        {"_id": first[0]["_id"]},
+        {"$set": {"status": "delivered", "updated_at": base + timedelta(minutes=1)}}
+    )
+
+    assert await OrdersExporter(db, str(tmp_path), flush_rows=6).run() == 3
+    ids = exported_ids(tmp_path)
+    expected = [order["_id"] for order in first + second] + [first[0]["_id"]]
+    assert sorted(ids) == sorted(str(order_id) for order_id in expected)
+
+    # Nothing changed since: nothing exported
+    assert await OrdersExporter(db, str(tmp_path)).run() == 0
+
+@pytest.mark.asyncio
+async def test_export_leaves_recent_orders_for_the_next_run(tmp_path):
+    db = MemoryClient()["test"]
+    now = datetime.utcnow()
+    old = make_order("a", "2024-05-10", now - timedelta(minutes=10))
+    recent = make_order("a", "2024-05-10", now - timedelta(seconds=30))
+    await db.orders.insert_many([old, recent])
+
+    assert await OrdersExporter(db, str(tmp_path)).run() == 1
+    assert load_watermark(str(tmp_path))["_id"] == old["_id"]
+
+    # An order replicated late with an older updated_at is still ahead of the watermark
+    late = make_order("a", "2024-05-10", now - timedelta(minutes=2))
+    await db.orders.insert_one(late)
+    assert await OrdersExporter(db, str(tmp_path), safety_margin=timedelta(0)).run() == 2
+    assert sorted(exported_ids(tmp_path)) == sorted(str(order["_id"]) for order in (old, recent, late))
+
+@pytest.mark.asyncio
+async def test_export_partitions_by_restaurant_and_day(tmp_path):
+    db = MemoryClient()["test"]
+    updated_at = datetime.utcnow() - timedelta(minutes=10)
+    await db.orders.insert_many([
+        make_order("a", "2024-05-10", updated_at),
+        make_order("a", "2024-05-11", updated_at),
+        make_order("b", "2024-05-10", updated_at),
+    ])
+
+    await OrdersExporter(db, str(tmp_path)).run()
+
+    partitions = sorted(
+        str(path.parent.relative_to(tmp_path)) for path in tmp_path.glob("*/*/*/*.parquet")
+    )
+    assert partitions == [
+        "order_items/restaurant_slug=a/date=2024-05-10",
+        "order_items/restaurant_slug=a/date=2024-05-11",
+        "order_items/restaurant_slug=b/date=2024-05-10",
+        "orders/restaurant_slug=a/date=2024-05-10",
+        "orders/restaurant_slug=a/date=2024-05-11",
+        "orders/restaurant_slug=b/date=2024-05-10",
+    ]
+    items = pq.read_table(next(tmp_path.glob("order_items/restaurant_slug=b/*/*.parquet")))
+    assert items.column("product_name").to_pylist() == ["Lomito", "Pizza"]
@@ -0,0 +1,21 @@
+import pytest
+from bson import ObjectId
+
+from exceptions import InvalidFieldsException
+from fieldsets import parse_fields, projection, sparse_model
+from models import ProductResponse
+
+def test_sparse_product_fields():
+    fields = parse_fields(ProductResponse, "price, name,is_available")
+    assert fields == ("id", "name", "price", "is_available")  # Model order, id always included
+    assert projection(fields) == {"_id": 1, "name": 1, "price": 1, "is_available": 1}
+
+    model = sparse_model(ProductResponse, fields)
+    assert sparse_model(ProductResponse, fields) is model
+    oid = ObjectId()
+    product = model(**{"_id": oid, "name": "Muzza", "price": 1000, "is_available": True})
+    assert product.model_dump() == {"id": str(oid), "name": "Muzza", "price": 1000.0, "is_available": True}
+
+    assert parse_fields(ProductResponse, None) is None
+    with pytest.raises(InvalidFieldsException):
+        parse_fields(ProductResponse, "name,secret")
@@ -0,0 +1,47 @@
+import pytest
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from memory_store import MemoryClient
+
+@pytest.mark.asyncio
+async def test_memory_collection_queries_and_updates():
+    db = MemoryClient()["test"]
+    products = db.products
+    await products.create_indexes([IndexModel([("slug", ASCENDING), ("name", ASCENDING)], unique=True)])
+
+    await products.insert_many([
+        {"slug": "a", "name": "Muzzarella", "price": 10, "tags": ["veggie"]},
+        {"slug": "a", "name": "Napolitana", "price": 12, "tags": []},
+        {"slug": "b", "name": "Muzzarella", "price": 9},
+    ])
+    with pytest.raises(DuplicateKeyError):
+        await products.insert_one({"slug": "a", "name": "Muzzarella"})
+    with pytest.raises(BulkWriteError) as error:
+        await products.insert_many([{"slug": "c", "name": "x"}, {"slug": "a", "name": "Napolitana"}], ordered=False)
+    assert error.value.details["nInserted"] == 1
+
+    names = [doc["name"] async for doc in products.find({"slug": "a"}, {"name": 1}).sort("price", -1)]
+    assert names == ["Napolitana", "Muzzarella"]
+    assert await products.count_documents({"tags": "veggie"}) == 1
+    assert await products.count_documents({"name": {"$regex": "muzz", "$options": "i"}, "price": {"$gte": 10}}) == 1
+    assert await products.count_documents({"$or": [{"slug": "b"}, {"price": {"$lt": 11}}]}) == 2
+
+    before = await products.find_one_and_update(
+        {"slug": "a", "name": "Muzzarella"}, {"$inc": {"price": 1}, "$addToSet": {"tags": "popular"}}
+    )
+    assert before["price"] == 10
+    after = await products.find_one_and_update(
+        {"slug": "z", "name": "Fugazzeta"},
+        {"$set": {"price": 15}, "$setOnInsert": {"tags": []}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    assert after["slug"] == "z" and after["price"] == 15 and after["tags"] == []
+
+    result = await products.bulk_write([
+        UpdateOne({"slug": "a", "name": "Muzzarella"}, {"$set": {"price": 20}}),
+        UpdateOne({"slug": "y", "name": "Calabresa"}, {"$set": {"price": 14}}, upsert=True),
+    ])
+    assert list(result.upserted_ids) == [1]
+    assert (await products.find_one({"slug": "a", "name": "Muzzarella"}))["tags"] == ["veggie", "popular"]
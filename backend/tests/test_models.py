@@ -0,0 +1,20 @@
+import pytest
+from bson import ObjectId
+from pydantic import ValidationError
+
+from models import Category, CategoryResponse
+
+def test_object_id_fields():
+    oid = ObjectId()
+    category = Category(name="Pizzas", restaurant_id=str(oid), restaurant_slug="pizza")
+    assert category.restaurant_id == oid
+    assert category.model_dump()["restaurant_id"] == oid  # Stays an ObjectId for MongoDB
+    assert f'"restaurant_id":"{oid}"' in category.model_dump_json()
+
+    with pytest.raises(ValidationError):
+        Category(name="Pizzas", restaurant_id="not-an-id", restaurant_slug="pizza")
+
+    # Responses validate straight from a document
+    response = CategoryResponse(**{"_id": oid, "name": "Pizzas", "icon": "", "description": None,
+                                   "display_order": 1, "is_active": True})
+    assert response.id == str(oid)
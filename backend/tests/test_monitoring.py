@@ -0,0 +1,105 @@
+import pytest
+
+@pytest.mark.asyncio
+async def test_pool_metrics(async_client, superadmin_token):
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.get("/superadmin/db/pool", headers=headers)
+    assert response.status_code == 200
+    pool = response.json()
+    assert pool["checkouts"] > 0
+    assert pool["open"] >= pool["in_use"]
+    assert pool["checkout_wait_seconds"]["count"] > 0
+
+@pytest.mark.asyncio
+async def test_query_metrics_with_explain(async_client, superadmin_token, tenant):
+    await async_client.get(f"/api/{tenant['slug']}/products?search=lomito")
+
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.get("/superadmin/db/queries?limit=100&explain=true", headers=headers)
+    assert response.status_code == 200
+    queries = response.json()
+    search = next(
+        query for query in queries
+        if query["collection"] == "products" and "$regex" in query["shape"]
+    )
+    assert '"?"' in search["shape"] and "lomito" not in search["shape"]
+    assert "collscan" in search["explain"]
+
+@pytest.mark.asyncio
+async def test_metrics_exposition(async_client, tenant):
+    await async_client.get(f"/api/{tenant['slug']}/menu")
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    assert f'route="/api/{{slug}}/menu",tenant="{tenant["slug"]}",status="2xx"' in response.text
+    assert "event_loop_lag_seconds_count" in response.text
+
+@pytest.mark.asyncio
+async def test_health_checks_database(async_client):
+    response = await async_client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["database"] == "connected"
+
+def test_tenant_label_cap():
+    from monitoring import RequestMetrics
+    metrics = RequestMetrics(max_tenants=1, is_tenant=lambda slug: slug in ("pizza", "sushi"))
+    metrics.observe("GET", "/api/{slug}/menu", "made-up", 404, 0.01)
+    metrics.observe("POST", "/api/{slug}/orders", "made-up-too", 422, 0.01)
+    metrics.observe("GET", "/api/{slug}/menu", "pizza", 200, 0.01)
+    metrics.observe("GET", "/api/{slug}/menu", "sushi", 200, 0.01)
+    assert sorted(key[2] for key in metrics.stats) == ["_other", "_other", "pizza"]
+
+@pytest.mark.asyncio
+async def test_profile_single_request(async_client, superadmin_token, tenant):
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.get(f"/api/{tenant['slug']}/menu", headers={**headers, "X-Profile": "1"})
+    assert response.status_code in (200, 429)  # 429 once the global limit is reached
+    if response.status_code == 429:
+        return
+
+    profile_id = response.headers["X-Profile-Id"]
+    response = await async_client.get(f"/superadmin/profiles/{profile_id}", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/octet-stream"
+
+    response = await async_client.get(f"/superadmin/profiles/{profile_id}?format=text", headers=headers)
+    assert "cumulative" in response.text
+
+@pytest.mark.asyncio
+async def test_known_tenants_follow_the_invalidation_bus():
+    import asyncio
+    from cache import InvalidationEvent
+    from memory_store import MemoryClient
+    from monitoring import KnownTenants
+
+    db = MemoryClient()["test"]
+    await db.restaurants.insert_many([{"slug": "pizza"}, {"slug": "sushi"}])
+    tenants = KnownTenants()
+    await tenants.load(db)
+    assert "pizza" in tenants and "made-up" not in tenants
+
+    tenants.handle(InvalidationEvent("restaurants", "insert", restaurant_slug="tacos"))
+    assert "tacos" in tenants
+
+    await db.restaurants.insert_one({"slug": "ramen"})  # Missed while the stream was down
+    tenants.handle(InvalidationEvent("restaurants", "reset"))
+    await asyncio.sleep(0)
+    assert "ramen" in tenants
+
+@pytest.mark.asyncio
+async def test_profiling_slots_are_reserved_atomically(monkeypatch):
+    import asyncio
+    from config import settings
+    from database import database
+    from memory_store import MemoryClient
+    from profiling import ProfilingMiddleware
+
+    client = MemoryClient()
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "database", client["test"])
+    monkeypatch.setattr(settings, "profiling_max_per_window", 2)
+    monkeypatch.setattr(settings, "profiling_window_seconds", 3600)
+
+    # One middleware per worker, all asking at once
+    workers = [ProfilingMiddleware(app=None) for _ in range(5)]
+    granted = await asyncio.gather(*[worker.reserve() for worker in workers])
+    assert sorted(granted) == [False, False, False, True, True]
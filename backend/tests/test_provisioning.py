@@ -0,0 +1,43 @@
+import pytest
+from faker import Faker
+
+fake = Faker()
+
+def restaurant_payload(slug: str) -> dict:
+    return {
+        "name": fake.company(),
+        "slug": slug,
+        "email": fake.unique.email(),
+        "phone": fake.phone_number(),
+        "address": fake.address(),
+        "admin_username": "admin",
+        "admin_password": "password123"
+    }
+
+@pytest.mark.asyncio
+async def test_bulk_provisioning(async_client, superadmin_token):
+    slugs = [fake.unique.slug() for _ in range(3)]
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    payload = [restaurant_payload(slug) for slug in slugs] + [restaurant_payload(slugs[0])]
+
+    response = await async_client.post("/superadmin/restaurants/bulk", json=payload, headers=headers)
+    assert response.status_code == 200
+    statuses = sorted(result["status"] for result in response.json()["results"])
+    assert statuses == ["created", "created", "created", "exists"]
+
+    # A new slug whose email another tenant already uses is a conflict on that field
+    taken_email = {**restaurant_payload(fake.unique.slug()), "email": payload[1]["email"]}
+    response = await async_client.post("/superadmin/restaurants/bulk", json=[taken_email], headers=headers)
+    assert response.json()["results"] == [{"slug": taken_email["slug"], "status": "conflict", "field": "email"}]
+
+    # Each tenant gets its admin user and default categories
+    for slug in slugs:
+        response = await async_client.get(f"/api/{slug}/categories")
+        assert len(response.json()) == 4
+        login_data = {"username": "admin", "password": "password123", "restaurant_slug": slug}
+        response = await async_client.post("/auth/login", json=login_data)
+        assert response.status_code == 200
+
+    # Creating an existing slug one at a time is a conflict, not a server error
+    response = await async_client.post("/superadmin/restaurants", json=restaurant_payload(slugs[1]), headers=headers)
+    assert response.status_code == 409
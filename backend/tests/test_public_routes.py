@@ -27,6 +27,10 @@ async def test_public_endpoints_flow(async_client, superadmin_token):
     lomitos_menu = response.json()
     assert len(lomitos_menu) > 0
     assert all(item["category_id"] for item in lomitos_menu)
+    assert all(item["category_key"] == "lomitos" for item in lomitos_menu)
+
+    response = await async_client.get(f"/api/{restaurant_slug}/menu/category/no-existe")
+    assert response.status_code == 404
 
     # 4. Test GET /api/{slug}/delivery-zones
     response = await async_client.get(f"/api/{restaurant_slug}/delivery-zones")
@@ -75,3 +79,14 @@ async def test_public_endpoints_flow(async_client, superadmin_token):
     fetched_order = response.json()
     assert fetched_order["order_number"] == created_order["order_number"]
     assert fetched_order["customer"]["phone"] == order_data["customer"]["phone"]
+
+@pytest.mark.asyncio
+async def test_deleted_category_serves_no_products(async_client, tenant):
+    slug = tenant["slug"]
+    response = await async_client.get(f"/api/{slug}/menu/category/lomitos")
+    assert [product["id"] for product in response.json()] == [tenant["product_id"]]
+
+    response = await async_client.delete(f"/api/{slug}/categories/{tenant['category_id']}", headers=tenant["headers"])
+    assert response.status_code == 200
+    response = await async_client.get(f"/api/{slug}/menu/category/lomitos")
+    assert response.status_code == 404
@@ -0,0 +1,114 @@
+import pytest
+
+@pytest.mark.asyncio
+async def test_send_returns_job_and_status(async_client, superadmin_token):
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    notification = {"title": "Promo 2x1", "body": "Solo por hoy"}
+    response = await async_client.post("/admin/push/send", json=notification, headers=headers)
+    assert response.status_code == 200
+    job_id = response.json()["job_id"]
+
+    response = await async_client.get(f"/admin/push/jobs/{job_id}", headers=headers)
+    assert response.status_code == 200
+    job = response.json()
+    assert job["title"] == "Promo 2x1"
+    assert job["status"] in ("queued", "expanding", "sending", "completed")
+
+    response = await async_client.get("/admin/push/jobs/not-a-job", headers=headers)
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_subscribe_is_idempotent_per_endpoint(async_client):
+    subscription = {
+        "endpoint": "https://push.example.com/send/duo-previa-device",
+        "keys": {"p256dh": "key", "auth": "secret"},
+        "restaurant_slug": "duo-previa",
+        "topics": ["order_updates"]
+    }
+    for _ in range(2):
+        response = await async_client.post("/push/subscribe", json=subscription)
+        assert response.status_code == 200
+
+    from database import database
+    count = await database.database.push_subscriptions.count_documents({"endpoint": subscription["endpoint"]})
+    assert count == 1
+
+@pytest.mark.asyncio
+async def test_order_status_change_queues_push(async_client, superadmin_token):
+    from faker import Faker
+    from database import database
+    fake = Faker()
+
+    restaurant_slug = fake.slug()
+    admin_username = fake.user_name()
+    restaurant_data = {
+        "name": fake.company(),
+        "slug": restaurant_slug,
+        "email": fake.email(),
+        "phone": fake.phone_number(),
+        "address": fake.address(),
+        "admin_username": admin_username,
+        "admin_password": "password123"
+    }
+    headers = {"Authorization": f"Bearer {superadmin_token}"}
+    response = await async_client.post("/superadmin/restaurants", json=restaurant_data, headers=headers)
+    assert response.status_code == 200
+
+    order_data = {
+        "customer": {"name": fake.name(), "phone": fake.phone_number()},
+        "items": [{"product_id": "p1", "product_name": "Lomito", "quantity": 1, "unit_price": 10.0, "total_price": 10.0}]
+    }
+    response = await async_client.post(f"/api/{restaurant_slug}/orders", json=order_data)
+    order = response.json()
+
+    subscription = {"endpoint": f"https://push.example.com/send/{order['id']}", "keys": {"p256dh": "key", "auth": "secret"}}
+    response = await async_client.post(f"/api/{restaurant_slug}/orders/{order['id']}/push", json=subscription)
+    assert response.status_code == 200
+
+    login_data = {"username": admin_username, "password": "password123", "restaurant_slug": restaurant_slug}
+    response = await async_client.post("/auth/login", json=login_data)
+    admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await async_client.put(
+        f"/api/{restaurant_slug}/orders/{order['id']}/status",
+        json={"status": "confirmed"},
+        headers=admin_headers
+    )
+    assert response.status_code == 200
+
+    job = await database.database.push_jobs.find_one({"title": f"{order['order_number']}: confirmed"})
+    assert job is not None
+    assert job["urgency"] == "high"
+
+@pytest.mark.asyncio
+async def test_re_claimed_delivery_is_counted_once(monkeypatch):
+    from bson import ObjectId
+    from database import database
+    from memory_store import MemoryClient
+    from outbox import NotificationOutbox
+
+    client = MemoryClient()
+    monkeypatch.setattr(database, "client", client)
+    monkeypatch.setattr(database, "database", client["test"])
+    await database.database.push_subscriptions.insert_many([
+        {"endpoint": f"https://push.example.com/send/{device}", "keys": {}} for device in ("slow", "fast")
+    ])
+
+    class Sender:
+        concurrency = 2
+
+        async def send(self, delivery, payload, urgency):
+            if delivery["endpoint"].endswith("slow"):
+                # The lease ran out mid-send and another worker claimed the delivery
+                await database.database.push_deliveries.update_one(
+                    {"_id": delivery["_id"]}, {"$set": {"lock": ObjectId()}}
+                )
+            return 201
+
+    outbox = NotificationOutbox(Sender())
+    job_id = await outbox.enqueue(b"{}", "Promo")
+    assert await outbox.expand_next_job()
+    assert await outbox.process_due() == 2
+
+    job = await outbox.get_job(job_id)
+    assert (job["sent"], job["pending"]) == (1, 1)
+    assert job["status"] == "sending"
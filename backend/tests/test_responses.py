@@ -0,0 +1,42 @@
+import httpx
+import msgpack
+import pytest
+from fastapi import FastAPI
+
+from models import CustomerInfo
+from responses import JSON, MSGPACK, CodecMiddleware, ModelResponse, negotiate
+
+def test_negotiate():
+    assert negotiate(None) is JSON
+    assert negotiate("*/*") is JSON
+    assert negotiate("application/msgpack") is MSGPACK
+    assert negotiate("application/json;q=0.5, application/msgpack") is MSGPACK
+    assert negotiate("application/msgpack;q=0.2, application/json") is JSON
+
+@pytest.mark.asyncio
+async def test_msgpack_request_and_response():
+    app = FastAPI()
+    app.add_middleware(CodecMiddleware)
+
+    @app.post("/echo")
+    async def echo(customer: CustomerInfo):
+        return ModelResponse(customer)
+
+    customer = {"name": "Ana", "phone": "3510000000", "address": "Calle 1"}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/echo",
+            content=msgpack.packb(customer),
+            headers={"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert response.headers["vary"] == "Accept"
+        assert msgpack.unpackb(response.content)["name"] == "Ana"
+
+        response = await client.post("/echo", json=customer)
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["address"] == "Calle 1"
+
+        response = await client.post("/echo", content=b"\xc1", headers={"Content-Type": "application/msgpack"})
+        assert response.status_code == 400
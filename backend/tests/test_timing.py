@@ -0,0 +1,27 @@
+import pytest
+
+from timing import Timings, _current, span, timed
+
+@pytest.mark.asyncio
+async def test_spans_add_up_into_header():
+    @timed("db")
+    async def query():
+        return 1
+
+    with span("render"):  # Timing off: nothing to record into
+        pass
+
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        await query()
+        await query()
+        with span("render"):
+            pass
+    finally:
+        _current.reset(token)
+
+    header = timings.header(0.005)
+    assert header.startswith('db;dur=')
+    assert 'desc="2 calls"' in header
+    assert "render;dur=" in header and header.endswith("total;dur=5.00")
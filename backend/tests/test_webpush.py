@@ -0,0 +1,75 @@
+import pytest
+import struct
+import jwt
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from webpush import MAX_PAYLOAD_SIZE, UNDELIVERABLE, WebPushSender, b64url_encode, _hkdf
+
+def make_subscriber(endpoint: str):
+    """Browser side of a subscription: keys to hand to the server and to decrypt with"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    public_key = private_key.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    auth_secret = b"0123456789abcdef"
+    subscription = {
+        "endpoint": endpoint,
+        "keys": {"p256dh": b64url_encode(public_key), "auth": b64url_encode(auth_secret)}
+    }
+    return subscription, private_key, public_key, auth_secret
+
+def decrypt(body: bytes, private_key, public_key: bytes, auth_secret: bytes) -> bytes:
+    salt = body[:16]
+    key_length = struct.unpack("!B", body[20:21])[0]
+    as_public = body[21:21 + key_length]
+    ciphertext = body[21 + key_length:]
+
+    as_key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), as_public)
+    ecdh_secret = private_key.exchange(ec.ECDH(), as_key)
+    ikm = _hkdf(auth_secret, b"WebPush: info\x00" + public_key + as_public, ecdh_secret, 32)
+    cek = _hkdf(salt, b"Content-Encoding: aes128gcm\x00", ikm, 16)
+    nonce = _hkdf(salt, b"Content-Encoding: nonce\x00", ikm, 12)
+    return AESGCM(cek).decrypt(nonce, ciphertext, None).rstrip(b"\x02")
+
+@pytest.mark.asyncio
+async def test_send_to_stub_push_service():
+    vapid_key = ec.generate_private_key(ec.SECP256R1())
+    vapid_pem = vapid_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+    received = []
+
+    async def push_endpoint(request):
+        if request.path_params["device"] == "gone":
+            return Response(status_code=410)
+        token = request.headers["authorization"].split("t=")[1].split(",")[0]
+        claims = jwt.decode(token, vapid_key.public_key(), algorithms=["ES256"], audience="http://push.test")
+        assert claims["sub"] == "mailto:test@example.com"
+        assert request.headers["content-encoding"] == "aes128gcm"
+        received.append(await request.body())
+        return Response(status_code=201)
+
+    stub = Starlette(routes=[Route("/push/{device}", push_endpoint, methods=["POST"])])
+
+    live, private_key, public_key, auth_secret = make_subscriber("http://push.test/push/live")
+    gone, *_ = make_subscriber("http://push.test/push/gone")
+
+    async with httpx.AsyncClient(app=stub) as client:
+        sender = WebPushSender(vapid_pem, "mailto:test@example.com", concurrency=2, client=client)
+        assert await sender.send(live, b'{"title": "Promo"}') == 201
+        assert await sender.send(gone, b'{"title": "Promo"}') == 410
+
+        # Never reach the push service: the outbox fails these instead of retrying
+        assert await sender.send(live, b"x" * (MAX_PAYLOAD_SIZE + 1)) == UNDELIVERABLE
+        assert await sender.send({**live, "keys": {"p256dh": "bad", "auth": "bad"}}, b"{}") == UNDELIVERABLE
+        assert await sender.send({"endpoint": live["endpoint"], "keys": {}}, b"{}") == UNDELIVERABLE
+
+    assert len(received) == 1
+    assert decrypt(received[0], private_key, public_key, auth_secret) == b'{"title": "Promo"}'
@@ -0,0 +1,146 @@
+# webpush.py
+"""Web Push delivery: VAPID (RFC 8292) + aes128gcm payload encryption (RFC 8291)."""
+import base64
+import logging
+import os
+import struct
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+import jwt
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+logger = logging.getLogger(__name__)
+
+RECORD_SIZE = 4096
+# One record: plaintext + 0x02 delimiter + 16 byte GCM tag must fit in RECORD_SIZE
+MAX_PAYLOAD_SIZE = RECORD_SIZE - 86 - 17
+VAPID_TOKEN_LIFETIME = 12 * 60 * 60
+
+NETWORK_ERROR = 0  # Transient: worth retrying
+UNDELIVERABLE = -1  # Payload too large or malformed subscription keys: retrying can't help
+
+def b64url_decode(value: str) -> bytes:
+    """Decode unpadded base64url"""
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+def b64url_encode(value: bytes) -> str:
+    """Encode to unpadded base64url"""
+    return base64.urlsafe_b64encode(value).rstrip(b"=").decode("ascii")
+
+def _hkdf(salt: bytes, info: bytes, ikm: bytes, length: int) -> bytes:
+    return HKDF(algorithm=hashes.SHA256(), length=length, salt=salt, info=info).derive(ikm)
+
+def encrypt_payload(payload: bytes, p256dh: str, auth: str) -> bytes:
+    """Encrypt a payload for a subscription (single aes128gcm record)"""
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Push payload too large ({len(payload)} > {MAX_PAYLOAD_SIZE} bytes)")
+
+    ua_public = b64url_decode(p256dh)
+    auth_secret = b64url_decode(auth)
+
+    as_private = ec.generate_private_key(ec.SECP256R1())
+    as_public = as_private.public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    ua_key = ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), ua_public)
+    ecdh_secret = as_private.exchange(ec.ECDH(), ua_key)
+
+    ikm = _hkdf(auth_secret, b"WebPush: info\x00" + ua_public + as_public, ecdh_secret, 32)
+    salt = os.urandom(16)
+    cek = _hkdf(salt, b"Content-Encoding: aes128gcm\x00", ikm, 16)
+    nonce = _hkdf(salt, b"Content-Encoding: nonce\x00", ikm, 12)
+
+    ciphertext = AESGCM(cek).encrypt(nonce, payload + b"\x02", None)
+    header = salt + struct.pack("!IB", RECORD_SIZE, len(as_public)) + as_public
+    return header + ciphertext
+
+def load_vapid_key(value: str) -> ec.EllipticCurvePrivateKey:
+    """Load a VAPID private key from PEM or a base64url raw scalar"""
+    if value.lstrip().startswith("-----BEGIN"):
+        return serialization.load_pem_private_key(value.encode(), password=None)
+    return ec.derive_private_key(int.from_bytes(b64url_decode(value), "big"), ec.SECP256R1())
+
+class VapidSigner:
+    """Signs VAPID tokens, cached per push service origin"""
+
+    def __init__(self, private_key: str, subject: str):
+        self.private_key = load_vapid_key(private_key)
+        self.subject = subject
+        self.public_key = b64url_encode(self.private_key.public_key().public_bytes(
+            serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+        ))
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+
+    def authorization(self, endpoint: str) -> str:
+        """Authorization header value for an endpoint"""
+        url = urlparse(endpoint)
+        audience = f"{url.scheme}://{url.netloc}"
+        now = time.time()
+
+        cached = self._tokens.get(audience)
+        if cached and cached[1] - now > 60:
+            token = cached[0]
+        else:
+            expires = now + VAPID_TOKEN_LIFETIME
+            token = jwt.encode(
+                {"aud": audience, "exp": int(expires), "sub": self.subject},
+                self.private_key,
+                algorithm="ES256"
+            )
+            self._tokens[audience] = (token, expires)
+
+        return f"vapid t={token}, k={self.public_key}"
+
+class WebPushSender:
+    """Delivers push messages through a pooled HTTP client with bounded concurrency"""
+
+    def __init__(
+        self,
+        vapid_private_key: str,
+        vapid_subject: str,
+        concurrency: int = 100,
+        ttl: int = 86400,
+        timeout: float = 10.0,
+        client: Optional[httpx.AsyncClient] = None
+    ):
+        self.signer = VapidSigner(vapid_private_key, vapid_subject)
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        )
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def send(self, subscription: dict, payload: bytes, urgency: str = "normal") -> int:
+        """Send one message; returns the HTTP status, NETWORK_ERROR or UNDELIVERABLE"""
+        endpoint = subscription["endpoint"]
+        try:
+            body = encrypt_payload(payload, subscription["keys"]["p256dh"], subscription["keys"]["auth"])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Push message for {endpoint} can't be delivered: {e}")
+            return UNDELIVERABLE
+        try:
+            response = await self.client.post(
+                endpoint,
+                content=body,
+                headers={
+                    "Authorization": self.signer.authorization(endpoint),
+                    "Content-Encoding": "aes128gcm",
+                    "Content-Type": "application/octet-stream",
+                    "TTL": str(self.ttl),
+                    "Urgency": urgency
+                }
+            )
+            return response.status_code
+        except httpx.HTTPError as e:
+            logger.warning(f"Push delivery to {endpoint} failed: {e}")
+            return NETWORK_ERROR